@@ -1,12 +1,15 @@
 # SPDX-License-Identifier: AGPL-3.0-only
-# origin_conversation MCP server - dual transport: stdio (default) and SSE.
-"""Run MCP server over stdio or SSE (for varying Sanctum box configs)."""
+# origin_conversation MCP server - transports: stdio (default), SSE and stateless HTTP.
+"""Run MCP server over stdio, SSE or stateless streamable HTTP (for varying Sanctum box configs)."""
 import argparse
 import asyncio
 import logging
 import os
 import signal
 import sys
+import time
+
+_STARTED = time.perf_counter()
 
 # Minimal logging to stderr so stdout stays clean for JSON-RPC in stdio mode
 logging.basicConfig(
@@ -34,57 +37,118 @@ def _parse_args() -> argparse.Namespace:
 Transport:
   Default (no --sse)     STDIO for Letta/Cursor local process configs.
   --sse                 SSE over HTTP for remote or shared Sanctum boxes.
+  --http                Stateless streamable HTTP (POST /mcp); scales with --workers.
 
 Examples:
   python -m origin_conversation_mcp
   python -m origin_conversation_mcp --sse
   python -m origin_conversation_mcp --sse --port 9000 --host 127.0.0.1
   python -m origin_conversation_mcp --sse --allow-external
+  python -m origin_conversation_mcp --http --workers 4
+  python -m origin_conversation_mcp --in-memory
+
+Offline:
+  python -m origin_conversation_mcp optimize export.db export.opt.db
+                        Write a copy tuned for search (see optimize --help).
         """,
     )
-    parser.add_argument(
+    transport = parser.add_mutually_exclusive_group()
+    transport.add_argument(
         "--sse",
         action="store_true",
         help="Use SSE transport (HTTP). Default is STDIO.",
     )
+    transport.add_argument(
+        "--http",
+        action="store_true",
+        help="Use stateless streamable HTTP transport (POST /mcp), servable by several worker processes.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=_env_port("MCP_HTTP_WORKERS", 1),
+        help="Worker processes for --http (default: 1 or MCP_HTTP_WORKERS)",
+    )
     parser.add_argument(
         "--port",
         type=int,
         default=_env_port("MCP_PORT", 8000),
-        help="Port for SSE (default: 8000 or MCP_PORT)",
+        help="Port for SSE / HTTP (default: 8000 or MCP_PORT)",
     )
     parser.add_argument(
         "--host",
         type=str,
         default=os.environ.get("MCP_HOST", "127.0.0.1"),
-        help="Host for SSE (default: 127.0.0.1 or MCP_HOST)",
+        help="Host for SSE / HTTP (default: 127.0.0.1 or MCP_HOST)",
     )
     parser.add_argument(
         "--allow-external",
         action="store_true",
-        help="Bind SSE to 0.0.0.0 (allow external connections).",
+        help="Bind SSE / HTTP to 0.0.0.0 (allow external connections).",
+    )
+    parser.add_argument(
+        "--in-memory",
+        action="store_true",
+        help="Load the DB into in-memory columnar arrays at startup and serve newest-first searches "
+        "from them (substring mode, and text mode without a query; text queries keep relevance "
+        "ranking). Needs numpy. Same as CONVERSATION_IN_MEMORY=1.",
+    )
+    parser.add_argument(
+        "--search-workers",
+        type=int,
+        default=None,
+        help="Worker threads for searches (default: CONVERSATION_SEARCH_WORKERS or min(4, CPUs))",
+    )
+    parser.add_argument(
+        "--search-queue",
+        type=int,
+        default=None,
+        help="Searches allowed to wait for a worker before new ones are rejected "
+        "(default: CONVERSATION_SEARCH_QUEUE or 32)",
     )
     return parser.parse_args()
 
 
-async def _run_stdio() -> None:
+async def _run_stdio(args: argparse.Namespace) -> None:
     from mcp.server.stdio import stdio_server
 
+    from .executor import SearchExecutor
     from .server import create_server, register_tools
 
     server = create_server()
-    register_tools(server)
-    async with stdio_server() as (read_stream, write_stream):
-        await server.run(read_stream, write_stream, server.create_initialization_options())
+    register_tools(server, SearchExecutor(args.search_workers, args.search_queue))
+    _observe_server_init()
+    try:
+        async with stdio_server() as (read_stream, write_stream):
+            await server.run(read_stream, write_stream, server.create_initialization_options())
+    finally:
+        _dump_metrics()
+
+
+def _observe_server_init() -> None:
+    """Record the time from process start to a server ready to answer the handshake."""
+    from . import metrics
+
+    metrics.STARTUP_SECONDS.labels("server_init").observe(time.perf_counter() - _STARTED)
+
+
+def _dump_metrics() -> None:
+    """Write the search metrics summary to stderr (stdio mode has no /metrics route)."""
+    from . import metrics
+
+    summary = metrics.registry.summary()
+    if summary:
+        print("origin-conversation metrics:\n" + summary, file=sys.stderr, flush=True)
 
 
 async def _run_sse(args: argparse.Namespace) -> None:
     from mcp.server.sse import SseServerTransport
     from starlette.applications import Starlette
     from starlette.requests import Request
-    from starlette.responses import Response
+    from starlette.responses import JSONResponse, Response
     from starlette.routing import Mount, Route
 
+    from .executor import SearchExecutor
     from .server import create_server, register_tools
 
     host = "0.0.0.0" if args.allow_external else args.host
@@ -94,7 +158,7 @@ async def _run_sse(args: argparse.Namespace) -> None:
         logger.info("SSE bound to localhost only. Use --allow-external for network access.")
 
     server = create_server()
-    register_tools(server)
+    register_tools(server, SearchExecutor(args.search_workers, args.search_queue))
     sse_transport = SseServerTransport("/messages/")
 
     # MCP SSE transport requires ASGI send; Starlette does not expose it publicly.
@@ -118,8 +182,24 @@ async def _run_sse(args: argparse.Namespace) -> None:
             media_type="text/plain",
         )
 
+    async def metrics_endpoint(request: Request):
+        from . import metrics
+
+        return Response(
+            metrics.registry.render(),
+            media_type="text/plain; version=0.0.4; charset=utf-8",
+        )
+
+    async def ready_endpoint(request: Request):
+        from . import warmup
+
+        state = warmup.status()
+        return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
     app = Starlette(
         routes=[
+            Route("/metrics", metrics_endpoint, methods=["GET"]),
+            Route("/ready", ready_endpoint, methods=["GET"]),
             Route("/sse", sse_endpoint, methods=["GET"]),
             Route("/sse", sse_post_endpoint, methods=["POST"]),
             Mount("/messages/", app=sse_transport.handle_post_message),
@@ -143,17 +223,65 @@ async def _run_sse(args: argparse.Namespace) -> None:
     _prev_handlers[signal.SIGINT] = signal.signal(signal.SIGINT, on_signal)
     _prev_handlers[signal.SIGTERM] = signal.signal(signal.SIGTERM, on_signal)
 
+    _observe_server_init()
     logger.info("Starting origin-conversation MCP SSE on %s:%s", host, args.port)
     await server_instance.serve()
 
 
+def _run_http(args: argparse.Namespace) -> None:
+    """Serve http_app:create_app under uvicorn with args.workers processes."""
+    import uvicorn
+
+    from . import index
+    from .search import _get_db_paths
+
+    host = "0.0.0.0" if args.allow_external else args.host
+    if args.allow_external:
+        logger.warning("External connections allowed (--allow-external).")
+    # Workers are separate processes that build their app from the environment.
+    if args.search_workers is not None:
+        os.environ["CONVERSATION_SEARCH_WORKERS"] = str(args.search_workers)
+    if args.search_queue is not None:
+        os.environ["CONVERSATION_SEARCH_QUEUE"] = str(args.search_queue)
+    # Build the sidecars once here so the workers do not each build them on first use.
+    try:
+        for db_path in _get_db_paths():
+            index.prepare_sidecar(db_path)
+    except FileNotFoundError as e:
+        logger.warning("No conversation DB to index yet: %s", e)
+
+    logger.info("Starting origin-conversation MCP HTTP on %s:%s (%d workers)", host, args.port, args.workers)
+    uvicorn.run(
+        "origin_conversation_mcp.http_app:create_app",
+        factory=True,
+        host=host,
+        port=args.port,
+        workers=max(1, args.workers),
+        log_level="info",
+    )
+
+
 def main() -> None:
+    if sys.argv[1:2] == ["optimize"]:
+        from .optimize import main as optimize_main
+
+        sys.exit(optimize_main(sys.argv[2:]))
     args = _parse_args()
+    if args.in_memory:
+        os.environ["CONVERSATION_IN_MEMORY"] = "1"  # also seen by --http worker processes
     try:
-        if args.sse:
+        if not args.http:
+            # Warm up (DB, index, connection, snapshots) while the MCP SDK is imported and
+            # the client handshakes; --http workers start their own.
+            from . import warmup
+
+            warmup.start(args.in_memory)
+        if args.http:
+            _run_http(args)
+        elif args.sse:
             asyncio.run(_run_sse(args))
         else:
-            asyncio.run(_run_stdio())
+            asyncio.run(_run_stdio(args))
     except KeyboardInterrupt:
         pass
     except Exception as e:
@@ -0,0 +1,392 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# origin_conversation - Benchmark conversation_search on synthetic canonical-export DBs.
+"""
+Benchmark harness for conversation_search.
+
+generate_db() writes a canonical-export-shaped DB (conversations, messages) of any size:
+log-normal title and content lengths, Zipf-distributed vocabulary, role mix, per-conversation
+positions, and create_time stored as a mix of floats, ISO 8601 strings and NULL.
+run() measures every case from cases() on every size, each case in a fresh subprocess so that
+peak RSS (ru_maxrss) belongs to that case alone, and writes p50/p95/p99 latency to JSON.
+compare() diffs two result files so regressions show up across commits.
+
+    python -m origin_conversation_mcp.bench run --sizes 10k,1m,10m --out bench.json
+    python -m origin_conversation_mcp.bench compare before.json after.json
+
+Generated DBs are kept in --work-dir and reused; a 10M-message DB takes a while to build.
+"""
+import argparse
+import functools
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from . import index, search
+from .cache import result_cache
+
+_DEFAULT_SIZES = "10k,1m,10m"
+_DEFAULT_REPEATS = 50
+_DEFAULT_SEED = 1
+_INSERT_BATCH = 10_000
+_VOCABULARY_SIZE = 20_000
+_ZIPF_EXPONENT = 1.07
+_MESSAGES_PER_CONVERSATION = 24
+_SPAN_START = datetime(2022, 12, 1, tzinfo=timezone.utc).timestamp()
+_SPAN_END = datetime(2025, 6, 1, tzinfo=timezone.utc).timestamp()
+_ROLES = ("user", "assistant", "tool")
+_ROLE_WEIGHTS = (0.42, 0.50, 0.08)
+# Log-normal word counts (mu, sigma of ln(words)) per role; capped at _MAX_WORDS.
+_CONTENT_WORDS = {"user": (3.2, 0.9), "assistant": (4.9, 0.8), "tool": (4.0, 1.2)}
+_TITLE_WORDS = (1.4, 0.4)
+_MAX_WORDS = 4000
+# create_time storage mix: float epoch, ISO 8601 string, NULL (the rest).
+_ISO_SHARE = 0.10
+_NULL_SHARE = 0.03
+_SYLLABLES = (
+    "ka", "lo", "mi", "ne", "ra", "ti", "so", "vu", "pe", "da", "zo", "be", "shi", "tor",
+    "len", "mar", "qui", "dex", "on", "al", "us", "ex", "in", "or", "fa", "gri", "sto", "pla",
+)
+
+
+@functools.lru_cache(maxsize=None)
+def vocabulary(seed: int = _DEFAULT_SEED) -> tuple[tuple[str, ...], tuple[float, ...]]:
+    """Distinct pseudo-words by frequency rank, and their cumulative Zipf weights."""
+    rng = random.Random(seed)
+    words: list[str] = []
+    seen: set[str] = set()
+    while len(words) < _VOCABULARY_SIZE:
+        word = "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(1, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    cum, total = [], 0.0
+    for rank in range(1, _VOCABULARY_SIZE + 1):
+        total += 1.0 / rank**_ZIPF_EXPONENT
+        cum.append(total)
+    return tuple(words), tuple(cum)
+
+
+def cases(seed: int = _DEFAULT_SEED) -> dict[str, dict[str, Any]]:
+    """Benchmark cases: name -> conversation_search arguments (query words exist in the vocabulary)."""
+    words, _ = vocabulary(seed)
+    return {
+        "query_common": {"query": words[4]},
+        "query_rare": {"query": words[3000]},
+        "query_two_words": {"query": f"{words[20]} {words[200]}"},
+        "query_roles": {"query": words[50], "roles": ["user"]},
+        "query_date_range": {"query": words[50], "start_date": "2024-01-01", "end_date": "2024-03-31"},
+        "roles_only": {"roles": ["assistant", "tool"]},
+        "date_range_only": {"start_date": "2023-06-01", "end_date": "2023-06-30"},
+        "query_limit_200": {"query": words[4], "limit": 200},
+    }
+
+
+def _words(rng: random.Random, words: tuple[str, ...], cum: tuple[float, ...], mu_sigma: tuple[float, float]) -> str:
+    n = min(_MAX_WORDS, max(1, int(rng.lognormvariate(*mu_sigma))))
+    return " ".join(rng.choices(words, cum_weights=cum, k=n))
+
+
+def _create_time(rng: random.Random, ts: float) -> float | str | None:
+    r = rng.random()
+    if r < _NULL_SHARE:
+        return None
+    if r < _NULL_SHARE + _ISO_SHARE:
+        dt = datetime.fromtimestamp(ts, tz=timezone.utc)
+        # Both spellings seen in exports: with Z suffix and without a zone.
+        return dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ" if rng.random() < 0.5 else "%Y-%m-%dT%H:%M:%S")
+    return ts
+
+
+def generate_db(path: str, messages: int, seed: int = _DEFAULT_SEED) -> str:
+    """Write a synthetic canonical-export DB with the given number of messages to path."""
+    words, cum = vocabulary(seed)
+    rng = random.Random(seed)
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("CREATE TABLE conversations (id TEXT PRIMARY KEY, title TEXT)")
+        conn.execute(
+            """CREATE TABLE messages (
+                id TEXT, conversation_id TEXT, role TEXT, content TEXT,
+                create_time REAL, position INTEGER,
+                FOREIGN KEY(conversation_id) REFERENCES conversations(id)
+            )"""
+        )
+        batch: list[tuple[Any, ...]] = []
+        written = 0
+        conv_no = 0
+        while written < messages:
+            conv_id = f"conv-{conv_no:08d}"
+            conv_no += 1
+            conn.execute(
+                "INSERT INTO conversations (id, title) VALUES (?, ?)",
+                (conv_id, _words(rng, words, cum, _TITLE_WORDS).title()),
+            )
+            count = min(messages - written, max(1, int(rng.expovariate(1 / _MESSAGES_PER_CONVERSATION))))
+            ts = rng.uniform(_SPAN_START, _SPAN_END)
+            for position in range(count):
+                role = rng.choices(_ROLES, weights=_ROLE_WEIGHTS)[0]
+                ts += rng.uniform(5.0, 300.0)
+                batch.append(
+                    (
+                        f"msg-{written:09d}",
+                        conv_id,
+                        role,
+                        _words(rng, words, cum, _CONTENT_WORDS[role]),
+                        _create_time(rng, ts),
+                        position,
+                    )
+                )
+                written += 1
+            if len(batch) >= _INSERT_BATCH:
+                conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?)", batch)
+                batch.clear()
+        conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?)", batch)
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+    return path
+
+
+def parse_size(text: str) -> int:
+    """'10k' -> 10000, '1m' -> 1000000, '2500' -> 2500."""
+    text = text.strip().lower()
+    factor = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if factor > 1 else text) * factor)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Linear-interpolated percentile (0-100) of values."""
+    ordered = sorted(values)
+    if not ordered:
+        return math.nan
+    pos = (len(ordered) - 1) * pct / 100.0
+    lo = math.floor(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def peak_rss_kib() -> int | None:
+    """Peak resident set size of this process in KiB (None where unavailable)."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def run_case(db_path: str, params: dict[str, Any], repeats: int) -> dict[str, Any]:
+    """Time repeats calls of conversation_search(**params) on db_path with the result cache off.
+
+    The first call is reported separately (first_ms) and excluded from the percentiles.
+    """
+    os.environ["CONVERSATION_DB"] = db_path
+    index.prepare_sidecar(db_path)
+    saved, result_cache.max_bytes = result_cache.max_bytes, 0
+    try:
+        start = time.perf_counter()
+        search.conversation_search(**params)
+        first_ms = (time.perf_counter() - start) * 1000
+        samples = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            search.conversation_search(**params)
+            samples.append((time.perf_counter() - start) * 1000)
+    finally:
+        result_cache.max_bytes = saved
+    return {
+        "first_ms": round(first_ms, 3),
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+        "p99_ms": round(percentile(samples, 99), 3),
+        "mean_ms": round(sum(samples) / len(samples), 3) if samples else None,
+        "max_ms": round(max(samples), 3) if samples else None,
+        "peak_rss_kib": peak_rss_kib(),
+    }
+
+
+def _run_case_subprocess(db_path: str, name: str, repeats: int, seed: int) -> dict[str, Any]:
+    # Make this package importable in the child even when it is not installed.
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (package_root, env.get("PYTHONPATH")) if p)
+    out = subprocess.run(
+        [sys.executable, "-m", "origin_conversation_mcp.bench", "case", db_path, name,
+         "--repeats", str(repeats), "--seed", str(seed)],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    return json.loads(out.stdout)
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def run(
+    sizes: list[int],
+    work_dir: str,
+    repeats: int = _DEFAULT_REPEATS,
+    seed: int = _DEFAULT_SEED,
+    case_names: list[str] | None = None,
+    log=None,
+) -> dict[str, Any]:
+    """Generate (or reuse) one DB per size, build its index, and benchmark each case."""
+    all_cases = cases(seed)
+    names = case_names or list(all_cases)
+    unknown = [n for n in names if n not in all_cases]
+    if unknown:
+        raise ValueError(f"Unknown case(s): {', '.join(unknown)}. Known: {', '.join(all_cases)}.")
+    os.makedirs(work_dir, exist_ok=True)
+    report: dict[str, Any] = {
+        "version": 1,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "repeats": repeats,
+        "seed": seed,
+        "sizes": [],
+        "results": [],
+    }
+    for size in sizes:
+        db_path = os.path.join(work_dir, f"synthetic-{size}-s{seed}.db")
+        generate_s = None
+        if not os.path.exists(db_path):
+            if log:
+                log(f"generating {size} messages -> {db_path}")
+            start = time.perf_counter()
+            generate_db(db_path, size, seed)
+            generate_s = round(time.perf_counter() - start, 3)
+        start = time.perf_counter()
+        index.prepare_sidecar(db_path)
+        report["sizes"].append(
+            {
+                "messages": size,
+                "db_bytes": os.path.getsize(db_path),
+                "generate_s": generate_s,
+                "index_ready_s": round(time.perf_counter() - start, 3),
+            }
+        )
+        for name in names:
+            if log:
+                log(f"{size} messages: {name}")
+            result = _run_case_subprocess(db_path, name, repeats, seed)
+            report["results"].append({"messages": size, "case": name, "params": all_cases[name], **result})
+    return report
+
+
+def compare(before: dict[str, Any], after: dict[str, Any], threshold: float = 0.10) -> tuple[list[str], bool]:
+    """Lines comparing p50/p95/p99 per (size, case); True if any percentile regressed beyond threshold."""
+    old = {(r["messages"], r["case"]): r for r in before["results"]}
+    lines = [f"{'messages':>10}  {'case':<18} {'p50':>16} {'p95':>16} {'p99':>16}"]
+    regressed = False
+    for r in after["results"]:
+        prev = old.get((r["messages"], r["case"]))
+        if prev is None:
+            continue
+        cols = []
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            ratio = r[key] / prev[key] if prev[key] else math.inf
+            flag = "!" if ratio > 1 + threshold else " "
+            regressed |= flag == "!"
+            cols.append(f"{r[key]:9.2f} {ratio:4.2f}x{flag}")
+        lines.append(f"{r['messages']:>10}  {r['case']:<18} " + " ".join(cols))
+    return lines, regressed
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m origin_conversation_mcp.bench",
+        description="Benchmark conversation_search on synthetic canonical-export DBs.",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_gen = sub.add_parser("generate", help="Write one synthetic DB.")
+    p_gen.add_argument("path")
+    p_gen.add_argument("--messages", type=parse_size, default=parse_size("10k"))
+    p_gen.add_argument("--seed", type=int, default=_DEFAULT_SEED)
+
+    p_run = sub.add_parser("run", help="Benchmark all cases on each size and write JSON.")
+    p_run.add_argument("--sizes", default=_DEFAULT_SIZES, help=f"Comma-separated (default: {_DEFAULT_SIZES})")
+    p_run.add_argument("--repeats", type=int, default=_DEFAULT_REPEATS)
+    p_run.add_argument("--seed", type=int, default=_DEFAULT_SEED)
+    p_run.add_argument("--cases", default=None, help="Comma-separated case names (default: all)")
+    p_run.add_argument("--work-dir", default="bench-data", help="Where generated DBs are kept")
+    p_run.add_argument("--out", default="-", help="JSON output path (default: stdout)")
+
+    p_case = sub.add_parser("case", help="Run one case in this process and print JSON (used by run).")
+    p_case.add_argument("db_path")
+    p_case.add_argument("name")
+    p_case.add_argument("--repeats", type=int, default=_DEFAULT_REPEATS)
+    p_case.add_argument("--seed", type=int, default=_DEFAULT_SEED)
+
+    p_cmp = sub.add_parser("compare", help="Compare two result files; exit 1 on regression.")
+    p_cmp.add_argument("before")
+    p_cmp.add_argument("after")
+    p_cmp.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown (default 0.10)")
+
+    args = parser.parse_args(argv)
+    if args.command == "generate":
+        generate_db(args.path, args.messages, args.seed)
+        return 0
+    if args.command == "case":
+        print(json.dumps(run_case(args.db_path, cases(args.seed)[args.name], args.repeats)))
+        return 0
+    if args.command == "compare":
+        with open(args.before, encoding="utf-8") as f:
+            before = json.load(f)
+        with open(args.after, encoding="utf-8") as f:
+            after = json.load(f)
+        lines, regressed = compare(before, after, args.threshold)
+        print("\n".join(lines))
+        return 1 if regressed else 0
+    report = run(
+        [parse_size(s) for s in args.sizes.split(",") if s.strip()],
+        args.work_dir,
+        args.repeats,
+        args.seed,
+        [c.strip() for c in args.cases.split(",")] if args.cases else None,
+        log=lambda msg: print(msg, file=sys.stderr),
+    )
+    text = json.dumps(report, indent=2)
+    if args.out == "-":
+        print(text)
+    else:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# origin_conversation - In-process LRU cache for formatted search results.
+"""
+LRU cache of conversation_search output, bounded in bytes and entry age.
+
+Keys are normalized search arguments (see search.search_key); every entry belongs to one
+DB identity, and the whole cache is dropped as soon as a lookup arrives for a different
+one (new export, file replaced or modified, sidecar index became ready).
+Hit/miss/eviction counters are available from stats() for sizing.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+_DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+_DEFAULT_TTL_SECONDS = 300.0
+
+
+def _env_float(key: str, default: float) -> float:
+    """Parse float from environment; on invalid or empty value return default."""
+    try:
+        return float(os.environ.get(key, str(default)))
+    except ValueError:
+        return default
+
+
+class ResultCache:
+    """Thread-safe LRU of str results with a total size cap (UTF-8 bytes) and a TTL."""
+
+    def __init__(self, max_bytes: int, ttl: float) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._bytes = 0
+        self._identity: Hashable = None
+        self._entries: OrderedDict[Hashable, tuple[float, int, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and self.ttl > 0
+
+    def _switch_identity(self, identity: Hashable) -> None:
+        if identity != self._identity:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._identity = identity
+
+    def get(self, identity: Hashable, key: Hashable) -> str | None:
+        """Return the cached result for key under DB identity, or None (counted as a miss)."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._switch_identity(identity)
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, identity: Hashable, key: Hashable, value: str) -> None:
+        """Store value; entries larger than the whole cache are not stored."""
+        if not self.enabled:
+            return
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._switch_identity(identity)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                old_key = next(iter(self._entries))
+                self._remove(old_key)
+                self.evictions += 1
+
+    def _remove(self, key: Hashable) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._identity = None
+
+    def stats(self) -> dict[str, int]:
+        """Counters and current occupancy, for sizing CONVERSATION_RESULT_CACHE_BYTES / _TTL."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+result_cache = ResultCache(
+    max_bytes=int(_env_float("CONVERSATION_RESULT_CACHE_BYTES", _DEFAULT_MAX_BYTES)),
+    ttl=_env_float("CONVERSATION_RESULT_CACHE_TTL", _DEFAULT_TTL_SECONDS),
+)
@@ -0,0 +1,80 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# origin_conversation - Share one execution among identical in-flight tool calls.
+"""
+Request coalescing ("singleflight") for call_tool.
+
+Under --sse several agents often issue the same search at the same moment (e.g. the same
+prompt fanned out, or a client retrying). The result cache only helps once the first call
+has finished; until then every copy would take its own executor slot and run the same SQL.
+SingleFlight keys each call by tool name, normalized arguments and the identity of the DBs
+it reads: the first call runs, identical calls arriving while it is in flight await its
+result (or its exception) instead. The shared work runs as its own task, so a caller that
+goes away does not cancel it for the others; once every caller has gone, it is cancelled.
+Coalesced calls are counted in origin_conversation_coalesced_calls_total. Set
+CONVERSATION_COALESCE=0 to turn it off.
+"""
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Hashable, TypeVar
+
+from . import metrics
+
+T = TypeVar("T")
+
+
+def _coalesce_enabled() -> bool:
+    return os.environ.get("CONVERSATION_COALESCE", "1").strip().lower() not in ("0", "off", "false", "no")
+
+
+class SingleFlight:
+    """At most one in-flight execution per key; concurrent callers with the key share it."""
+
+    def __init__(self, enabled: bool | None = None) -> None:
+        self.enabled = _coalesce_enabled() if enabled is None else enabled
+        self._flights: dict[Hashable, asyncio.Future] = {}
+        self._waiters: dict[asyncio.Future, int] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def run(self, key: Hashable, label: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Await fn(), or the pending execution for key if one is in flight (counted under label)."""
+        if not self.enabled:
+            return await fn()
+        flight = self._flights.get(key)
+        if flight is not None:
+            metrics.COALESCED_CALLS.labels(label).inc()
+        else:
+            flight = asyncio.ensure_future(fn())
+            self._flights[key] = flight
+            flight.add_done_callback(lambda done: self._landed(key, done))
+        self._waiters[flight] = self._waiters.get(flight, 0) + 1
+        try:
+            return await asyncio.shield(flight)
+        except asyncio.CancelledError:
+            if not flight.done() and self._waiters.get(flight) == 1:
+                # Nobody is left to receive the result: stop the work, and let the next
+                # identical call start afresh rather than join a cancelled flight.
+                self._landed(key, flight)
+                flight.cancel()
+            raise
+        finally:
+            if flight in self._waiters:
+                self._waiters[flight] -= 1
+
+    def _landed(self, key: Hashable, flight: asyncio.Future) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        self._waiters.pop(flight, None)
+        if flight.done() and not flight.cancelled():
+            flight.exception()  # retrieved here too, in case every caller went away
+
+
+def freeze(value: Any) -> Hashable:
+    """value with lists and dicts turned into tuples (dict items sorted), for use in a key."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
@@ -0,0 +1,133 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# origin_conversation - Context window around a message.
+"""
+conversation_context: the messages before and after one message of a conversation.
+
+The anchor is a message id (as shown on every search hit) or a conversation_id and
+position. Neighbours are read in (position, rowid) order through an index on
+messages(conversation_id, position): the export's own if it has one, else msg_pos in the
+sidecar (see index.py); the id lookup works the same way. While the sidecar is building
+and the export has no such index, the lookups scan the messages table.
+"""
+import sqlite3
+from typing import Any
+
+from . import index, metrics, pool
+from .cache import result_cache
+from .search import _attach_index, _format_row, _render, _resolve, _rows_by_rowid
+
+_DEFAULT_WINDOW = 5
+_MAX_WINDOW = 50
+_ANCHOR_MARK = ">>> "
+
+_CONV_COLUMNS = ("conversation_id", "position")
+_ID_COLUMNS = ("id",)
+
+
+def conversation_context(
+    message_id: str | None = None,
+    conversation_id: str | None = None,
+    position: int | None = None,
+    before: int = _DEFAULT_WINDOW,
+    after: int = _DEFAULT_WINDOW,
+    max_bytes: int | None = None,
+) -> str:
+    """
+    Return up to before/after messages around one message, in conversation order.
+    - message_id: id of the anchor message (from a search hit)
+    - conversation_id, position: the anchor by place instead of id
+    - before, after: neighbours on each side, clamped to 0.._MAX_WINDOW
+    The anchor block is marked with '>>> '. Raises ValueError if neither anchor form is
+    given or the anchor message does not exist.
+    """
+    if message_id is None and (conversation_id is None or position is None):
+        raise ValueError("Pass message_id, or conversation_id and position.")
+    before = max(0, min(int(before), _MAX_WINDOW))
+    after = max(0, min(int(after), _MAX_WINDOW))
+    db_paths, identity = _resolve()
+    key = ("context", message_id, conversation_id, position, before, after, max_bytes)
+    with metrics.timed(metrics.SEARCH_STAGE_SECONDS, "cache_lookup"):
+        cached = result_cache.get(identity, key)
+    if cached is not None:
+        return cached
+    pool.retain(db_paths)
+    for db_path in db_paths:
+        with pool.connection(db_path) as conn:
+            result = _context(conn, db_path, message_id, conversation_id, position, before, after, max_bytes)
+        if result is not None:
+            result_cache.put(identity, key, result)
+            return result
+    anchor = f"id {message_id!r}" if message_id is not None else f"{conversation_id!r} position {position}"
+    raise ValueError(f"No message with {anchor}.")
+
+
+def _source(conn: pool.PooledConnection, db_path: str, columns: tuple[str, ...]) -> str:
+    """Table to look columns up in: messages if the export indexes them, else the sidecar's msg_pos."""
+    if index.has_index(conn, "main", "messages", columns):
+        return "messages"
+    if _attach_index(conn, db_path) and index.has_index(conn, "ix", "msg_pos", columns):
+        return "ix.msg_pos"
+    return "messages"
+
+
+def _context(
+    conn: pool.PooledConnection,
+    db_path: str,
+    message_id: str | None,
+    conversation_id: str | None,
+    position: int | None,
+    before: int,
+    after: int,
+    max_bytes: int | None,
+) -> str | None:
+    """Formatted window around the anchor in this DB, or None if the anchor is not here."""
+    with metrics.timed(metrics.SEARCH_STAGE_SECONDS, "plan"):
+        window = _source(conn, db_path, _CONV_COLUMNS)
+        if message_id is not None:
+            table = _source(conn, db_path, _ID_COLUMNS)
+            where = "id = ?"
+            anchor_params: list[Any] = [message_id]
+        else:
+            table = window
+            where = "conversation_id = ? AND position = ?"
+            anchor_params = [conversation_id, position]
+        anchor_sql = f"SELECT rowid, conversation_id, position FROM {table} WHERE {where} ORDER BY rowid LIMIT 1"
+    execute = metrics.Stopwatch()
+    with execute:
+        anchor = conn.execute(anchor_sql, anchor_params).fetchone()
+        if anchor is None:
+            return None
+        rowid, conversation_id, position = anchor
+        if position is None:
+            rowids = [rowid]
+        else:
+            rowids = _neighbours(conn, window, conversation_id, position, rowid, "<", before)[::-1]
+            rowids.append(rowid)
+            rowids += _neighbours(conn, window, conversation_id, position, rowid, ">", after)
+        by_rowid = _rows_by_rowid(conn, rowids)
+    rows = [by_rowid[r] for r in rowids if r in by_rowid]
+    return _render(
+        rows,
+        len(rows),
+        max_bytes,
+        None,
+        execute,
+        lambda row: (_ANCHOR_MARK if row["msg_rowid"] == rowid else "") + _format_row(row),
+    )
+
+
+def _neighbours(
+    conn: sqlite3.Connection, table: str, conversation_id: str, position: int, rowid: int, op: str, n: int
+) -> list[int]:
+    """Rowids of up to n messages before (op '<') or after (op '>') (position, rowid), nearest first."""
+    if n == 0:
+        return []
+    direction = "DESC" if op == "<" else "ASC"
+    return [
+        r
+        for (r,) in conn.execute(
+            f"SELECT rowid FROM {table} WHERE conversation_id = ? AND (position, rowid) {op} (?, ?) "
+            f"ORDER BY position {direction}, rowid {direction} LIMIT ?",
+            (conversation_id, position, rowid, n),
+        )
+    ]
@@ -0,0 +1,183 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# origin_conversation - Per-call deadlines and cancellation of SQLite work.
+"""
+Deadlines for tool calls, enforced inside SQLite.
+
+A broad pattern or LIKE scan over a large export can run for many seconds, and a thread
+blocked in sqlite3 cannot be stopped from outside. Each tool call therefore gets a
+Deadline: a time limit (CONVERSATION_SEARCH_TIMEOUT, default 30 s, or the call's
+timeout_seconds if shorter) that the server also trips when the MCP request is cancelled.
+call() makes it the worker thread's current deadline; pool.connection() installs it as
+the connection's progress handler, so SQLite checks it every _PROGRESS_OPS virtual machine
+instructions and aborts the statement ("interrupted") once it has passed. Shard threads
+check the same Deadline through their own connections. The same handler counts the
+instructions for count_ops() (the slow-query log's vm_steps).
+
+search renders the rows it has read so far, followed by truncated_note(), and does not
+cache the result. Work that cannot return partial results (context, stats) raises
+Interrupted instead, which the server reports as a stopped call.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+_DEFAULT_TIMEOUT = 30.0
+# SQLite virtual machine instructions between checks (microseconds of work; no measurable overhead).
+_PROGRESS_OPS = 1_000
+
+
+class Interrupted(RuntimeError):
+    """Raised when a call's work was stopped by its deadline or by cancellation."""
+
+
+def default_timeout() -> float | None:
+    """Server-wide time limit in seconds from CONVERSATION_SEARCH_TIMEOUT; None if 0 or negative."""
+    try:
+        seconds = float(os.environ.get("CONVERSATION_SEARCH_TIMEOUT", str(_DEFAULT_TIMEOUT)))
+    except ValueError:
+        seconds = _DEFAULT_TIMEOUT
+    return seconds if seconds > 0 else None
+
+
+def effective_timeout(requested: float | None) -> float | None:
+    """The call's time limit: requested (if positive), but never longer than the server default."""
+    limit = default_timeout()
+    if requested is None or requested <= 0:
+        return limit
+    return min(requested, limit) if limit is not None else requested
+
+
+class Deadline:
+    """A time limit and/or cancellation flag that SQLite work polls."""
+
+    def __init__(self, seconds: float | None = None) -> None:
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds if seconds is not None else None
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    @property
+    def expired(self) -> bool:
+        return self.expires is not None and time.monotonic() >= self.expires
+
+    def stopped(self) -> bool:
+        """Whether work should stop (also the progress handler: non-zero aborts the statement)."""
+        return self.cancelled or self.expired
+
+    @property
+    def reason(self) -> str:
+        if self.cancelled:
+            return "the request was cancelled"
+        return f"the {self.seconds:g} s time limit was reached"
+
+
+_local = threading.local()
+
+
+def current() -> Deadline | None:
+    """The deadline of the call running on this thread, if any."""
+    return getattr(_local, "deadline", None)
+
+
+@contextmanager
+def active(deadline: Deadline | None) -> Iterator[None]:
+    """Make deadline current on this thread for the block (e.g. in a shard thread)."""
+    previous = current()
+    _local.deadline = deadline
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def call(deadline: Deadline, fn: Callable[..., T], /, *args: Any, **kwargs: Any) -> T:
+    """Run fn(*args, **kwargs) with deadline current on this thread.
+
+    Raises Interrupted without running fn if the deadline has already stopped (e.g. the
+    call waited in the executor's queue past it); an SQLite statement it aborts surfaces
+    as Interrupted rather than OperationalError.
+    """
+    if deadline.stopped():
+        raise Interrupted(f"Stopped because {deadline.reason}.")
+    with active(deadline):
+        try:
+            return fn(*args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if deadline.stopped():
+                raise Interrupted(f"Stopped because {deadline.reason}.") from e
+            raise
+
+
+def interrupted(exc: BaseException) -> bool:
+    """Whether exc is SQLite aborting a statement for the current deadline."""
+    deadline = current()
+    return isinstance(exc, sqlite3.OperationalError) and deadline is not None and deadline.stopped()
+
+
+def stopped() -> bool:
+    """Whether the current deadline (if any) has passed or been cancelled."""
+    deadline = current()
+    return deadline is not None and deadline.stopped()
+
+
+def truncated_note() -> str:
+    """Line appended to results cut short by the current deadline."""
+    deadline = current()
+    reason = deadline.reason if deadline is not None else "the search was stopped"
+    return f"[truncated: {reason}; results are incomplete]"
+
+
+def _ticks() -> list[int]:
+    """This thread's count of progress-handler calls (one per _PROGRESS_OPS instructions)."""
+    ticks = getattr(_local, "ticks", None)
+    if ticks is None:
+        ticks = _local.ticks = [0]
+    return ticks
+
+
+@contextmanager
+def count_ops() -> Iterator[Callable[[], int]]:
+    """Count SQLite VM instructions run by connections borrowed on this thread in the block.
+
+    Yields a function returning the count so far, a multiple of _PROGRESS_OPS (statements
+    shorter than that may count as 0). Statements a borrowed connection runs on other threads
+    (federated shards) count too.
+    """
+    ticks = _ticks()
+    start = ticks[0]
+    _local.counting = getattr(_local, "counting", 0) + 1
+    try:
+        yield lambda: (ticks[0] - start) * _PROGRESS_OPS
+    finally:
+        _local.counting -= 1
+
+
+@contextmanager
+def watch(conn: sqlite3.Connection) -> Iterator[None]:
+    """Abort conn's statements once the current deadline stops, and count their work for count_ops.
+
+    No-op without a deadline or count_ops block.
+    """
+    deadline = current()
+    if deadline is None and not getattr(_local, "counting", 0):
+        yield
+        return
+    ticks = _ticks()
+    stopped = deadline.stopped if deadline is not None else None
+
+    def progress() -> bool:
+        ticks[0] += 1
+        return stopped is not None and stopped()
+
+    conn.set_progress_handler(progress, _PROGRESS_OPS)
+    try:
+        yield
+    finally:
+        conn.set_progress_handler(None, _PROGRESS_OPS)
@@ -0,0 +1,106 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# origin_conversation - Run blocking searches off the asyncio event loop.
+"""
+Dedicated thread pool for SQLite searches with admission control.
+
+call_tool is async but searches are blocking SQLite work; running them inline stalls the
+event loop (and, under --sse, every other client). SearchExecutor runs them on its own
+worker threads and admits at most workers + max_queue calls at once; beyond that,
+calls fail fast with SearchBusyError instead of queueing without bound.
+"""
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from . import metrics
+from .pool import _env_int
+
+T = TypeVar("T")
+
+_DEFAULT_MAX_WORKERS = 4
+_DEFAULT_MAX_QUEUE = 32
+_DEFAULT_SHARD_WORKERS = 8
+
+
+class SearchBusyError(RuntimeError):
+    """Raised when a search is rejected because the executor's queue is full."""
+
+
+class SearchExecutor:
+    """Thread pool with an admission limit of workers + max_queue in-flight calls."""
+
+    def __init__(self, workers: int | None = None, max_queue: int | None = None) -> None:
+        if workers is None:
+            workers = _env_int(
+                "CONVERSATION_SEARCH_WORKERS", min(_DEFAULT_MAX_WORKERS, os.cpu_count() or 1)
+            )
+        if max_queue is None:
+            max_queue = _env_int("CONVERSATION_SEARCH_QUEUE", _DEFAULT_MAX_QUEUE)
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="origin-conversation-search"
+        )
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def run(self, fn: Callable[..., T], /, *args: Any, **kwargs: Any) -> T:
+        """Run fn(*args, **kwargs) on a worker thread; raise SearchBusyError if saturated."""
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_queue:
+                raise SearchBusyError(
+                    f"{self._in_flight} searches in progress or queued "
+                    f"(workers={self.workers}, queue={self.max_queue}); retry shortly."
+                )
+            self._in_flight += 1
+        try:
+            future = self._pool.submit(
+                functools.partial(self._call, time.perf_counter(), fn, *args, **kwargs)
+            )
+        except BaseException:
+            self._release()
+            raise
+        # Release the slot when the thread is done, not when the awaiter is: a cancelled
+        # call leaves its search running on the worker until it returns.
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, _future: Future[Any] | None = None) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    @staticmethod
+    def _call(submitted: float, fn: Callable[..., T], /, *args: Any, **kwargs: Any) -> T:
+        metrics.CALL_STAGE_SECONDS.labels("queue_wait").observe(time.perf_counter() - submitted)
+        return fn(*args, **kwargs)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
+
+
+_shard_lock = threading.Lock()
+_shard_pool: ThreadPoolExecutor | None = None
+
+
+def shard_pool() -> ThreadPoolExecutor:
+    """Process-wide threads that run one federated search's per-shard queries in parallel.
+
+    Separate from SearchExecutor's workers (which wait on these), sized by
+    CONVERSATION_SHARD_WORKERS.
+    """
+    global _shard_pool
+    with _shard_lock:
+        if _shard_pool is None:
+            workers = max(1, _env_int("CONVERSATION_SHARD_WORKERS", _DEFAULT_SHARD_WORKERS))
+            _shard_pool = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="origin-conversation-shard"
+            )
+        return _shard_pool
@@ -0,0 +1,67 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# origin_conversation MCP server - stateless streamable HTTP app.
+"""
+ASGI app serving the MCP tools over the streamable HTTP transport in stateless mode.
+
+Every POST /mcp is a complete JSON-RPC exchange answered with a JSON body; no session is
+kept between requests, so any worker process can serve any request. Run it under several
+uvicorn workers (--http --workers N) to spread searches over cores: each worker has its
+own connection pool, executor and result cache, and they share the read-only DB and its
+sidecars through the OS page cache. GET /metrics reports the serving worker's metrics and
+GET /ready its warm-up status (see warmup.py; with CONVERSATION_IN_MEMORY=1 this includes
+loading the worker's in-memory snapshot).
+"""
+import contextlib
+from typing import Any, AsyncIterator
+
+from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from . import metrics, snapshot, warmup
+from .server import create_server, register_tools
+
+MCP_PATH = "/mcp"
+
+
+class _McpEndpoint:
+    """ASGI endpoint handing each request to the session manager (Route mounts it as an app)."""
+
+    def __init__(self, manager: StreamableHTTPSessionManager) -> None:
+        self.manager = manager
+
+    async def __call__(self, scope: dict[str, Any], receive: Any, send: Any) -> None:
+        await self.manager.handle_request(scope, receive, send)
+
+
+async def _metrics_endpoint(request: Request) -> Response:
+    return Response(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+async def _ready_endpoint(request: Request) -> Response:
+    state = warmup.status()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+
+def create_app() -> Starlette:
+    """Build the app; the search executor is sized from the environment (uvicorn factory)."""
+    warmup.start(snapshot.in_memory_enabled())
+    server = create_server()
+    register_tools(server)
+    manager = StreamableHTTPSessionManager(app=server, stateless=True, json_response=True)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app: Starlette) -> AsyncIterator[None]:
+        async with manager.run():
+            yield
+
+    return Starlette(
+        routes=[
+            Route("/metrics", _metrics_endpoint, methods=["GET"]),
+            Route("/ready", _ready_endpoint, methods=["GET"]),
+            Route(MCP_PATH, _McpEndpoint(manager), methods=["GET", "POST", "DELETE"]),
+        ],
+        lifespan=lifespan,
+    )
@@ -0,0 +1,599 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# origin_conversation - Sidecar full-text index for the canonical export DB.
+"""
+Sidecar FTS5 index over message content and conversation titles, plus a normalized
+epoch timestamp per message (msg_time) indexed for date-range scans and time ordering.
+If the export has no index on messages(conversation_id, position) or messages(id), the
+sidecar also carries msg_pos with the missing ones, for conversation_context lookups.
+Message counts per UTC day and role (agg_day) and per conversation, day and role
+(agg_conv_day) are precomputed for conversation_stats.
+
+FTS documents are keyed by a doc id, mapped to messages.rowid by msg_doc, so they survive
+a new export that renumbers rows. Each conversation is fingerprinted (conv_fp: hash of its
+title and message contents); a new export's sidecar starts from a copy of an existing one
+of the same lineage (see _base_sidecar) and only re-tokenizes conversations whose
+fingerprint changed. The other tables are cheap to derive and are rebuilt every time.
+
+msg_tri indexes the same documents by trigram (every 3-character window, case-insensitive,
+no positions) for the substring, regex and fuzzy search modes (see patterns.py). It is
+contentless (the text is in msg_fts) and skipped if SQLite lacks the trigram tokenizer
+(before 3.34) or CONVERSATION_TRIGRAM_INDEX is 0/off/false/no.
+
+The canonical export is only ever opened read-only, so the index lives in its own SQLite
+file next to it (<db>.idx, or under CONVERSATION_INDEX_DIR). It is built in a background
+thread the first time a DB is searched; until it is ready, search falls back to LIKE.
+A sidecar is only used when its recorded source fingerprint (size + mtime) matches the DB.
+"""
+import contextlib
+import hashlib
+import logging
+import math
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+_SIDECAR_SUFFIX = ".idx"
+_SIDECAR_VERSION = "7"
+_BUILD_TMP_SUFFIX = ".tmp"
+_BUILD_WAIT_INTERVAL = 0.05
+
+# msg_time.ts for messages without a usable create_time. A real (lowest) value instead of
+# NULL keeps (ts, rowid) a total order, so keyset pagination can always seek the index.
+UNDATED_TS = -1e308
+
+# Sidecar indexes on msg_pos (rowid = messages.rowid), built when the export lacks them.
+_CONTEXT_INDEXES = {
+    "msg_pos_conv": ("conversation_id", "position"),
+    "msg_pos_id": ("id",),
+}
+
+_SECONDS_PER_DAY = 86400
+
+# Share of a new export's conversations a sidecar must index to be updated instead of
+# building afresh (see _base_sidecar).
+_BASE_MIN_SHARED = 0.5
+# Share of documents deleted by an update after which the FTS indexes are merged into one
+# segment again ('optimize'); deletions otherwise stay as tombstones in extra segments.
+_OPTIMIZE_AFTER_DELETED = 0.1
+
+_lock = threading.Lock()
+_building: set[str] = set()
+_ready: dict[str, str] = {}  # db_path -> fingerprint of a verified sidecar
+_failed: dict[str, str] = {}  # db_path -> fingerprint whose build failed (do not retry)
+
+
+def _index_enabled() -> bool:
+    """Sidecar indexing is on unless CONVERSATION_INDEX is set to 0/off/false/no."""
+    return os.environ.get("CONVERSATION_INDEX", "").strip().lower() not in ("0", "off", "false", "no")
+
+
+def _trigram_enabled() -> bool:
+    """The trigram index is built unless CONVERSATION_TRIGRAM_INDEX is set to 0/off/false/no."""
+    return os.environ.get("CONVERSATION_TRIGRAM_INDEX", "").strip().lower() not in ("0", "off", "false", "no")
+
+
+def _ro_uri(path: str) -> str:
+    return f"file:{quote(path, safe='')}?mode=ro"
+
+
+def sidecar_path(db_path: str) -> str:
+    """Path of the sidecar index for db_path (next to it, or under CONVERSATION_INDEX_DIR)."""
+    index_dir = os.environ.get("CONVERSATION_INDEX_DIR")
+    if index_dir:
+        return str(Path(index_dir) / (Path(db_path).name + _SIDECAR_SUFFIX))
+    return db_path + _SIDECAR_SUFFIX
+
+
+def source_fingerprint(db_path: str) -> str:
+    """Cheap identity of the source DB contents: size and mtime (ns)."""
+    st = os.stat(db_path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def read_meta(path: str) -> dict[str, str]:
+    """Return the meta table of a sidecar as a dict; empty if missing or unreadable."""
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with sqlite3.connect(_ro_uri(path), uri=True) as conn:
+            return dict(conn.execute("SELECT key, value FROM meta").fetchall())
+    except sqlite3.Error:
+        return {}
+
+
+def utc_day(ts: float | None) -> int | None:
+    """Days since the epoch (UTC) of an epoch timestamp; None if undated (None or UNDATED_TS)."""
+    if ts is None or ts <= UNDATED_TS:
+        return None
+    return math.floor(ts / _SECONDS_PER_DAY)
+
+
+def has_index(conn: sqlite3.Connection, schema: str, table: str, columns: tuple[str, ...]) -> bool:
+    """Whether schema.table has a (non-partial) index whose leading columns are columns."""
+    for _, name, _, _, partial in conn.execute(f"PRAGMA {schema}.index_list({table})").fetchall():
+        if partial:
+            continue
+        info = conn.execute(f'PRAGMA {schema}.index_info("{name}")').fetchall()
+        if tuple(row[2] for row in info[: len(columns)]) == columns:
+            return True
+    return False
+
+
+def has_table(conn: sqlite3.Connection, schema: str, table: str) -> bool:
+    """Whether schema has a table (or virtual table) named table."""
+    row = conn.execute(
+        f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()
+    return row is not None
+
+
+def build_sidecar(db_path: str) -> str:
+    """Build the sidecar index for db_path synchronously and return its path.
+
+    If another sidecar of this version indexes most of this DB's conversations (this DB's
+    stale one, or the previous export's in the same directory), it is updated
+    incrementally: only conversations whose fingerprint changed are re-tokenized. Writes to a temporary file (per process, so
+    server workers building the same index cannot clobber each other) and renames it into
+    place, so readers never see a partially built index.
+    """
+    fingerprint = source_fingerprint(db_path)
+    target = sidecar_path(db_path)
+    tmp = f"{target}.{os.getpid()}{_BUILD_TMP_SUFFIX}"
+    _remove_stale_builds(target)
+    base = _base_sidecar(db_path, target)
+    if base is not None:
+        try:
+            reindexed, total = _build(db_path, tmp, fingerprint, base)
+            logger.info(
+                "Updated search index %s from %s: re-indexed %d of %d conversations",
+                target, base, reindexed, total,
+            )
+        except sqlite3.Error as e:
+            logger.warning("Incremental index update from %s failed, rebuilding %s: %s", base, target, e)
+            base = None
+    if base is None:
+        _build(db_path, tmp, fingerprint, None)
+    os.replace(tmp, target)
+    with _lock:
+        _ready[db_path] = fingerprint
+    return target
+
+
+def _remove_stale_builds(target: str) -> None:
+    """Delete temp files of builds whose process has exited (e.g. a stdio server closed mid-build)."""
+    if os.name != "posix":
+        return
+    name = Path(target).name
+    for path in Path(target).parent.glob(f"{name}.*{_BUILD_TMP_SUFFIX}*"):
+        pid = path.name[len(name) + 1 :].split(".", 1)[0]
+        if not pid.isdigit() or int(pid) == os.getpid() or _pid_alive(int(pid)):
+            continue
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # exists, owned by another user
+    return True
+
+
+def _base_sidecar(db_path: str, target: str) -> str | None:
+    """Sidecar of the current version next to target (target included) to update for db_path.
+
+    Only a sidecar of the same lineage pays off: one indexing at least _BASE_MIN_SHARED of
+    db_path's conversations (this DB's stale sidecar, the previous re-dump of the same
+    account). Other exports in the directory (federated shards, other accounts) would be
+    copied only to have all their documents deleted and db_path's inserted. Of the
+    candidates, the one sharing the most conversations wins, then the newest.
+    """
+    try:
+        with contextlib.closing(sqlite3.connect(_ro_uri(db_path), uri=True)) as conn:
+            ids = {conv_id for (conv_id,) in conn.execute("SELECT id FROM conversations")}
+    except sqlite3.Error:
+        return None
+    if not ids:
+        return None
+    candidates = []
+    for path in Path(target).parent.glob(f"*{_SIDECAR_SUFFIX}"):
+        if read_meta(str(path)).get("version") != _SIDECAR_VERSION:
+            continue
+        try:
+            with contextlib.closing(sqlite3.connect(_ro_uri(str(path)), uri=True)) as conn:
+                shared = sum(1 for (conv_id,) in conn.execute("SELECT conversation_id FROM conv_fp") if conv_id in ids)
+            candidates.append((shared, path.stat().st_mtime_ns, str(path)))
+        except (sqlite3.Error, OSError):
+            continue
+    best = max(candidates, default=None)
+    return best[2] if best is not None and best[0] >= _BASE_MIN_SHARED * len(ids) else None
+
+
+def _build(db_path: str, tmp: str, fingerprint: str, base: str | None) -> tuple[int, int]:
+    """Write the sidecar for db_path to tmp, starting from a copy of base if given.
+
+    Returns (conversations re-indexed, conversations in the export); tmp is removed on error.
+    """
+    from .search import _create_time_comparable
+
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    if base is not None:
+        shutil.copyfile(base, tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.create_function("ct_epoch", 1, _create_time_comparable, deterministic=True)
+        conn.create_function("utc_day", 1, utc_day, deterministic=True)
+        conn.execute("ATTACH DATABASE ? AS src", (_ro_uri(db_path),))
+        _fingerprint_conversations(conn)
+        if base is None:
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute(
+                "CREATE VIRTUAL TABLE msg_fts USING fts5("
+                "content, title, tokenize='unicode61 remove_diacritics 2')"
+            )
+            conn.execute(
+                "CREATE TABLE msg_doc (doc INTEGER PRIMARY KEY, msg_rowid INTEGER NOT NULL, "
+                "conversation_id TEXT NOT NULL, ord INTEGER NOT NULL)"
+            )
+            conn.execute("CREATE INDEX msg_doc_conv ON msg_doc (conversation_id)")
+            conn.execute("CREATE TABLE conv_fp (conversation_id TEXT PRIMARY KEY, hash TEXT NOT NULL)")
+            conn.execute("CREATE TEMP TABLE reindex AS SELECT conversation_id FROM conv_new")
+            _index_conversations(conn)
+            conn.execute("INSERT INTO msg_fts (msg_fts) VALUES ('optimize')")
+        else:
+            _update_documents(conn)
+        _sync_trigrams(conn)
+        conn.execute("DELETE FROM conv_fp")
+        conn.execute("INSERT INTO conv_fp (conversation_id, hash) SELECT conversation_id, hash FROM conv_new")
+        _build_tables(conn)
+        (max_ts,) = conn.execute(
+            "SELECT MAX(ts) FROM msg_time WHERE ts > ?", (UNDATED_TS,)
+        ).fetchone()
+        (reindexed,) = conn.execute("SELECT count(*) FROM reindex").fetchone()
+        (total,) = conn.execute("SELECT count(*) FROM conv_new").fetchone()
+        conn.execute("DELETE FROM meta")
+        conn.executemany(
+            "INSERT INTO meta (key, value) VALUES (?, ?)",
+            [
+                ("version", _SIDECAR_VERSION),
+                ("source_fingerprint", fingerprint),
+                ("max_ts", "" if max_ts is None else repr(float(max_ts))),
+                ("updated_from", "" if base is None else os.path.basename(base)),
+                ("reindexed_conversations", str(reindexed)),
+            ],
+        )
+        conn.commit()
+        conn.execute("DETACH DATABASE src")
+    except BaseException:
+        conn.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    conn.close()
+    return reindexed, total
+
+
+def _fingerprint_conversations(conn: sqlite3.Connection) -> None:
+    """Fill temp.conv_new with a hash of each conversation's title and message contents.
+
+    Only what msg_fts stores goes into the hash, in rowid order, so an unchanged hash means
+    the conversation's documents can be kept and mapped to the new rowids by ordinal.
+    """
+    conn.execute("CREATE TEMP TABLE conv_new (conversation_id TEXT PRIMARY KEY, hash TEXT NOT NULL)")
+    rows = conn.execute(
+        """
+        SELECT m.conversation_id, c.title, m.content
+        FROM src.messages m
+        JOIN src.conversations c ON c.id = m.conversation_id
+        ORDER BY m.conversation_id, m.rowid
+        """
+    )
+    conn.executemany("INSERT INTO conv_new (conversation_id, hash) VALUES (?, ?)", _conversation_hashes(rows))
+
+
+def _conversation_hashes(rows: Iterable[tuple[str, str | None, str | None]]) -> Iterator[tuple[str, str]]:
+    current, digest = None, None
+    for conversation_id, title, content in rows:
+        if digest is None or conversation_id != current:
+            if digest is not None:
+                yield current, digest.hexdigest()
+            current, digest = conversation_id, hashlib.blake2b(digest_size=16)
+            _hash_text(digest, title)
+        _hash_text(digest, content)
+    if digest is not None:
+        yield current, digest.hexdigest()
+
+
+def _hash_text(digest: Any, text: str | None) -> None:
+    data = (text or "").encode("utf-8")
+    digest.update(len(data).to_bytes(8, "little"))
+    digest.update(data)
+
+
+def _index_conversations(conn: sqlite3.Connection) -> None:
+    """Add msg_doc rows and FTS documents for the messages of the conversations in temp.reindex."""
+    (first_new,) = conn.execute("SELECT COALESCE(MAX(doc), 0) FROM msg_doc").fetchone()
+    conn.execute(
+        """
+        INSERT INTO msg_doc (msg_rowid, conversation_id, ord)
+        SELECT m.rowid, m.conversation_id,
+               row_number() OVER (PARTITION BY m.conversation_id ORDER BY m.rowid)
+        FROM src.messages m
+        JOIN src.conversations c ON c.id = m.conversation_id
+        WHERE m.conversation_id IN (SELECT conversation_id FROM reindex)
+        ORDER BY m.rowid
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO msg_fts (rowid, content, title)
+        SELECT d.doc, COALESCE(m.content, ''), COALESCE(c.title, '')
+        FROM msg_doc d
+        JOIN src.messages m ON m.rowid = d.msg_rowid
+        JOIN src.conversations c ON c.id = d.conversation_id
+        WHERE d.doc > ?
+        """,
+        (first_new,),
+    )
+    if has_table(conn, "main", "msg_tri"):
+        conn.execute(
+            "INSERT INTO msg_tri (rowid, content, title) SELECT rowid, content, title FROM msg_fts WHERE rowid > ?",
+            (first_new,),
+        )
+
+
+def _sync_trigrams(conn: sqlite3.Connection) -> None:
+    """Create and fill msg_tri from msg_fts if it is wanted and missing; drop it if unwanted.
+
+    An existing msg_tri has been kept in step with msg_fts by _update_documents.
+    """
+    present = has_table(conn, "main", "msg_tri")
+    if not _trigram_enabled():
+        if present:
+            conn.execute("DROP TABLE msg_tri")
+        return
+    if present:
+        return
+    try:
+        # Contentless (the text is in msg_fts) and without positions: candidates are found
+        # by AND / OR of single trigrams and checked exactly by search.
+        conn.execute(
+            "CREATE VIRTUAL TABLE msg_tri USING fts5("
+            "content, title, content='', tokenize='trigram', detail='none')"
+        )
+    except sqlite3.OperationalError as e:
+        logger.info("No trigram index (substring/regex/fuzzy searches scan): %s", e)
+        return
+    conn.execute("INSERT INTO msg_tri (rowid, content, title) SELECT rowid, content, title FROM msg_fts")
+    conn.execute("INSERT INTO msg_tri (msg_tri) VALUES ('optimize')")
+
+
+def _update_documents(conn: sqlite3.Connection) -> None:
+    """Bring a copied sidecar's documents up to date with the export in src.
+
+    Documents of removed or changed conversations are deleted; those of unchanged ones are
+    kept (no re-tokenizing) and pointed at the messages' new rowids; new and changed
+    conversations are indexed.
+    """
+    conn.execute(
+        """
+        CREATE TEMP TABLE reindex AS
+        SELECT n.conversation_id FROM conv_new n
+        LEFT JOIN conv_fp o ON o.conversation_id = n.conversation_id
+        WHERE o.hash IS NOT n.hash
+        """
+    )
+    conn.execute(
+        """
+        CREATE TEMP TABLE dropped AS
+        SELECT o.conversation_id FROM conv_fp o
+        LEFT JOIN conv_new n ON n.conversation_id = o.conversation_id
+        WHERE n.hash IS NOT o.hash
+        """
+    )
+    dropped = "SELECT doc FROM msg_doc WHERE conversation_id IN (SELECT conversation_id FROM dropped)"
+    if has_table(conn, "main", "msg_tri"):
+        # A contentless table deletes a document given the values it was indexed with.
+        conn.execute(
+            f"INSERT INTO msg_tri (msg_tri, rowid, content, title) "
+            f"SELECT 'delete', rowid, content, title FROM msg_fts WHERE rowid IN ({dropped})"
+        )
+    (before,) = conn.execute("SELECT count(*) FROM msg_doc").fetchone()
+    conn.execute(f"DELETE FROM msg_fts WHERE rowid IN ({dropped})")
+    deleted = conn.execute(f"DELETE FROM msg_doc WHERE doc IN ({dropped})").rowcount
+    conn.execute(
+        """
+        CREATE TEMP TABLE kept (
+            conversation_id TEXT, ord INTEGER, msg_rowid INTEGER, PRIMARY KEY (conversation_id, ord)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO kept (conversation_id, ord, msg_rowid)
+        SELECT m.conversation_id,
+               row_number() OVER (PARTITION BY m.conversation_id ORDER BY m.rowid), m.rowid
+        FROM src.messages m
+        JOIN src.conversations c ON c.id = m.conversation_id
+        WHERE m.conversation_id NOT IN (SELECT conversation_id FROM reindex)
+        """
+    )
+    conn.execute(
+        """
+        UPDATE msg_doc SET msg_rowid = k.msg_rowid
+        FROM kept k
+        WHERE k.conversation_id = msg_doc.conversation_id AND k.ord = msg_doc.ord
+        """
+    )
+    _index_conversations(conn)
+    if before and deleted >= _OPTIMIZE_AFTER_DELETED * before:
+        conn.execute("INSERT INTO msg_fts (msg_fts) VALUES ('optimize')")
+        if has_table(conn, "main", "msg_tri"):
+            conn.execute("INSERT INTO msg_tri (msg_tri) VALUES ('optimize')")
+
+
+def _build_tables(conn: sqlite3.Connection) -> None:
+    """(Re)create the tables derived from the export without tokenizing: msg_time, msg_pos, aggregates."""
+    for table in ("msg_time", "msg_pos", "agg_day", "agg_conv_day"):
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+    # create_time is a float epoch or an ISO string depending on the export; store one
+    # REAL per message (rowid = messages.rowid) so range predicates can use an index.
+    conn.execute("CREATE TABLE msg_time (rowid INTEGER PRIMARY KEY, ts REAL NOT NULL)")
+    conn.execute(
+        "INSERT INTO msg_time (rowid, ts) "
+        "SELECT rowid, COALESCE(ct_epoch(create_time), ?) FROM src.messages",
+        (UNDATED_TS,),
+    )
+    conn.execute("CREATE INDEX msg_time_ts ON msg_time (ts)")
+    # Row count for the planner: if the export has ANALYZE stats (e.g. from optimize) and
+    # msg_time had none, SQLite would assume ~1M rows here and build a Bloom filter over
+    # all of messages for a newest-first scan that reads a single page.
+    conn.execute("ANALYZE msg_time")
+    # Neighbour and id lookups for conversation_context, unless the export indexes them.
+    missing = {
+        name: columns
+        for name, columns in _CONTEXT_INDEXES.items()
+        if not has_index(conn, "src", "messages", columns)
+    }
+    if missing:
+        conn.execute(
+            "CREATE TABLE msg_pos (rowid INTEGER PRIMARY KEY, id TEXT, conversation_id TEXT, position INTEGER)"
+        )
+        conn.execute(
+            "INSERT INTO msg_pos (rowid, id, conversation_id, position) "
+            "SELECT rowid, id, conversation_id, position FROM src.messages"
+        )
+        for name, columns in missing.items():
+            conn.execute(f"CREATE INDEX {name} ON msg_pos ({', '.join(columns)})")
+    # Aggregates for conversation_stats (same message set as search: with a conversation).
+    conn.execute("CREATE TABLE agg_day (day INTEGER, role TEXT, n INTEGER NOT NULL)")
+    conn.execute(
+        """
+        INSERT INTO agg_day (day, role, n)
+        SELECT utc_day(t.ts), m.role, count(*)
+        FROM src.messages m
+        JOIN src.conversations c ON c.id = m.conversation_id
+        JOIN msg_time t ON t.rowid = m.rowid
+        GROUP BY 1, 2
+        """
+    )
+    conn.execute(
+        "CREATE TABLE agg_conv_day (conversation_id TEXT, day INTEGER, role TEXT, "
+        "n INTEGER NOT NULL, first_ts REAL, last_ts REAL)"
+    )
+    conn.execute(
+        """
+        INSERT INTO agg_conv_day (conversation_id, day, role, n, first_ts, last_ts)
+        SELECT m.conversation_id, utc_day(t.ts), m.role, count(*),
+               min(NULLIF(t.ts, ?)), max(NULLIF(t.ts, ?))
+        FROM src.messages m
+        JOIN src.conversations c ON c.id = m.conversation_id
+        JOIN msg_time t ON t.rowid = m.rowid
+        GROUP BY 1, 2, 3
+        """,
+        (UNDATED_TS, UNDATED_TS),
+    )
+    conn.execute("CREATE INDEX agg_conv_day_day ON agg_conv_day (day)")
+
+
+def _build_in_background(db_path: str, fingerprint: str) -> None:
+    try:
+        path = build_sidecar(db_path)
+        logger.info("Built search index %s", path)
+    except Exception as e:
+        logger.warning("Search index build failed for %s (using LIKE fallback): %s", db_path, e)
+        with _lock:
+            _failed[db_path] = fingerprint
+    finally:
+        with _lock:
+            _building.discard(db_path)
+
+
+def _current_sidecar(db_path: str, fingerprint: str) -> str | None:
+    """Return the sidecar path if an up-to-date sidecar for this DB version exists on disk."""
+    path = sidecar_path(db_path)
+    with _lock:
+        if _ready.get(db_path) == fingerprint and os.path.isfile(path):
+            return path
+    meta = read_meta(path)
+    if meta.get("version") == _SIDECAR_VERSION and meta.get("source_fingerprint") == fingerprint:
+        with _lock:
+            _ready[db_path] = fingerprint
+        return path
+    return None
+
+
+def ensure_sidecar(db_path: str) -> str | None:
+    """Return the sidecar path if it is built and current for db_path.
+
+    Otherwise start a background build (once per DB version) and return None so the
+    caller can fall back to a LIKE scan.
+    """
+    if not _index_enabled():
+        return None
+    try:
+        fingerprint = source_fingerprint(db_path)
+    except OSError:
+        return None
+    with _lock:
+        if db_path in _building or _failed.get(db_path) == fingerprint:
+            return None
+    path = _current_sidecar(db_path, fingerprint)
+    if path is not None:
+        return path
+    with _lock:
+        if db_path in _building:
+            return None
+        _building.add(db_path)
+    threading.Thread(
+        target=_build_in_background,
+        args=(db_path, fingerprint),
+        name="origin-conversation-index",
+        daemon=True,
+    ).start()
+    return None
+
+
+def prepare_sidecar(db_path: str) -> str | None:
+    """Make sure the sidecar for db_path is built, building it in the calling thread if needed.
+
+    Used to warm a new export before it is swapped in. Returns None if indexing is disabled
+    or the build fails (search then uses the LIKE fallback).
+    """
+    if not _index_enabled():
+        return None
+    fingerprint = source_fingerprint(db_path)
+    while True:
+        path = _current_sidecar(db_path, fingerprint)
+        if path is not None:
+            return path
+        with _lock:
+            if _failed.get(db_path) == fingerprint:
+                return None
+            if db_path not in _building:
+                _building.add(db_path)
+                break
+        time.sleep(_BUILD_WAIT_INTERVAL)  # a background build is running; wait for it
+    try:
+        return build_sidecar(db_path)
+    except Exception as e:
+        logger.warning("Search index build failed for %s (using LIKE fallback): %s", db_path, e)
+        with _lock:
+            _failed[db_path] = fingerprint
+        return None
+    finally:
+        with _lock:
+            _building.discard(db_path)
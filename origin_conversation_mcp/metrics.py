@@ -0,0 +1,274 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# origin_conversation - Low-overhead in-process search metrics.
+"""
+Per-stage timing histograms and counters for searches.
+
+conversation_search records where its time goes (resolve_db, cache_lookup, connect, plan,
+execute, format; plus text_candidates / vector in semantic mode) and call_tool records
+queue_wait and total per call, together with rows fetched from SQLite vs rows returned.
+Start-up is timed per stage too (server_init, and the warm-up stages in warmup.py).
+Histograms use fixed buckets, so an observation is a bisect and a few additions under
+a lock. render() produces the Prometheus text format (served on /metrics under --sse);
+summary() is the short form written to stderr when the stdio server exits.
+Set CONVERSATION_METRICS=0 to turn recording off. collect_stages() also sums one thread's
+stage timings while it is active (for the slow-query log), whether or not recording is on.
+"""
+import bisect
+import contextlib
+import os
+import threading
+import time
+from typing import Iterator
+
+# Upper bounds in seconds; an implicit +Inf bucket follows.
+_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _metrics_enabled() -> bool:
+    return os.environ.get("CONVERSATION_METRICS", "1").strip().lower() not in ("0", "off", "false", "no")
+
+
+_enabled = _metrics_enabled()
+
+
+class Histogram:
+    """Fixed-bucket histogram of seconds."""
+
+    def __init__(self, buckets: tuple[float, ...] = _BUCKETS) -> None:
+        self.buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        if not _enabled:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> tuple[list[int], float, int]:
+        """(per-bucket counts, sum, count); counts are not cumulative."""
+        with self._lock:
+            return list(self._counts), self._sum, self._count
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding quantile q (the largest finite bound for +Inf)."""
+        counts, _, count = self.snapshot()
+        if count == 0:
+            return 0.0
+        rank, seen = q * count, 0
+        for i, c in enumerate(counts):
+            seen += c
+            if seen >= rank:
+                return self.buckets[min(i, len(self.buckets) - 1)]
+        return self.buckets[-1]
+
+
+class Counter:
+    """Monotonic counter."""
+
+    def __init__(self) -> None:
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n: int = 1) -> None:
+        if not _enabled:
+            return
+        with self._lock:
+            self.value += n
+
+
+class Family:
+    """A named metric with at most one label; children are created on first use."""
+
+    def __init__(self, name: str, help_text: str, kind: str, label: str | None) -> None:
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.label = label
+        self._children: dict[str | None, Histogram | Counter] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, value: str | None = None):
+        child = self._children.get(value)
+        if child is None:
+            with self._lock:
+                child = self._children.get(value)
+                if child is None:
+                    child = Histogram() if self.kind == "histogram" else Counter()
+                    self._children[value] = child
+        return child
+
+    def children(self) -> list[tuple[str | None, Histogram | Counter]]:
+        with self._lock:
+            return sorted(self._children.items(), key=lambda kv: kv[0] or "")
+
+    def _labels(self, value: str | None, extra: str = "") -> str:
+        parts = [f'{self.label}="{value}"'] if self.label and value is not None else []
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Stopwatch:
+    """Accumulates elapsed time over several intervals (with blocks) for one observation."""
+
+    __slots__ = ("elapsed", "_start")
+
+    def __init__(self) -> None:
+        self.elapsed = 0.0
+        self._start = 0.0
+
+    def __enter__(self) -> "Stopwatch":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.elapsed += time.perf_counter() - self._start
+
+    def observe(self, family: Family, stage: str) -> None:
+        family.labels(stage).observe(self.elapsed)
+        _collect(stage, self.elapsed)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._families: list[Family] = []
+
+    def histogram(self, name: str, help_text: str, label: str | None = None) -> Family:
+        family = Family(name, help_text, "histogram", label)
+        self._families.append(family)
+        return family
+
+    def counter(self, name: str, help_text: str, label: str | None = None) -> Family:
+        family = Family(name, help_text, "counter", label)
+        self._families.append(family)
+        return family
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines: list[str] = []
+        for family in self._families:
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for value, child in family.children():
+                if isinstance(child, Counter):
+                    lines.append(f"{family.name}{family._labels(value)} {child.value}")
+                    continue
+                counts, total, count = child.snapshot()
+                cumulative = 0
+                for bound, c in zip((*child.buckets, None), counts):
+                    cumulative += c
+                    le = 'le="+Inf"' if bound is None else f'le="{bound!r}"'
+                    lines.append(f"{family.name}_bucket{family._labels(value, le)} {cumulative}")
+                lines.append(f"{family.name}_sum{family._labels(value)} {total}")
+                lines.append(f"{family.name}_count{family._labels(value)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """One line per histogram child (count, mean, p50/p95/p99 bucket bounds) and counter."""
+        lines: list[str] = []
+        for family in self._families:
+            for value, child in family.children():
+                name = family.name + (f"[{value}]" if value is not None else "")
+                if isinstance(child, Counter):
+                    lines.append(f"{name} {child.value}")
+                    continue
+                _, total, count = child.snapshot()
+                if not count:
+                    continue
+                lines.append(
+                    f"{name} count={count} mean={total / count * 1000:.2f}ms "
+                    f"p50<={child.quantile(0.5) * 1000:g}ms p95<={child.quantile(0.95) * 1000:g}ms "
+                    f"p99<={child.quantile(0.99) * 1000:g}ms"
+                )
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        """Drop all recorded values (e.g. between tests)."""
+        for family in self._families:
+            with family._lock:
+                family._children.clear()
+
+
+class _Timed:
+    __slots__ = ("_histogram", "_stage", "_start")
+
+    def __init__(self, histogram: Histogram, stage: str) -> None:
+        self._histogram = histogram
+        self._stage = stage
+
+    def __enter__(self) -> None:
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc: object) -> None:
+        elapsed = time.perf_counter() - self._start
+        self._histogram.observe(elapsed)
+        _collect(self._stage, elapsed)
+
+
+def timed(family: Family, stage: str) -> _Timed:
+    """Context manager observing the block's wall time into family's stage histogram."""
+    return _Timed(family.labels(stage), stage)
+
+
+_collecting = threading.local()
+
+
+@contextlib.contextmanager
+def collect_stages() -> Iterator[dict[str, float]]:
+    """Sum this thread's stage observations (seconds per stage) made during the block."""
+    previous = getattr(_collecting, "stages", None)
+    stages: dict[str, float] = {}
+    _collecting.stages = stages
+    try:
+        yield stages
+    finally:
+        _collecting.stages = previous
+
+
+def _collect(stage: str, seconds: float) -> None:
+    stages = getattr(_collecting, "stages", None)
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+registry = Registry()
+
+SEARCH_STAGE_SECONDS = registry.histogram(
+    "origin_conversation_search_stage_seconds",
+    "Time spent in each conversation_search stage.",
+    "stage",
+)
+CALL_STAGE_SECONDS = registry.histogram(
+    "origin_conversation_call_stage_seconds",
+    "call_tool time waiting for a search worker (queue_wait) and end to end (total).",
+    "stage",
+)
+TOOL_CALLS = registry.counter(
+    "origin_conversation_tool_calls_total",
+    "call_tool invocations by outcome.",
+    "outcome",
+)
+ROWS_FETCHED = registry.counter(
+    "origin_conversation_rows_fetched_total",
+    "Rows read from SQLite result sets (including the look-ahead row for next_cursor).",
+)
+ROWS_RETURNED = registry.counter(
+    "origin_conversation_rows_returned_total",
+    "Messages included in search results.",
+)
+STARTUP_SECONDS = registry.histogram(
+    "origin_conversation_startup_seconds",
+    "Start-up time by stage: server_init (process start to serving) and the warm-up stages.",
+    "stage",
+)
+COALESCED_CALLS = registry.counter(
+    "origin_conversation_coalesced_calls_total",
+    "call_tool invocations served by an identical call already in flight, by tool.",
+    "tool",
+)
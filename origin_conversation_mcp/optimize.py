@@ -0,0 +1,275 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# origin_conversation - Compile a canonical export into a read-tuned DB.
+"""
+Offline optimizer for canonical exports.
+
+ChatGPT Browser's export is laid out for writing it: no index on messages.create_time,
+role or conversation_id, no ANALYZE statistics, the default page size, and create_time
+stored as a mix of floats, ISO 8601 strings and NULL. optimize() writes a copy tuned for
+the searches this server runs and leaves the export untouched:
+
+1. VACUUM INTO a temp file next to the output, with page_size (default 8192: fewer
+   overflow pages for long messages).
+2. create_time rewritten as epoch seconds with ct_epoch(); values it cannot parse become
+   NULL, which search already treats as undated. Skipped if the column's declared type
+   would turn numbers back into text.
+3. Indexes, unless the export has one with the same leading columns: messages(create_time,
+   role) for newest-first scans, date ranges and role checks without a sort or a table
+   lookup per row; messages(conversation_id, position) and messages(id) for
+   conversation_context; conversations(id, title) for the title shown with each result.
+4. META_TABLE, recording that create_time holds epoch seconds. Pooled connections read it
+   (epoch_times()), so the LIKE / create_time plan compares m.create_time directly and
+   can seek the index instead of calling ct_epoch() on every row.
+5. ANALYZE, then the temp file is renamed to the output path.
+
+report() then times a standard query set drawn from the data (bench.run_case) on both
+files, with the sidecar index and without it (the plan used while the sidecar builds).
+
+    origin-conversation-mcp optimize export.db export.opt.db
+"""
+import argparse
+import collections
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable
+from urllib.parse import quote
+
+from .index import has_index
+
+META_TABLE = "origin_conversation_meta"
+
+_DEFAULT_PAGE_SIZE = 8192
+_DEFAULT_REPEATS = 20
+_INDEXES = (
+    ("messages_create_time_role", "messages", ("create_time", "role")),
+    ("messages_conversation_position", "messages", ("conversation_id", "position")),
+    ("messages_id", "messages", ("id",)),
+    ("conversations_id_title", "conversations", ("id", "title")),
+)
+# Messages sampled (evenly by rowid) to pick the query words of the standard query set.
+_SAMPLE_MESSAGES = 1000
+_WORD = re.compile(r"[^\W\d_]{4,}")
+_RECENT_DAYS = 30
+
+
+def epoch_times(conn: sqlite3.Connection) -> bool:
+    """Whether the DB on conn was written by optimize() with create_time as epoch seconds."""
+    try:
+        row = conn.execute(f"SELECT value FROM {META_TABLE} WHERE key = 'create_time'").fetchone()
+    except sqlite3.Error:  # no such table: a plain export
+        return False
+    return row is not None and row[0] == "epoch"
+
+
+def _keeps_reals(declared_type: str) -> bool:
+    """Whether a column declared with this type stores REAL values as numbers (not TEXT affinity)."""
+    declared = declared_type.upper()
+    return "INT" in declared or not any(t in declared for t in ("CHAR", "CLOB", "TEXT"))
+
+
+def optimize(
+    in_path: str,
+    out_path: str,
+    page_size: int = _DEFAULT_PAGE_SIZE,
+    force: bool = False,
+    log: Callable[[str], None] | None = None,
+) -> dict[str, Any]:
+    """Write the read-tuned copy of in_path to out_path; return what was done.
+
+    Raises FileNotFoundError if in_path is missing and FileExistsError if out_path exists
+    (unless force).
+    """
+    from .search import _create_time_comparable
+
+    if not os.path.isfile(in_path):
+        raise FileNotFoundError(f"Database not found: {in_path}")
+    if os.path.exists(out_path) and not force:
+        raise FileExistsError(f"{out_path} exists; pass --force to replace it.")
+    if os.path.abspath(in_path) == os.path.abspath(out_path):
+        raise ValueError("The output must be a different file from the input.")
+    started = time.perf_counter()
+    tmp = f"{out_path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    summary: dict[str, Any] = {"page_size": page_size, "bytes_before": os.path.getsize(in_path)}
+    try:
+        if log:
+            log(f"copying {in_path} (VACUUM INTO, page_size {page_size})")
+        src = sqlite3.connect(f"file:{quote(os.path.abspath(in_path), safe='/')}?mode=ro", uri=True)
+        try:
+            src.execute(f"PRAGMA page_size = {int(page_size)}")
+            src.execute("VACUUM INTO ?", (tmp,))
+        finally:
+            src.close()
+
+        conn = sqlite3.connect(tmp)
+        try:
+            # A temp file renamed into place only on success: no journal needed.
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.create_function("ct_epoch", 1, _create_time_comparable, deterministic=True)
+            declared = {row[1]: row[2] or "" for row in conn.execute("PRAGMA table_info(messages)")}
+            summary["normalized_rows"] = None
+            if _keeps_reals(declared.get("create_time", "")):
+                if log:
+                    log("normalizing create_time to epoch seconds")
+                cur = conn.execute(
+                    "UPDATE messages SET create_time = ct_epoch(create_time) "
+                    "WHERE create_time IS NOT NULL AND typeof(create_time) NOT IN ('real', 'integer')"
+                )
+                summary["normalized_rows"] = cur.rowcount
+            elif log:
+                log(f"create_time is declared {declared['create_time']!r}; leaving it as stored")
+            summary["indexes"] = []
+            for name, table, columns in _INDEXES:
+                if has_index(conn, "main", table, columns):
+                    continue
+                if log:
+                    log(f"creating index {name} on {table}({', '.join(columns)})")
+                conn.execute(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+                summary["indexes"].append(name)
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {META_TABLE} (key TEXT PRIMARY KEY, value TEXT)")
+            meta = {
+                "source": os.path.basename(in_path),
+                "optimized_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "page_size": str(page_size),
+            }
+            if summary["normalized_rows"] is not None:
+                meta["create_time"] = "epoch"
+            conn.executemany(f"INSERT OR REPLACE INTO {META_TABLE} (key, value) VALUES (?, ?)", meta.items())
+            conn.commit()
+            if log:
+                log("ANALYZE")
+            conn.execute("ANALYZE")
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp, out_path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    summary["bytes_after"] = os.path.getsize(out_path)
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def query_set(db_path: str) -> dict[str, dict[str, Any]]:
+    """Standard conversation_search cases for db_path: recent pages, roles, dates and words from its messages."""
+    conn = sqlite3.connect(f"file:{quote(os.path.abspath(db_path), safe='/')}?mode=ro", uri=True)
+    try:
+        newest = None
+        if epoch_times(conn):
+            newest = conn.execute("SELECT max(create_time) FROM messages").fetchone()[0]
+        max_rowid = conn.execute("SELECT max(rowid) FROM messages").fetchone()[0] or 0
+        step = max(1, max_rowid // _SAMPLE_MESSAGES)
+        counts: collections.Counter[str] = collections.Counter()
+        for (content,) in conn.execute("SELECT content FROM messages WHERE rowid % ? = 0 LIMIT ?", (step, _SAMPLE_MESSAGES)):
+            counts.update(w.lower() for w in _WORD.findall(content or ""))
+    finally:
+        conn.close()
+    cases: dict[str, dict[str, Any]] = {
+        "newest": {},
+        "roles_only": {"roles": ["assistant"]},
+    }
+    dates: dict[str, str] = {}
+    if isinstance(newest, (int, float)):
+        end = datetime.fromtimestamp(newest, tz=timezone.utc)
+        start = datetime.fromtimestamp(newest - _RECENT_DAYS * 86400, tz=timezone.utc)
+        dates = {"start_date": start.strftime("%Y-%m-%d"), "end_date": end.strftime("%Y-%m-%d")}
+        cases["date_range_only"] = dict(dates)
+    ranked = [word for word, count in sorted(counts.items(), key=lambda wc: (-wc[1], wc[0])) if count >= 2]
+    if ranked:
+        common, rare = ranked[0], ranked[len(ranked) * 3 // 4]
+        cases["query_common"] = {"query": common}
+        cases["query_rare"] = {"query": rare}
+        cases["query_roles_date_range"] = {"query": common, "roles": ["user"], **dates}
+        cases["query_substring"] = {"query": rare, "mode": "substring"}
+    return cases
+
+
+def report(in_path: str, out_path: str, repeats: int = _DEFAULT_REPEATS, log: Callable[[str], None] | None = None) -> list[dict[str, Any]]:
+    """Latency of query_set(out_path) on both DBs, with the sidecar index ("indexed") and without ("scan").
+
+    Building the sidecars (in_path's too, if it has none yet) happens before the timings.
+    """
+    from . import bench
+
+    cases = query_set(out_path)
+    saved = {key: os.environ.get(key) for key in ("CONVERSATION_DB", "CONVERSATION_INDEX")}
+    results = []
+    try:
+        for plan, index_setting in (("indexed", "1"), ("scan", "0")):
+            os.environ["CONVERSATION_INDEX"] = index_setting
+            for name, params in cases.items():
+                if log:
+                    log(f"timing {name} ({plan})")
+                before = bench.run_case(in_path, params, repeats)
+                after = bench.run_case(out_path, params, repeats)
+                results.append({"case": name, "plan": plan, "params": params, "before": before, "after": after})
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+    return results
+
+
+def format_report(summary: dict[str, Any], results: list[dict[str, Any]]) -> list[str]:
+    """Human-readable summary and a p50 / p95 before-after table."""
+    lines = [
+        f"page_size {summary['page_size']}; {summary['bytes_before']:,} -> {summary['bytes_after']:,} bytes; "
+        f"create_time normalized in {summary['normalized_rows'] if summary['normalized_rows'] is not None else 'no'} rows; "
+        f"indexes added: {', '.join(summary['indexes']) or 'none'} ({summary['seconds']:.1f} s)",
+    ]
+    if results:
+        lines.append(f"{'case':<24} {'plan':<8} {'p50 before':>11} {'p50 after':>10} {'p95 before':>11} {'p95 after':>10} {'speedup':>8}")
+    for r in results:
+        before, after = r["before"], r["after"]
+        speedup = before["p50_ms"] / after["p50_ms"] if after["p50_ms"] else float("inf")
+        lines.append(
+            f"{r['case']:<24} {r['plan']:<8} {before['p50_ms']:>9.2f}ms {after['p50_ms']:>8.2f}ms "
+            f"{before['p95_ms']:>9.2f}ms {after['p95_ms']:>8.2f}ms {speedup:>7.1f}x"
+        )
+    return lines
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="origin-conversation-mcp optimize",
+        description="Write a copy of a canonical export tuned for conversation_search, then compare latencies.",
+    )
+    parser.add_argument("in_db", help="Canonical export to read (not modified)")
+    parser.add_argument("out_db", help="Optimized DB to write")
+    parser.add_argument("--page-size", type=int, default=_DEFAULT_PAGE_SIZE, help=f"SQLite page size (default {_DEFAULT_PAGE_SIZE})")
+    parser.add_argument("--repeats", type=int, default=_DEFAULT_REPEATS, help=f"Timed runs per query (default {_DEFAULT_REPEATS})")
+    parser.add_argument("--no-report", action="store_true", help="Skip the before/after timings")
+    parser.add_argument("--json", default=None, help="Also write the summary and timings as JSON to this path")
+    parser.add_argument("--force", action="store_true", help="Replace out_db if it exists")
+    args = parser.parse_args(argv)
+
+    def log(msg: str) -> None:
+        print(msg, file=sys.stderr)
+
+    try:
+        summary = optimize(args.in_db, args.out_db, args.page_size, args.force, log)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"optimize: {e}", file=sys.stderr)
+        return 1
+    results = [] if args.no_report else report(args.in_db, args.out_db, max(1, args.repeats), log)
+    print("\n".join(format_report(summary, results)))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "results": results}, f, indent=2)
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# origin_conversation - Substring, regex and fuzzy matching over the trigram index.
+"""
+Matching for the substring, regex and fuzzy search modes.
+
+The sidecar's msg_tri table (see index.py) indexes every 3-character window of message
+content and conversation titles (FTS5 trigram tokenizer, case-insensitive, no positions).
+Each mode derives an FTS5 MATCH expression that every matching message must satisfy, so
+only candidates are read, and an exact check that search applies to them:
+
+- substring: literal, ASCII case-insensitive (LIKE semantics with % and _ taken
+  literally); candidates contain all of the query's trigrams.
+- regex: Python re syntax (case-sensitive unless (?i)); candidates contain the trigrams
+  of the literal runs every match must include (alternatives are OR'ed).
+- fuzzy: case-insensitive substring within max_edits(query) edits (Levenshtein), checked
+  with Myers' bit-parallel algorithm. A match with k edits contains one of k + 1 pieces
+  of the query exactly, so candidates contain all trigrams of at least one piece.
+
+A MATCH expression of None means the pattern has nothing to narrow by (e.g. under three
+characters); every message is then a candidate.
+"""
+import functools
+import re
+from typing import Any, Callable
+
+try:
+    from re import _parser as _sre_parse  # Python 3.11+
+except ImportError:  # pragma: no cover
+    import sre_parse as _sre_parse  # type: ignore[no-redef]
+
+_TRIGRAM = 3
+# Upper bound on the terms of one AND group; a subset of required trigrams still only
+# selects supersets of the matches, and longer groups add lookups without narrowing much.
+_MAX_TRIGRAMS = 32
+# Fuzzy queries of at least this many characters allow 1, then 2 edits.
+_FUZZY_ONE_EDIT = 6
+_FUZZY_TWO_EDITS = 12
+
+
+def _quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _all_trigrams(text: str) -> str | None:
+    """MATCH expression requiring every trigram of text; None if text is shorter than a trigram."""
+    grams = list(dict.fromkeys(text[i : i + _TRIGRAM] for i in range(len(text) - _TRIGRAM + 1)))
+    if not grams:
+        return None
+    if len(grams) > _MAX_TRIGRAMS:
+        step = len(grams) / _MAX_TRIGRAMS
+        grams = [grams[int(i * step)] for i in range(_MAX_TRIGRAMS)]
+    return " AND ".join(_quote(g) for g in grams)
+
+
+def like_pattern(query: str) -> str:
+    """LIKE pattern (with ESCAPE '\\') matching query literally anywhere in a string."""
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def substring_filter(query: str) -> str | None:
+    """MATCH expression for messages that may contain query (all its trigrams)."""
+    return _all_trigrams(query)
+
+
+@functools.lru_cache(maxsize=256)
+def compile_regex(query: str) -> re.Pattern:
+    """Compile a regex query; raises ValueError if it is invalid."""
+    try:
+        return re.compile(query)
+    except re.error as e:
+        raise ValueError(f"Invalid regex {query!r}: {e}") from None
+
+
+def regex_filter(regex: re.Pattern) -> str | None:
+    """MATCH expression for messages that may match regex (trigrams of its required literals)."""
+    try:
+        terms = _required_terms(_sre_parse.parse(regex.pattern, regex.flags))
+    except Exception:  # an unfamiliar parse tree only costs the narrowing
+        return None
+    return _and(terms) if terms else None
+
+
+def _and(terms: list[str]) -> str:
+    return terms[0] if len(terms) == 1 else " AND ".join(f"({t})" for t in terms)
+
+
+def _required_terms(items: Any) -> list[str]:
+    """MATCH expressions that text matching the parsed regex items must all satisfy."""
+    terms: list[str] = []
+    run: list[str] = []
+
+    def flush() -> None:
+        expr = _all_trigrams("".join(run))
+        if expr is not None:
+            terms.append(expr)
+        run.clear()
+
+    for op, av in items:
+        if op is _sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        if op is _sre_parse.AT:
+            continue  # zero-width: the literals around it are adjacent in the text
+        flush()
+        if op is _sre_parse.SUBPATTERN:
+            terms.extend(_required_terms(av[-1]))
+        elif op in (_sre_parse.MAX_REPEAT, _sre_parse.MIN_REPEAT) and av[0] >= 1:
+            terms.extend(_required_terms(av[2]))
+        elif op is _sre_parse.BRANCH:
+            alternatives = [_required_terms(alt) for alt in av[1]]
+            if all(alternatives):
+                terms.append(" OR ".join(f"({_and(alt)})" for alt in alternatives))
+    flush()
+    return terms
+
+
+def regex_matcher(regex: re.Pattern) -> Callable[[str | None], bool]:
+    """Exact check: whether text contains a match of regex."""
+    return lambda text: text is not None and regex.search(text) is not None
+
+
+def max_edits(query: str) -> int:
+    """Edits a fuzzy query tolerates: 0 under 6 characters, 1 under 12, else 2."""
+    if len(query) < _FUZZY_ONE_EDIT:
+        return 0
+    return 1 if len(query) < _FUZZY_TWO_EDITS else 2
+
+
+def _pieces(needle: str, k: int) -> list[tuple[int, str]]:
+    """needle split into k + 1 contiguous pieces of near-equal length, with their offsets."""
+    n = k + 1
+    bounds = [len(needle) * i // n for i in range(n + 1)]
+    return [(bounds[i], needle[bounds[i] : bounds[i + 1]]) for i in range(n)]
+
+
+def fuzzy_filter(query: str) -> str | None:
+    """MATCH expression for messages that may match query within max_edits(query) edits."""
+    needle = query.lower()
+    groups = [_all_trigrams(piece) for _, piece in _pieces(needle, max_edits(needle))]
+    if not all(groups):
+        return None
+    return " OR ".join(f"({g})" for g in groups) if len(groups) > 1 else groups[0]
+
+
+def fuzzy_matcher(query: str) -> Callable[[str | None], bool]:
+    """Exact check: whether text contains query (case-insensitively) within max_edits(query) edits.
+
+    Only windows around an exact occurrence of one of the k + 1 pieces can hold a match,
+    so the bit-parallel scan runs on those alone.
+    """
+    needle = query.lower()
+    k = max_edits(needle)
+    m = len(needle)
+    pieces = _pieces(needle, k)
+
+    def matches(text: str | None) -> bool:
+        if not text:
+            return False
+        hay = text.lower()
+        if k == 0:
+            return needle in hay
+        for start, piece in pieces:
+            pos = hay.find(piece)
+            while pos >= 0:
+                lo = max(0, pos - start - k)
+                if within_edits(needle, hay[lo : pos - start + m + k], k):
+                    return True
+                pos = hay.find(piece, pos + 1)
+        return False
+
+    return matches
+
+
+def fuzzy_spans(query: str, text: str) -> list[tuple[int, int]]:
+    """Approximate (start, end) offsets in text of fuzzy matches of query (for highlighting)."""
+    needle = query.lower()
+    hay = text.lower()
+    if len(hay) != len(text):  # lowercasing changed offsets
+        return []
+    k = max_edits(needle)
+    m = len(needle)
+    spans = set()
+    for start, piece in _pieces(needle, k):
+        pos = hay.find(piece)
+        while pos >= 0:
+            lo = max(0, pos - start - k)
+            end = match_end(needle, hay[lo : pos - start + m + k], k)
+            if end >= 0:
+                # Scanning back from the end with the reversed pattern finds where it starts.
+                length = match_end(needle[::-1], hay[lo : lo + end][::-1], k)
+                spans.add((lo + end - length, lo + end))
+            pos = hay.find(piece, pos + 1)
+    return sorted(spans)
+
+
+def within_edits(pattern: str, text: str, k: int) -> bool:
+    """Whether some substring of text is within k edits of pattern (Myers, 1999)."""
+    return match_end(pattern, text, k) >= 0
+
+
+def match_end(pattern: str, text: str, k: int) -> int:
+    """Offset just past the first substring of text within k edits of pattern; -1 if none."""
+    m = len(pattern)
+    if m <= k:
+        return 0
+    peq: dict[str, int] = {}
+    for i, ch in enumerate(pattern):
+        peq[ch] = peq.get(ch, 0) | (1 << i)
+    mask = (1 << m) - 1
+    high = 1 << (m - 1)
+    pv, mv, score = mask, 0, m
+    for j, ch in enumerate(text):
+        eq = peq.get(ch, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        if score <= k:
+            return j + 1
+        ph = (ph << 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+    return -1
+
@@ -0,0 +1,155 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# origin_conversation - Process-wide read-only SQLite connection pool.
+"""
+Long-lived read-only connections to the canonical DB, so the page cache and parsed schema
+survive across searches. Connections are tuned with mmap_size, cache_size and query_only.
+There is one pool per DB path (several in federated search), each tied to one DB identity
+(path, inode, mtime): when the file is replaced or modified, its idle connections are closed
+and new ones opened. retain() drains pools for paths no longer being searched (e.g. after
+the watcher switched to a newer export). Connections still checked out from a drained pool
+are closed when released.
+"""
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+from urllib.parse import quote
+
+from . import deadline, metrics
+from .index import utc_day
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_MMAP_SIZE = 256 * 1024 * 1024
+_DEFAULT_CACHE_KIB = 64 * 1024
+_DEFAULT_MAX_IDLE = 4
+
+
+def _env_int(key: str, default: int) -> int:
+    """Parse int from environment; on invalid or empty value return default."""
+    try:
+        return int(os.environ.get(key, str(default)))
+    except ValueError:
+        return default
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3.Connection that remembers which sidecar index is attached as schema ix.
+
+    epoch_times: the DB was written by optimize (create_time holds epoch seconds).
+    """
+
+    index_path: str | None = None
+    epoch_times: bool = False
+
+
+def _db_identity(db_path: str) -> tuple[str, int, int]:
+    st = os.stat(db_path)
+    return (db_path, st.st_ino, st.st_mtime_ns)
+
+
+def _open(db_path: str) -> PooledConnection:
+    from .optimize import epoch_times
+    from .search import _create_time_comparable
+
+    uri = f"file:{quote(db_path, safe='')}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False, factory=PooledConnection)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA mmap_size = {_env_int('CONVERSATION_MMAP_SIZE', _DEFAULT_MMAP_SIZE)}")
+    conn.execute(f"PRAGMA cache_size = -{_env_int('CONVERSATION_CACHE_KIB', _DEFAULT_CACHE_KIB)}")
+    conn.execute("PRAGMA query_only = 1")
+    conn.create_function("ct_epoch", 1, _create_time_comparable, deterministic=True)
+    conn.create_function("utc_day", 1, utc_day, deterministic=True)
+    conn.epoch_times = epoch_times(conn)
+    return conn
+
+
+class ConnectionPool:
+    """Idle read-only connections for one DB identity."""
+
+    def __init__(self, identity: tuple[str, int, int], max_idle: int) -> None:
+        self.identity = identity
+        self.max_idle = max_idle
+        self.closed = False
+        self._idle: list[PooledConnection] = []
+        self._lock = threading.Lock()
+
+    @property
+    def db_path(self) -> str:
+        return self.identity[0]
+
+    def get(self) -> PooledConnection:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return _open(self.db_path)
+
+    def put(self, conn: PooledConnection) -> None:
+        with self._lock:
+            if not self.closed and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def drain(self) -> None:
+        with self._lock:
+            self.closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_lock = threading.Lock()
+_pools: dict[str, ConnectionPool] = {}
+
+
+def get_pool(db_path: str) -> ConnectionPool:
+    """Return the pool for db_path, draining and replacing it if the DB identity changed."""
+    identity = _db_identity(db_path)
+    with _lock:
+        pool = _pools.get(db_path)
+        if pool is not None and pool.identity == identity:
+            return pool
+        new_pool = ConnectionPool(identity, _env_int("CONVERSATION_POOL_SIZE", _DEFAULT_MAX_IDLE))
+        _pools[db_path] = new_pool
+    if pool is not None:
+        logger.info("Database %s changed; reopening connections.", db_path)
+        pool.drain()
+    return new_pool
+
+
+def retain(db_paths: list[str]) -> None:
+    """Drain the pools of every path not in db_paths (the DBs currently being searched)."""
+    with _lock:
+        stale = [p for p in _pools if p not in db_paths]
+        drained = [_pools.pop(p) for p in stale]
+    for pool in drained:
+        logger.info("Database %s no longer searched; closing its connections.", pool.db_path)
+        pool.drain()
+
+
+@contextmanager
+def connection(db_path: str) -> Iterator[PooledConnection]:
+    """Borrow a read-only connection to db_path for the duration of the block.
+
+    Its statements are aborted once the thread's current deadline (if any) stops.
+    """
+    with metrics.timed(metrics.SEARCH_STAGE_SECONDS, "connect"):
+        pool = get_pool(db_path)
+        conn = pool.get()
+    try:
+        with deadline.watch(conn):
+            yield conn
+    finally:
+        pool.put(conn)
+
+
+def close_all() -> None:
+    """Drain every pool (e.g. at shutdown or between tests)."""
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.drain()
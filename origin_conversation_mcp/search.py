@@ -3,43 +3,111 @@
 """
 Search canonical conversation DB: text filter, role filter, date range, limit.
 Returns formatted message list with timestamps and content.
-Date filtering is applied in-process after fetching up to _FETCH_LIMIT_WITH_DATE rows;
-DB is assumed local and small.
+Text queries go through the sidecar FTS5 index (see index.py) and are ranked by BM25
+blended with recency; while the index is building, a LIKE scan ordered by time is used.
+Date ranges are applied in SQL: against the sidecar's indexed epoch column (msg_time) when
+the index is ready, else through the ct_epoch() SQL function over create_time.
+mode="semantic" fuses that text ranking with a local vector search (semantic.py) by
+reciprocal rank fusion.
+mode="substring" / "regex" / "fuzzy" match literal text, a regular expression or text
+within a few typos (see patterns.py), newest first; with the sidecar ready, its trigram
+index narrows the messages checked to the pattern's candidates.
+With snippet_chars, each result shows windows of content around its matches rather than
+its first characters (see snippets.py).
+Pagination is keyset-based: a full page ends with an opaque next_cursor encoding the sort
+key and rowid of its last row, and the next page seeks past it instead of using OFFSET.
+Federated search (several DBs as shards; see _get_db_paths) runs the same SQL on every
+shard in parallel and k-way merges the ordered rows, stepping each shard's cursor only as
+far as the merge needs; its next_cursor also records the shard of the last row.
+With CONVERSATION_IN_MEMORY=1, single-DB newest-first searches (substring mode, text mode
+without a query) are served from an in-memory columnar snapshot (snapshot.py) once loaded.
 """
+import base64
+import contextlib
+import functools
+import heapq
+import json
 import os
 import re
 import sqlite3
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable, Iterable, NamedTuple
 from urllib.parse import quote
 
-# Fetch/display limits and time constants
-_FETCH_LIMIT_WITH_DATE = 5000
-_FETCH_LIMIT_NO_DATE_FACTOR = 3
-_FETCH_LIMIT_NO_DATE_CAP = 500
+from . import deadline, executor, index, metrics, patterns, pool, semantic, slowlog, snapshot, snippets, watcher
+from .cache import result_cache
+
+# Display limits and time constants
 _CONTENT_DISPLAY_MAX = 2000
 _SECONDS_PER_DAY = 86400
 _END_OF_DAY_EPSILON = 0.001
 
+# Ranking: BM25 column weights (content, title) and recency blend for text queries.
+# score = bm25 * (1 + _RECENCY_WEIGHT * recency), recency in (0, 1] halving every
+# _RECENCY_HALF_LIFE_DAYS before the newest message in the DB. BM25 is negative (lower
+# is better), so recent matches move up.
+_BM25_WEIGHTS = (1.0, 0.5)
+_RECENCY_WEIGHT = 0.5
+_RECENCY_HALF_LIFE_DAYS = 180.0
+
+# Search modes. semantic fuses the text ranking with a vector ranking (see semantic.py),
+# each taking the top max(limit * _FUSION_DEPTH_FACTOR, _FUSION_DEPTH_MIN) candidates.
+# The pattern modes match exactly (see patterns.py) and order by time.
+MODE_TEXT = "text"
+MODE_SEMANTIC = "semantic"
+MODE_SUBSTRING = "substring"
+MODE_REGEX = "regex"
+MODE_FUZZY = "fuzzy"
+SEARCH_MODES = (MODE_TEXT, MODE_SEMANTIC, MODE_SUBSTRING, MODE_REGEX, MODE_FUZZY)
+_PATTERN_MODES = (MODE_SUBSTRING, MODE_REGEX, MODE_FUZZY)
+# A pattern with at least this many trigram candidates is too common to narrow by: it is
+# checked newest first instead, stopping at limit + 1 matches.
+_TRIGRAM_CANDIDATES_MAX = 5000
+_FUSION_DEPTH_FACTOR = 3
+_FUSION_DEPTH_MIN = 50
+
+
+@functools.lru_cache(maxsize=None)
+def _db_dir(module_file: str) -> Path:
+    return Path(module_file).resolve().parent.parent / "db"
+
 
 def _get_db_path() -> str:
     """Resolve path to canonical export SQLite DB.
 
     If CONVERSATION_DB or ORIGIN_CONVERSATION_DB is set and the path is an existing file,
-    that file is used. Otherwise the latest db/*.db (by mtime) is used.
+    that file is used. Otherwise the latest db/*.db (by mtime) is used; it is resolved once
+    and then kept current by a watcher that swaps in newer exports (see watcher.py).
     """
     env_path = os.environ.get("CONVERSATION_DB") or os.environ.get("ORIGIN_CONVERSATION_DB")
     if env_path and os.path.isfile(env_path):
         return env_path
-    base = Path(__file__).resolve().parent.parent
-    db_dir = base / "db"
-    if not db_dir.is_dir():
-        raise FileNotFoundError(f"db/ directory not found: {db_dir}")
-    candidates = sorted(db_dir.glob("*.db"), key=lambda p: p.stat().st_mtime, reverse=True)
-    if not candidates:
-        raise FileNotFoundError(f"No *.db file in {db_dir}")
-    return str(candidates[0])
+    return watcher.resolve(_db_dir(__file__))
+
+
+def _federated_enabled() -> bool:
+    """Federated search over every db/*.db is on if CONVERSATION_FEDERATED is 1/on/true/yes."""
+    return os.environ.get("CONVERSATION_FEDERATED", "").strip().lower() in ("1", "on", "true", "yes")
+
+
+def _get_db_paths() -> list[str]:
+    """Resolve the DBs to search: one path, or several shards for federated search.
+
+    CONVERSATION_DB (or ORIGIN_CONVERSATION_DB) may list several paths separated by
+    os.pathsep (":" on Unix, ";" on Windows); the existing ones are searched as shards.
+    With CONVERSATION_FEDERATED set and no single-file override, every db/*.db is a shard
+    (kept current by the watcher). Otherwise this is [_get_db_path()].
+    """
+    env_path = os.environ.get("CONVERSATION_DB") or os.environ.get("ORIGIN_CONVERSATION_DB")
+    if env_path and os.pathsep in env_path:
+        paths = [p.strip() for p in env_path.split(os.pathsep)]
+        shards = list(dict.fromkeys(p for p in paths if p and os.path.isfile(p)))
+        if shards:
+            return shards
+    elif _federated_enabled() and not (env_path and os.path.isfile(env_path)):
+        return list(watcher.resolve_all(_db_dir(__file__)))
+    return [_get_db_path()]
 
 
 def _parse_iso_to_float(s: str | None) -> float | None:
@@ -84,6 +152,285 @@ def _create_time_comparable(create_time: Any) -> float | None:
     return _parse_iso_to_float(s)
 
 
+def _fts_query(query: str) -> str | None:
+    """Translate free text into an FTS5 MATCH expression: every word must match (as a prefix).
+
+    Words are quoted so FTS5 operators and punctuation in user input are never interpreted.
+    Returns None if the query has no indexable words.
+    """
+    tokens = re.findall(r"\w+", query)
+    if not tokens:
+        return None
+    return " ".join(f'"{t}"*' for t in tokens)
+
+
+def _recency_fn(max_ts: float | None):
+    """Return recency(epoch) -> (0, 1], halving every _RECENCY_HALF_LIFE_DAYS before max_ts."""
+    half_life = _RECENCY_HALF_LIFE_DAYS * _SECONDS_PER_DAY
+
+    def recency(ts: float | None) -> float:
+        if ts is None or max_ts is None or ts <= index.UNDATED_TS:
+            return 0.0
+        return 0.5 ** (max(0.0, max_ts - ts) / half_life)
+
+    return recency
+
+
+def _attach_index(conn: pool.PooledConnection, db_path: str) -> bool:
+    """Attach the sidecar index as schema ix if it is ready; return whether it is attached.
+
+    Pooled connections keep the sidecar attached across searches.
+    """
+    path = index.ensure_sidecar(db_path)
+    if path is None:
+        return False
+    if conn.index_path == path:
+        return True
+    try:
+        if conn.index_path is not None:
+            conn.execute("DETACH DATABASE ix")
+            conn.index_path = None
+        conn.execute("ATTACH DATABASE ? AS ix", (f"file:{quote(path, safe='')}?mode=ro",))
+    except sqlite3.Error:
+        return False
+    conn.index_path = path
+    return True
+
+
+def _index_max_ts(conn: sqlite3.Connection) -> float | None:
+    """Newest message epoch recorded in the attached index (None if the DB has no timestamps)."""
+    row = conn.execute("SELECT value FROM ix.meta WHERE key = 'max_ts'").fetchone()
+    return float(row[0]) if row and row[0] else None
+
+
+def _date_range(start_date: str | None, end_date: str | None) -> tuple[float | None, float | None]:
+    """Parse start/end dates to inclusive epoch bounds; a date-only end_date covers the whole day."""
+    start_ts = _parse_iso_to_float(start_date) if start_date else None
+    end_ts = _parse_iso_to_float(end_date) if end_date else None
+    if end_ts is not None and end_date and re.match(r"^\d{4}-\d{2}-\d{2}$", end_date.strip()):
+        end_ts = end_ts + _SECONDS_PER_DAY - _END_OF_DAY_EPSILON
+    return start_ts, end_ts
+
+
+class SearchKey(NamedTuple):
+    """Normalized conversation_search arguments (hashable; used as the result cache key)."""
+
+    query: str | None
+    roles: tuple[str, ...] | None
+    start_ts: float | None
+    end_ts: float | None
+    limit: int
+    cursor: str | None = None
+    max_bytes: int | None = None
+    mode: str = MODE_TEXT
+    snippet_chars: int | None = None
+
+
+def search_key(
+    query: str | None,
+    roles: list[str] | None,
+    start_date: str | None,
+    end_date: str | None,
+    limit: int,
+    cursor: str | None = None,
+    max_bytes: int | None = None,
+    mode: str | None = None,
+    snippet_chars: int | None = None,
+) -> SearchKey:
+    """Normalized search arguments: equivalent calls (whitespace, role order, date spelling) map to one key.
+
+    Raises ValueError for an unknown mode, a pattern mode without a query or an invalid regex.
+    """
+    mode = mode or MODE_TEXT
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown mode {mode!r}. Allowed: {', '.join(SEARCH_MODES)}.")
+    q = query.strip() if query else ""
+    if mode in _PATTERN_MODES and not q:
+        raise ValueError(f"mode {mode!r} requires a query.")
+    if mode == MODE_REGEX:
+        patterns.compile_regex(q)
+    return SearchKey(
+        q or None,
+        tuple(sorted(set(roles))) if roles else None,
+        *_date_range(start_date, end_date),
+        limit,
+        cursor.strip() if cursor and cursor.strip() else None,
+        max_bytes,
+        mode,
+        snippet_chars if snippet_chars and snippet_chars > 0 else None,
+    )
+
+
+def _db_identity(db_path: str) -> tuple:
+    """Identity of everything a result depends on: the DB file and whether its sidecar / snapshot is in use."""
+    return (
+        pool._db_identity(db_path),
+        index.ensure_sidecar(db_path) is not None,
+        snapshot.is_loaded(db_path),
+    )
+
+
+_SELECT_COLUMNS = """
+    SELECT m.rowid AS msg_rowid, m.id, m.conversation_id, m.role, m.content, m.create_time,
+           m.position, c.title AS conversation_title
+"""
+
+# Result orderings a cursor can continue: relevance (score ASC), sidecar time (ts DESC) and
+# raw create_time DESC (LIKE fallback while the index builds). Ties break on rowid.
+_ORDER_RELEVANCE = "r"
+_ORDER_TIME = "t"
+_ORDER_RAW_TIME = "c"
+_SORT_COLUMN = {_ORDER_RELEVANCE: "score", _ORDER_TIME: "ts", _ORDER_RAW_TIME: "create_time"}
+_NEXT_CURSOR_PREFIX = "next_cursor: "
+_RESULT_SEPARATOR = "\n\n---\n\n"
+_NO_RESULTS_STOPPED = "No matching messages found before the search stopped."
+
+# conversation_search_batch: sections are "=== Query N: <description>" + result.
+_BATCH_MAX_QUERIES = 20
+_BATCH_HEADER_PREFIX = "=== Query "
+_BATCH_SEPARATOR = "\n\n"
+
+
+def _encode_cursor(order: str, sort_key: Any, rowid: int, shard: str | None = None) -> str:
+    fields = [order, sort_key, rowid] if shard is None else [order, sort_key, rowid, shard]
+    raw = json.dumps(fields, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[str, Any, int, str | None]:
+    """Decode a next_cursor token to (order, sort_key, rowid, shard); raises ValueError if malformed.
+
+    shard is None for single-DB cursors.
+    """
+    try:
+        padded = cursor.strip() + "=" * (-len(cursor.strip()) % 4)
+        fields = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        order, sort_key, rowid = fields[:3]
+        shard = fields[3] if len(fields) == 4 else None
+        if len(fields) not in (3, 4):
+            raise ValueError(fields)
+    except (ValueError, TypeError, UnicodeError) as e:
+        raise ValueError("Invalid cursor; pass next_cursor from a previous result unchanged.") from e
+    if (
+        order not in (_ORDER_RELEVANCE, _ORDER_TIME, _ORDER_RAW_TIME)
+        or not isinstance(rowid, int)
+        or not isinstance(shard, (str, type(None)))
+    ):
+        raise ValueError("Invalid cursor; pass next_cursor from a previous result unchanged.")
+    return order, sort_key, rowid, shard
+
+
+def _cursor_position(order: str, cursor: str, federated: bool) -> tuple[Any, int, str | None]:
+    """(sort_key, rowid, shard) of cursor in the current ordering; ValueError if it does not apply."""
+    cursor_order, sort_key, rowid, shard = _decode_cursor(cursor)
+    if cursor_order != order or (shard is not None) != federated:
+        raise ValueError("Cursor does not match the current result ordering; search again without cursor.")
+    return sort_key, rowid, shard
+
+
+def _raw_cursor(cursor: str | None) -> bool:
+    """Whether cursor continues a raw create_time walk (_ORDER_RAW_TIME).
+
+    Such a walk keeps the LIKE / create_time plan after the index becomes ready: raw
+    create_time DESC sorts every ISO string before every number, so its position has no
+    equivalent in sidecar time order.
+    """
+    return bool(cursor) and _decode_cursor(cursor)[0] == _ORDER_RAW_TIME
+
+
+def _seek_predicate(
+    order: str, sort_key: Any, rowid: int | None, include_ties: bool = False
+) -> tuple[str, list[Any]]:
+    """SQL predicate (and params) selecting rows after (sort_key, rowid) in the given ordering.
+
+    With rowid None, rows tied on sort_key are all included or all excluded (include_ties);
+    federated search uses that for shards ordered before or after the cursor's shard.
+    """
+    if order == _ORDER_RELEVANCE:
+        if rowid is None:
+            return ("score >= ?" if include_ties else "score > ?"), [sort_key]
+        return "(score, msg_rowid) > (?, ?)", [sort_key, rowid]
+    if order == _ORDER_TIME:
+        # msg_time.ts is never NULL (see index.UNDATED_TS): a pure index seek.
+        if rowid is None:
+            return ("t.ts <= ?" if include_ties else "t.ts < ?"), [sort_key]
+        return "(t.ts, t.rowid) < (?, ?)", [sort_key, rowid]
+    # Raw create_time DESC puts NULL times last.
+    if sort_key is None:
+        if rowid is None:
+            return ("m.create_time IS NULL" if include_ties else "0"), []
+        return "(m.create_time IS NULL AND m.rowid < ?)", [rowid]
+    if rowid is None:
+        op = "<=" if include_ties else "<"
+        return f"(m.create_time {op} ? OR m.create_time IS NULL)", [sort_key]
+    return "((m.create_time, m.rowid) < (?, ?) OR m.create_time IS NULL)", [sort_key, rowid]
+
+
+def _keyset_predicate(order: str, cursor: str) -> tuple[str, list[Any]]:
+    """SQL predicate (and params) selecting rows strictly after cursor in the given ordering."""
+    sort_key, rowid, _ = _cursor_position(order, cursor, federated=False)
+    return _seek_predicate(order, sort_key, rowid)
+
+
+def _format_row(row: sqlite3.Row, content: str | None = None) -> str:
+    """Format one message row as a result block: header line (with the message id), then (truncated) content.
+
+    content replaces the row's content (e.g. a snippet) and is shown as given.
+    """
+    ts = row["create_time"]
+    if ts is not None:
+        try:
+            t = float(ts)
+            dt = datetime.fromtimestamp(t, tz=timezone.utc)
+            ts = dt.strftime("%Y-%m-%d %H:%M")
+        except (ValueError, TypeError, OSError):
+            ts = str(ts)
+    else:
+        ts = "(no time)"
+    role = row["role"] or "unknown"
+    if content is None:
+        content = (row["content"] or "").strip()
+        if len(content) > _CONTENT_DISPLAY_MAX:
+            content = content[:_CONTENT_DISPLAY_MAX] + "..."
+    title = (row["conversation_title"] or "").strip() or row["conversation_id"][:8]
+    message_id = f"; id: {row['id']}" if row["id"] is not None else ""
+    return f"[{ts}] {role} (conv: {title}{message_id})\n{content}"
+
+
+def _row_formatter(key: SearchKey) -> Callable[[Any], str] | None:
+    """format_row for _render showing snippets around the matches if key.snippet_chars is set.
+
+    Rows carrying highlight() output (marked) use the FTS index's match positions; other
+    rows are searched for matches the way key.mode matches. None without snippet_chars.
+    """
+    if not key.snippet_chars:
+        return None
+    query = key.query
+    if not query:
+        locate = None
+    elif key.mode == MODE_REGEX:
+        locate = functools.partial(snippets.regex_spans, query)
+    elif key.mode == MODE_FUZZY:
+        locate = functools.partial(patterns.fuzzy_spans, query)
+    elif key.mode == MODE_SUBSTRING:
+        locate = functools.partial(snippets.substring_spans, query)
+    else:
+        # Text-mode words are prefix matches; the LIKE / snapshot match the query as a substring.
+        def locate(text: str) -> list[tuple[int, int]]:
+            return snippets.word_spans(query, text) or snippets.substring_spans(query, text)
+
+    def format_row(row: Any) -> str:
+        marked = row["marked"] if "marked" in row.keys() else None
+        if marked is not None:
+            text, spans = snippets.marked_spans(marked)
+        else:
+            text = row["content"] or ""
+            spans = locate(text) if locate is not None else []
+        return _format_row(row, snippets.snippet(text, spans, key.snippet_chars))
+
+    return format_row
+
+
 def conversation_search(
     *,
     query: str | None = None,
@@ -91,6 +438,10 @@ def conversation_search(
     start_date: str | None = None,
     end_date: str | None = None,
     limit: int = 50,
+    cursor: str | None = None,
+    max_bytes: int | None = None,
+    mode: str | None = None,
+    snippet_chars: int | None = None,
 ) -> str:
     """
     Search canonical conversation DB. All parameters optional.
@@ -98,70 +449,645 @@ def conversation_search(
     - roles: filter by role: user, assistant, tool (or combinations)
     - start_date, end_date: ISO 8601 inclusive range
     - limit: max results (default 50)
+    - cursor: next_cursor from the previous page of the same search
+    - max_bytes: stop adding results once the output, next_cursor line included, would exceed
+      this many UTF-8 bytes (at least one result is always returned, cut to fit if needed;
+      next_cursor continues after the last one)
+    - mode: "text" (default), "semantic" (text and vector rankings fused; needs numpy),
+      "substring" (literal, ASCII case-insensitive), "regex" (Python syntax) or "fuzzy"
+      (case-insensitive, up to 1 typo from 6 characters and 2 from 12)
+    - snippet_chars: show windows of about this many characters around the matches
+      (marked **like this**) instead of the first 2000 characters of each message
+    Text-mode results with a query are ordered by relevance (BM25 blended with recency)
+    when the sidecar index is ready; otherwise, and in the pattern modes, newest first.
+    Results are served from result_cache when the same normalized search was run recently
+    against the same DB. With several DBs (see _get_db_paths) all are searched as shards.
+    """
+    db_paths, identity = _resolve()
+    key = search_key(query, roles, start_date, end_date, limit, cursor, max_bytes, mode, snippet_chars)
+    return _cached_search(db_paths, identity, key)
+
+
+def conversation_search_batch(queries: list[dict[str, Any]], max_bytes: int | None = None) -> str:
+    """
+    Run several searches in one call; results are grouped per query, in order.
+    - queries: list of conversation_search argument dicts (query, roles, start_date,
+      end_date, limit, cursor, mode, max_bytes, snippet_chars), each with its own limit
+    - max_bytes: combined output budget; each query gets an equal share of what is left,
+      so budget unused by short results carries over to later queries
+    The DB is resolved once and each search runs on the same pooled connection;
+    repeated or recently run searches come from result_cache.
+    Raises ValueError for an empty or oversized list or an invalid spec.
+    """
+    if not queries:
+        raise ValueError("queries must contain at least one search.")
+    if len(queries) > _BATCH_MAX_QUERIES:
+        raise ValueError(f"At most {_BATCH_MAX_QUERIES} queries per batch (got {len(queries)}).")
+    keys = [
+        search_key(
+            spec.get("query"),
+            spec.get("roles"),
+            spec.get("start_date"),
+            spec.get("end_date"),
+            spec.get("limit", 50),
+            spec.get("cursor"),
+            spec.get("max_bytes"),
+            spec.get("mode"),
+            spec.get("snippet_chars"),
+        )
+        for spec in queries
+    ]
+    db_paths, identity = _resolve()
+    remaining = max_bytes
+    sections: list[str] = []
+    with contextlib.ExitStack() as stack:
+        shared: pool.PooledConnection | None = None
+        for i, key in enumerate(keys):
+            if remaining is not None:
+                share = max(1, remaining // (len(keys) - i))
+                key = key._replace(max_bytes=min(key.max_bytes or share, share))
+            if shared is None and len(db_paths) == 1:
+                shared = stack.enter_context(pool.connection(db_paths[0]))
+            result = _cached_search(db_paths, identity, key, shared)
+            sections.append(f"{_BATCH_HEADER_PREFIX}{i + 1}: {_describe(key)}\n{result}")
+            if remaining is not None:
+                remaining = max(0, remaining - len(result.encode("utf-8")))
+    return _BATCH_SEPARATOR.join(sections)
+
+
+def _describe(key: SearchKey) -> str:
+    """Short label for a batch section header, e.g. 'asyncio (roles: user; limit 20)'."""
+    parts = []
+    if key.roles:
+        parts.append(f"roles: {', '.join(key.roles)}")
+    if key.start_ts is not None or key.end_ts is not None:
+        start = _format_day(key.start_ts) if key.start_ts is not None else "..."
+        end = _format_day(key.end_ts) if key.end_ts is not None else "..."
+        parts.append(f"{start} to {end}")
+    if key.mode != MODE_TEXT:
+        parts.append(key.mode)
+    parts.append(f"limit {key.limit}")
+    label = json.dumps(key.query, ensure_ascii=False) if key.query else "(no query)"
+    return f"{label} ({'; '.join(parts)})"
+
+
+def _format_day(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def _resolve() -> tuple[list[str], tuple]:
+    """DB paths to search and their combined identity (for result_cache)."""
+    with metrics.timed(metrics.SEARCH_STAGE_SECONDS, "resolve_db"):
+        db_paths = _get_db_paths()
+        identity = tuple(_db_identity(p) for p in db_paths)
+    return db_paths, identity
+
+
+def db_identities() -> tuple:
+    """Path, inode and mtime of each DB a search would read now (one stat per DB; no sidecar work)."""
+    return tuple(pool._db_identity(p) for p in _get_db_paths())
+
+
+def _cached_search(
+    db_paths: list[str],
+    identity: tuple,
+    key: SearchKey,
+    conn: pool.PooledConnection | None = None,
+) -> str:
+    """Serve key from result_cache or run it (on conn if given) and cache the result.
+
+    The search is traced for the slow-query log (see slowlog.py) when that is enabled.
+    """
+    # Semantic results change once the embedding matrix is loaded; keep them apart.
+    if key.mode == MODE_SEMANTIC:
+        cache_key = (key, tuple(semantic.is_loaded(p) for p in db_paths))
+    else:
+        cache_key = key
+    with slowlog.trace(db_paths, key._asdict()):
+        with metrics.timed(metrics.SEARCH_STAGE_SECONDS, "cache_lookup"):
+            cached = result_cache.get(identity, cache_key)
+        if cached is not None:
+            return cached
+        pool.retain(db_paths)
+        try:
+            if len(db_paths) == 1:
+                result = _search(db_paths[0], key, conn)
+            else:
+                result = _federated_search(db_paths, key)
+        except sqlite3.OperationalError as e:
+            if not deadline.interrupted(e):
+                raise
+            return f"{_NO_RESULTS_STOPPED}\n\n{deadline.truncated_note()}"
+    # A result cut short by the deadline is incomplete; the next identical search runs again.
+    if not deadline.stopped():
+        result_cache.put(identity, cache_key, result)
+    return result
+
+
+def _search(db_path: str, key: SearchKey, conn: pool.PooledConnection | None = None) -> str:
+    """Run a search for normalized arguments (see search_key) against db_path.
+
+    Uses conn if given (a batch shares one), else borrows a pooled connection.
+    """
+    with contextlib.nullcontext(conn) if conn is not None else pool.connection(db_path) as conn:
+        if key.mode == MODE_SEMANTIC:
+            return _semantic_search(conn, db_path, key)
+        snap = snapshot.get(db_path) if _snapshot_servable(key) else None
+        if snap is not None:
+            return _snapshot_search(conn, snap, key)
+        with metrics.timed(metrics.SEARCH_STAGE_SECONDS, "plan"):
+            sql, params, order = _build_sql(conn, db_path, key)
+        execute = metrics.Stopwatch()
+        try:
+            with execute:
+                rows = conn.execute(sql, params)
+            return _render(
+                rows,
+                key.limit,
+                key.max_bytes,
+                lambda row: _encode_cursor(order, row[_SORT_COLUMN[order]], row["msg_rowid"]),
+                execute,
+                _row_formatter(key),
+            )
+        finally:
+            slowlog.explain(conn, db_path, sql, params)
+
+
+def _snapshot_servable(key: SearchKey) -> bool:
+    """Whether the snapshot returns what SQL would: newest-first searches (substring mode, or
+    text mode without a query). Text queries stay on SQL for BM25 ranking."""
+    if _raw_cursor(key.cursor):
+        return False
+    return key.mode == MODE_SUBSTRING or (key.mode == MODE_TEXT and not key.query)
+
+
+def _snapshot_search(conn: pool.PooledConnection, snap: snapshot.Snapshot, key: SearchKey) -> str:
+    """Newest-first search over the in-memory snapshot; only the page's rows are read from SQLite.
+
+    Results are in _ORDER_TIME, so a cursor from a time-ordered SQL page continues here (a raw
+    create_time cursor stays on SQL; see _raw_cursor).
+    """
+    with metrics.timed(metrics.SEARCH_STAGE_SECONDS, "plan"):
+        after = _cursor_position(_ORDER_TIME, key.cursor, federated=False)[:2] if key.cursor else None
+    execute = metrics.Stopwatch()
+    with execute:
+        hits = snap.search(key.query, key.roles, key.start_ts, key.end_ts, after, key.limit + 1)
+        by_rowid = _rows_by_rowid(conn, [rowid for rowid, _ in hits])
+    ts_of = dict(hits)
+    return _render(
+        (by_rowid[rowid] for rowid, _ in hits if rowid in by_rowid),
+        key.limit,
+        key.max_bytes,
+        lambda row: _encode_cursor(_ORDER_TIME, ts_of[row["msg_rowid"]], row["msg_rowid"]),
+        execute,
+        _row_formatter(key),
+    )
+
+
+def _build_sql(
+    conn: pool.PooledConnection,
+    db_path: str,
+    key: SearchKey,
+    *,
+    use_index: bool = True,
+    max_ts: float | None = None,
+    seek: tuple[str, list[Any]] | None = None,
+) -> tuple[str, list[Any], str]:
+    """SQL, params and ordering (_ORDER_*) for a text-mode or pattern-mode search.
+
+    The query selects limit + 1 rows; the extra row tells _render whether there is a next page.
+    use_index=False forces the LIKE / create_time plan even if the sidecar is ready; max_ts
+    overrides the index's newest timestamp for recency; seek replaces the key.cursor predicate
+    (federated search uses all three to keep shards consistent).
     """
-    db_path = _get_db_path()
-    uri = f"file:{quote(db_path, safe='')}?mode=ro"
-    with sqlite3.connect(uri, uri=True) as conn:
-        conn.row_factory = sqlite3.Row
-        sql = """
-            SELECT m.id, m.conversation_id, m.role, m.content, m.create_time, m.position,
-                   c.title AS conversation_title
+    query, roles, cursor = key.query, key.roles, key.cursor
+    start_ts, end_ts = key.start_ts, key.end_ts
+    params: list[Any] = []
+    where: list[str] = []
+    pattern = key.mode in _PATTERN_MODES
+    fts_match = _fts_query(query) if query and not pattern else None
+    use_index = use_index and _attach_index(conn, db_path) and not _raw_cursor(cursor)
+
+    if use_index:
+        # ts comes from the sidecar: range predicates and time ordering use msg_time_ts.
+        ts_col = "t.ts"
+        if fts_match:
+            conn.create_function(
+                "recency",
+                1,
+                _recency_fn(_index_max_ts(conn) if max_ts is None else max_ts),
+                deterministic=True,
+            )
+            sql = _SELECT_COLUMNS + """,
+                   bm25(msg_fts, ?, ?) * (1.0 + ? * recency(t.ts)) AS score"""
+            params.extend([*_BM25_WEIGHTS, _RECENCY_WEIGHT])
+            if key.snippet_chars:
+                # Match offsets for snippets, from the positions the index stores.
+                sql += ", highlight(msg_fts, 0, ?, ?) AS marked"
+                params.extend([snippets.MARK_START, snippets.MARK_END])
+            sql += """
+                FROM ix.msg_fts
+                JOIN ix.msg_doc d ON d.doc = msg_fts.rowid
+                JOIN ix.msg_time t ON t.rowid = d.msg_rowid
+                JOIN messages m ON m.rowid = d.msg_rowid
+                JOIN conversations c ON c.id = m.conversation_id
+            """
+            where.append("msg_fts MATCH ?")
+            params.append(fts_match)
+            order = _ORDER_RELEVANCE
+            order_by = "score, msg_rowid"
+        else:
+            # CROSS JOIN keeps msg_time outermost: with ANALYZE stats on the export but none
+            # on the sidecar, the planner would otherwise scan conversations and sort.
+            sql = _SELECT_COLUMNS + """, t.ts
+                FROM ix.msg_time t
+                CROSS JOIN messages m ON m.rowid = t.rowid
+                JOIN conversations c ON c.id = m.conversation_id
+            """
+            order = _ORDER_TIME
+            order_by = "t.ts DESC, t.rowid DESC"
+    else:
+        # An optimized DB stores epoch seconds: compare the column itself, so its index can seek.
+        ts_col = "m.create_time" if conn.epoch_times else "ct_epoch(m.create_time)"
+        sql = _SELECT_COLUMNS + """
             FROM messages m
             JOIN conversations c ON c.id = m.conversation_id
-            WHERE 1=1
         """
-        params: list[Any] = []
-
-        if query and query.strip():
-            q = f"%{query.strip()}%"
-            sql += " AND (m.content LIKE ? OR c.title LIKE ?)"
-            params.extend([q, q])
-
-        if roles:
-            placeholders = ",".join("?" * len(roles))
-            sql += f" AND m.role IN ({placeholders})"
-            params.extend(roles)
-
-        sql += " ORDER BY m.create_time DESC"
-        fetch_limit = (
-            _FETCH_LIMIT_WITH_DATE
-            if (start_date or end_date)
-            else min(limit * _FETCH_LIMIT_NO_DATE_FACTOR, _FETCH_LIMIT_NO_DATE_CAP)
-        )
-        sql += " LIMIT ?"
-        params.append(fetch_limit)
+        order = _ORDER_RAW_TIME
+        order_by = "m.create_time DESC, m.rowid DESC"
 
-        cursor = conn.execute(sql, params)
-        rows = cursor.fetchall()
+    if query and pattern:
+        predicate, pattern_params = _pattern_predicate(conn, key.mode, query, use_index)
+        where.append(predicate)
+        params.extend(pattern_params)
+    elif query and not (use_index and fts_match):
+        q = f"%{query}%"
+        where.append("(m.content LIKE ? OR c.title LIKE ?)")
+        params.extend([q, q])
 
-        start_ts = _parse_iso_to_float(start_date) if start_date else None
-        end_ts = _parse_iso_to_float(end_date) if end_date else None
-        if end_ts is not None and end_date and re.match(r"^\d{4}-\d{2}-\d{2}$", end_date.strip()):
-            end_ts = end_ts + _SECONDS_PER_DAY - _END_OF_DAY_EPSILON
+    if roles:
+        placeholders = ",".join("?" * len(roles))
+        where.append(f"m.role IN ({placeholders})")
+        params.extend(roles)
 
-        out: list[str] = []
-        for row in rows:
-            ct = _create_time_comparable(row["create_time"])
-            if start_ts is not None and (ct is None or ct < start_ts):
-                continue
-            if end_ts is not None and (ct is None or ct > end_ts):
-                continue
-            if len(out) >= limit:
-                break
-            ts = row["create_time"]
-            if ts is not None:
-                try:
-                    t = float(ts)
-                    dt = datetime.fromtimestamp(t, tz=timezone.utc)
-                    ts = dt.strftime("%Y-%m-%d %H:%M")
-                except (ValueError, TypeError, OSError):
-                    ts = str(ts)
+    if start_ts is not None:
+        where.append(f"{ts_col} >= ?")
+        params.append(start_ts)
+    elif end_ts is not None and use_index:
+        where.append("t.ts > ?")  # undated messages never match a date range
+        params.append(index.UNDATED_TS)
+    if end_ts is not None:
+        where.append(f"{ts_col} <= ?")
+        params.append(end_ts)
+
+    if seek is not None or cursor:
+        predicate, cursor_params = seek if seek is not None else _keyset_predicate(order, cursor)
+        where.append(predicate)
+        params.extend(cursor_params)
+
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {order_by} LIMIT ?"
+    params.append(key.limit + 1)
+
+    return sql, params, order
+
+
+def _render(
+    rows: Iterable[Any],
+    limit: int,
+    max_bytes: int | None,
+    next_cursor: Callable[[Any], str] | None,
+    execute: metrics.Stopwatch | None = None,
+    format_row: Callable[[Any], str] | None = None,
+) -> str:
+    """Format rows as they are read, stopping at limit or before max_bytes is exceeded.
+
+    max_bytes covers the results and the next_cursor line (room for it is kept whether or not
+    one follows); only the first result is cut to fit, and deadline.truncated_note() is extra.
+
+    Memory scales with the output rather than the matching row set. When more rows remain,
+    next_cursor(last row shown) is appended as the next_cursor line (if given). Time spent
+    reading rows is added to execute (recorded as the execute stage), time spent formatting
+    as the format stage. Rows are formatted with format_row (default _format_row).
+    If the current deadline aborts reading, the rows so far are returned with
+    deadline.truncated_note() (and a next_cursor to continue after them).
+    """
+    execute = execute or metrics.Stopwatch()
+    format_row = format_row or _format_row
+    fmt = metrics.Stopwatch()
+    out: list[str] = []
+    size = 0
+    fetched = 0
+    last = None
+    has_more = False
+    truncated = False
+    it = iter(rows)
+    while True:
+        with execute:
+            try:
+                row = next(it, None)
+            except sqlite3.OperationalError as e:
+                if not deadline.interrupted(e):
+                    raise
+                row, truncated = None, True
+        if row is None:
+            break
+        fetched += 1
+        if len(out) >= limit:
+            has_more = True
+            break
+        with fmt:
+            block = format_row(row)
+            block_size = len(block.encode("utf-8")) + (len(_RESULT_SEPARATOR) if out else 0)
+            # Room for the next_cursor line that follows if this row ends the page.
+            reserve = (
+                len(_cursor_line(next_cursor(row)).encode("utf-8"))
+                if max_bytes is not None and next_cursor is not None
+                else 0
+            )
+        if max_bytes is not None and out and size + block_size + reserve > max_bytes:
+            has_more = True
+            break
+        if max_bytes is not None and not out and block_size + reserve > max_bytes:
+            block = block.encode("utf-8")[: max(0, max_bytes - reserve)].decode("utf-8", "ignore")
+            block_size = len(block.encode("utf-8"))
+        out.append(block)
+        size += block_size
+        last = row
+    if isinstance(rows, sqlite3.Cursor):
+        rows.close()
+    execute.observe(metrics.SEARCH_STAGE_SECONDS, "execute")
+    metrics.ROWS_FETCHED.labels().inc(fetched)
+    metrics.ROWS_RETURNED.labels().inc(len(out))
+    slowlog.rows(fetched, len(out))
+    if not out:
+        fmt.observe(metrics.SEARCH_STAGE_SECONDS, "format")
+        if truncated:
+            return f"{_NO_RESULTS_STOPPED}\n\n{deadline.truncated_note()}"
+        return "No matching messages."
+    with fmt:
+        result = _RESULT_SEPARATOR.join(out)
+        if truncated:
+            result += f"\n\n{deadline.truncated_note()}"
+        if (has_more or truncated) and next_cursor is not None and last is not None:
+            result += _cursor_line(next_cursor(last))
+    fmt.observe(metrics.SEARCH_STAGE_SECONDS, "format")
+    return result
+
+
+def _cursor_line(cursor: str) -> str:
+    return f"\n\n{_NEXT_CURSOR_PREFIX}{cursor}"
+
+
+def _pattern_predicate(
+    conn: pool.PooledConnection, mode: str, query: str, use_index: bool
+) -> tuple[str, list[Any]]:
+    """SQL predicate (and params) for a substring, regex or fuzzy query.
+
+    With the sidecar's trigram index (msg_tri), messages are first narrowed to the
+    pattern's candidates (unless there are _TRIGRAM_CANDIDATES_MAX or more); the exact
+    check (LIKE, or pattern_match() in Python) runs on those only. Otherwise messages in
+    range are checked newest first until the page is full.
+    """
+    if mode == MODE_SUBSTRING:
+        match = patterns.substring_filter(query)
+        like = patterns.like_pattern(query)
+        check = "(m.content LIKE ? ESCAPE '\\' OR c.title LIKE ? ESCAPE '\\')"
+        check_params = [like, like]
+    else:
+        if mode == MODE_REGEX:
+            regex = patterns.compile_regex(query)
+            match, matches = patterns.regex_filter(regex), patterns.regex_matcher(regex)
+        else:
+            match, matches = patterns.fuzzy_filter(query), patterns.fuzzy_matcher(query)
+        conn.create_function("pattern_match", 1, matches, deterministic=True)
+        check = "(pattern_match(m.content) OR pattern_match(c.title))"
+        check_params = []
+    if match is None or not (use_index and index.has_table(conn, "ix", "msg_tri")):
+        return check, check_params
+    (candidates,) = conn.execute(
+        "SELECT count(*) FROM (SELECT 1 FROM ix.msg_tri WHERE msg_tri MATCH ? LIMIT ?)",
+        (match, _TRIGRAM_CANDIDATES_MAX),
+    ).fetchone()
+    if candidates >= _TRIGRAM_CANDIDATES_MAX:
+        return check, check_params
+    narrow = """t.rowid IN (
+        SELECT d.msg_rowid FROM ix.msg_tri JOIN ix.msg_doc d ON d.doc = msg_tri.rowid
+        WHERE msg_tri MATCH ?)"""
+    return f"{narrow} AND {check}", [match, *check_params]
+
+
+def _semantic_ranking(conn: pool.PooledConnection, db_path: str, key: SearchKey) -> list[tuple[int, float]]:
+    """Top key.limit (rowid, fused score) from text and vector rankings (reciprocal rank fusion).
+
+    While the embedding matrix is being built, only the text ranking contributes.
+    """
+    if not key.query:
+        raise ValueError("mode 'semantic' requires a query.")
+    if key.cursor:
+        raise ValueError("cursor is not supported with mode 'semantic'.")
+    depth = max(key.limit * _FUSION_DEPTH_FACTOR, _FUSION_DEPTH_MIN)
+    with metrics.timed(metrics.SEARCH_STAGE_SECONDS, "plan"):
+        sql, params, _ = _build_sql(conn, db_path, key._replace(limit=depth, cursor=None, snippet_chars=None))
+    with metrics.timed(metrics.SEARCH_STAGE_SECONDS, "text_candidates"):
+        text_ranked = [row[0] for row in conn.execute(f"SELECT msg_rowid FROM ({sql})", params)]
+    with metrics.timed(metrics.SEARCH_STAGE_SECONDS, "vector"):
+        arrays = semantic.load_embeddings(db_path)
+        vector_ranked = []
+        if arrays is not None:
+            hits = semantic.vector_search(arrays, key.query, depth, key.roles, key.start_ts, key.end_ts)
+            vector_ranked = [rowid for rowid, _ in hits]
+        scores = semantic.fusion_scores([text_ranked, vector_ranked])
+    slowlog.explain(conn, db_path, sql, params)
+    fused = sorted(scores, key=lambda rowid: -scores[rowid])[: key.limit]
+    return [(rowid, scores[rowid]) for rowid in fused]
+
+
+def _rows_by_rowid(conn: sqlite3.Connection, rowids: list[int]) -> dict[int, sqlite3.Row]:
+    if not rowids:
+        return {}
+    placeholders = ",".join("?" * len(rowids))
+    rows = conn.execute(
+        _SELECT_COLUMNS
+        + f"""
+        FROM messages m
+        JOIN conversations c ON c.id = m.conversation_id
+        WHERE m.rowid IN ({placeholders})
+        """,
+        rowids,
+    ).fetchall()
+    return {row["msg_rowid"]: row for row in rows}
+
+
+def _semantic_search(conn: pool.PooledConnection, db_path: str, key: SearchKey) -> str:
+    """Fuse text results with vector results (reciprocal rank fusion); a single page, no cursor."""
+    fused = [rowid for rowid, _ in _semantic_ranking(conn, db_path, key)]
+    if not fused:
+        return "No matching messages."
+    execute = metrics.Stopwatch()
+    with execute:
+        by_rowid = _rows_by_rowid(conn, fused)
+    return _render(
+        (by_rowid[r] for r in fused if r in by_rowid),
+        key.limit,
+        key.max_bytes,
+        None,
+        execute,
+        _row_formatter(key),
+    )
+
+
+class _Desc:
+    """Wraps a value so it sorts in reverse (for merging streams ordered descending)."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+    def __lt__(self, other: "_Desc") -> bool:
+        return other.value < self.value
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _Desc) and self.value == other.value
+
+
+def _sqlite_sort_value(value: Any) -> tuple[int, Any]:
+    """Sort key matching SQLite's ORDER BY over mixed types: NULL < numbers < text."""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    return (2, value)
+
+
+def _merge_key(order: str) -> Callable[[dict[str, Any]], tuple]:
+    """Total order across shards: the shard's own ordering, then shard path, then rowid."""
+    if order == _ORDER_RELEVANCE:
+        return lambda row: (row["score"], row["shard"], row["msg_rowid"])
+    if order == _ORDER_TIME:
+        return lambda row: (_Desc(row["ts"]), row["shard"], _Desc(row["msg_rowid"]))
+    return lambda row: (
+        _Desc(_sqlite_sort_value(row["create_time"])),
+        row["shard"],
+        _Desc(row["msg_rowid"]),
+    )
+
+
+def _shard_rows(cursor: sqlite3.Cursor, shard: str) -> Iterable[dict[str, Any]]:
+    for row in cursor:
+        item = dict(zip(row.keys(), row))
+        item["shard"] = shard
+        yield item
+
+
+def _shard_seek(order: str, cursor: str | None, shard: str) -> tuple[str, list[Any]] | None:
+    """Where shard resumes after a federated cursor: past it in the merge order (see _merge_key)."""
+    if not cursor:
+        return None
+    sort_key, rowid, cursor_shard = _cursor_position(order, cursor, federated=True)
+    if shard == cursor_shard:
+        return _seek_predicate(order, sort_key, rowid)
+    # Ties on sort_key are ordered by shard path: earlier shards have already emitted theirs.
+    return _seek_predicate(order, sort_key, None, include_ties=shard > cursor_shard)
+
+
+def _federated_search(db_paths: list[str], key: SearchKey) -> str:
+    """Search every shard in parallel and k-way merge the ordered results.
+
+    Each shard's query is LIMIT limit + 1 (no shard can contribute more) and its cursor is
+    stepped lazily by the merge, so a shard stops after the rows it actually contributes.
+    All shards use the same plan: the sidecar index only if every shard's is ready, and
+    recency relative to the newest message across shards.
+    """
+    if key.mode == MODE_SEMANTIC:
+        return _federated_semantic_search(db_paths, key)
+    with contextlib.ExitStack() as stack:
+        conns = {p: stack.enter_context(pool.connection(p)) for p in db_paths}
+        with metrics.timed(metrics.SEARCH_STAGE_SECONDS, "plan"):
+            # Attach (or start building) every shard's sidecar before deciding on the plan.
+            use_index = all([_attach_index(conn, p) for p, conn in conns.items()])
+            use_index = use_index and not _raw_cursor(key.cursor)  # finish a raw walk as begun
+            max_ts = None
+            if use_index:
+                newest = [ts for ts in (_index_max_ts(conn) for conn in conns.values()) if ts is not None]
+                max_ts = max(newest, default=None)
+            if use_index:
+                text = key.query and key.mode not in _PATTERN_MODES and _fts_query(key.query)
+                order = _ORDER_RELEVANCE if text else _ORDER_TIME
             else:
-                ts = "(no time)"
-            role = row["role"] or "unknown"
-            content = (row["content"] or "").strip()
-            if len(content) > _CONTENT_DISPLAY_MAX:
-                content = content[:_CONTENT_DISPLAY_MAX] + "..."
-            title = (row["conversation_title"] or "").strip() or row["conversation_id"][:8]
-            out.append(f"[{ts}] {role} (conv: {title})\n{content}")
-        return "\n\n---\n\n".join(out) if out else "No matching messages."
+                order = _ORDER_RAW_TIME
+            plans = {}
+            for p, conn in conns.items():
+                sql, params, shard_order = _build_sql(
+                    conn,
+                    p,
+                    key._replace(cursor=None),
+                    use_index=use_index,
+                    max_ts=max_ts,
+                    seek=_shard_seek(order, key.cursor, p),
+                )
+                if shard_order != order:  # a sidecar went away mid-search
+                    raise RuntimeError(f"Shard {p} changed search plan; retry.")
+                plans[p] = (sql, params)
+        execute = metrics.Stopwatch()
+        with execute:
+            cursors = dict(
+                zip(
+                    plans,
+                    executor.shard_pool().map(
+                        lambda p: conns[p].execute(*plans[p]), list(plans)
+                    ),
+                )
+            )
+        try:
+            merged = heapq.merge(
+                *(_shard_rows(cur, p) for p, cur in cursors.items()), key=_merge_key(order)
+            )
+            return _render(
+                merged,
+                key.limit,
+                key.max_bytes,
+                lambda row: _encode_cursor(
+                    order, row[_SORT_COLUMN[order]], row["msg_rowid"], row["shard"]
+                ),
+                execute,
+                _row_formatter(key),
+            )
+        finally:
+            for cur in cursors.values():
+                cur.close()
+            for p, (sql, params) in plans.items():
+                slowlog.explain(conns[p], p, sql, params)
+
+
+def _federated_semantic_search(db_paths: list[str], key: SearchKey) -> str:
+    """Semantic search per shard in parallel, merged by fused score; a single page, no cursor."""
+
+    current = deadline.current()
+
+    def rank(p: str) -> list[tuple[float, str, int]]:
+        with deadline.active(current), pool.connection(p) as conn:
+            return [(score, p, rowid) for rowid, score in _semantic_ranking(conn, p, key)]
+
+    ranked = [hit for hits in executor.shard_pool().map(rank, db_paths) for hit in hits]
+    top = sorted(ranked, key=lambda hit: (-hit[0], hit[1], hit[2]))[: key.limit]
+    execute = metrics.Stopwatch()
+    rows: dict[tuple[str, int], dict[str, Any]] = {}
+    with execute:
+        for p in db_paths:
+            rowids = [rowid for _, shard, rowid in top if shard == p]
+            if not rowids:
+                continue
+            with pool.connection(p) as conn:
+                for rowid, row in _rows_by_rowid(conn, rowids).items():
+                    rows[(p, rowid)] = dict(zip(row.keys(), row))
+    return _render(
+        (rows[(p, r)] for _, p, r in top if (p, r) in rows),
+        key.limit,
+        key.max_bytes,
+        None,
+        execute,
+        _row_formatter(key),
+    )
@@ -0,0 +1,272 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# origin_conversation - Local semantic (vector) search over message embeddings.
+"""
+Semantic search over locally computed message embeddings (requires numpy).
+
+Embeddings are computed by a pluggable embedder (default: HashingEmbedder, deterministic
+and offline) and stored next to the sidecar index as memory-mapped .npy files aligned to
+messages rowids: vectors (float32, one L2-normalized row per message), rowids (int64),
+ts (float64 epoch, index.UNDATED_TS if unknown) and roles (uint8 codes). Queries score
+all rows with batched NumPy dot products; role and date filters are vectorized masks.
+Like the FTS sidecar, the matrix is built in a background thread on first use and tied to
+the source DB fingerprint.
+
+A custom embedder is any object with name, dim and embed(list[str]) -> float32 array
+(n, dim); set CONVERSATION_EMBEDDER=module:attribute to a factory or instance.
+"""
+import importlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from typing import Any, Protocol
+from urllib.parse import quote
+
+from . import index
+
+# numpy is optional (pip install origin-conversation[semantic]) and slow to import, so it is
+# imported on first use by _require_numpy() rather than at server start.
+np: Any = None
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_DIM = 256
+_EMBED_MAX_CHARS = 4000
+_BUILD_BATCH = 1024
+_SCORE_BATCH = 65536
+_ARRAYS = ("vectors", "rowids", "ts", "roles")
+
+ROLE_CODES = {"user": 1, "assistant": 2, "tool": 3}
+
+_lock = threading.Lock()
+_building: set[str] = set()
+_failed: dict[str, str] = {}
+_loaded: dict[str, tuple[str, dict[str, Any]]] = {}  # db_path -> (fingerprint, arrays)
+
+
+class Embedder(Protocol):
+    name: str
+    dim: int
+
+    def embed(self, texts: list[str]) -> Any: ...
+
+
+def _require_numpy() -> None:
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise RuntimeError("semantic mode requires numpy (pip install origin-conversation[semantic])") from None
+        np = numpy
+
+
+class HashingEmbedder:
+    """Feature-hashing bag of words plus character trigrams; deterministic across processes."""
+
+    def __init__(self, dim: int = _DEFAULT_DIM) -> None:
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> list[tuple[str, float]]:
+        feats: list[tuple[str, float]] = []
+        for word in re.findall(r"\w+", text.lower()):
+            feats.append((word, 1.0))
+            padded = f"#{word}#"
+            feats.extend((padded[i : i + 3], 0.5) for i in range(len(padded) - 2))
+        return feats
+
+    def embed(self, texts: list[str]) -> Any:
+        _require_numpy()
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            row = out[i]
+            for feat, weight in self._features(text):
+                h = zlib.crc32(feat.encode("utf-8"))
+                row[h % self.dim] += weight if (h >> 16) & 1 else -weight
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+
+def get_embedder() -> Embedder:
+    """Embedder named by CONVERSATION_EMBEDDER (module:attribute), else HashingEmbedder."""
+    spec = os.environ.get("CONVERSATION_EMBEDDER", "").strip()
+    if not spec:
+        return HashingEmbedder()
+    module_name, _, attr = spec.partition(":")
+    obj = getattr(importlib.import_module(module_name), attr)
+    return obj() if isinstance(obj, type) or not hasattr(obj, "embed") else obj
+
+
+def _artifact(db_path: str, name: str) -> str:
+    return f"{index.sidecar_path(db_path)}.emb-{name}.npy"
+
+
+def _meta_path(db_path: str) -> str:
+    return f"{index.sidecar_path(db_path)}.emb.json"
+
+
+def build_embeddings(db_path: str, embedder: Embedder | None = None) -> str:
+    """Embed every message of db_path into memory-mapped arrays; return the meta path."""
+    from .search import _create_time_comparable
+
+    _require_numpy()
+    embedder = embedder or get_embedder()
+    fingerprint = index.source_fingerprint(db_path)
+    uri = f"file:{quote(db_path, safe='')}?mode=ro"
+    suffix = f".{os.getpid()}.tmp"  # per process: server workers may build concurrently
+    tmp = {name: _artifact(db_path, name) + suffix for name in _ARRAYS}
+    meta_path = _meta_path(db_path)
+    arrays: dict[str, Any] = {}
+    try:
+        with sqlite3.connect(uri, uri=True) as conn:
+            (count,) = conn.execute("SELECT count(*) FROM messages").fetchone()
+            arrays = {
+                "vectors": np.lib.format.open_memmap(tmp["vectors"], "w+", np.float32, (count, embedder.dim)),
+                "rowids": np.lib.format.open_memmap(tmp["rowids"], "w+", np.int64, (count,)),
+                "ts": np.lib.format.open_memmap(tmp["ts"], "w+", np.float64, (count,)),
+                "roles": np.lib.format.open_memmap(tmp["roles"], "w+", np.uint8, (count,)),
+            }
+            cur = conn.execute("SELECT rowid, role, content, create_time FROM messages ORDER BY rowid")
+            pos = 0
+            while pos < count:
+                batch = cur.fetchmany(_BUILD_BATCH)
+                if not batch:
+                    break
+                end = pos + len(batch)
+                arrays["vectors"][pos:end] = embedder.embed(
+                    [(content or "")[:_EMBED_MAX_CHARS] for _, _, content, _ in batch]
+                )
+                arrays["rowids"][pos:end] = [rowid for rowid, _, _, _ in batch]
+                arrays["roles"][pos:end] = [ROLE_CODES.get(role, 0) for _, role, _, _ in batch]
+                arrays["ts"][pos:end] = [
+                    index.UNDATED_TS if (t := _create_time_comparable(ct)) is None else t
+                    for _, _, _, ct in batch
+                ]
+                pos = end
+        for arr in arrays.values():
+            arr.flush()
+        arrays.clear()
+        for name in _ARRAYS:
+            os.replace(tmp[name], _artifact(db_path, name))
+        with open(meta_path + suffix, "w", encoding="utf-8") as f:
+            json.dump({"source_fingerprint": fingerprint, "embedder": embedder.name, "rows": pos}, f)
+        os.replace(meta_path + suffix, meta_path)
+    finally:
+        arrays.clear()  # close the memmaps before removing their files
+        for path in (*tmp.values(), meta_path + suffix):
+            if os.path.exists(path):
+                os.remove(path)
+    return meta_path
+
+
+def _build_in_background(db_path: str, fingerprint: str) -> None:
+    try:
+        build_embeddings(db_path)
+        logger.info("Built embeddings for %s", db_path)
+    except Exception as e:
+        logger.warning("Embedding build failed for %s (semantic mode uses text only): %s", db_path, e)
+        with _lock:
+            _failed[db_path] = fingerprint
+    finally:
+        with _lock:
+            _building.discard(db_path)
+
+
+def _read_meta(db_path: str) -> dict[str, Any]:
+    try:
+        with open(_meta_path(db_path), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def is_loaded(db_path: str) -> bool:
+    """Whether embeddings for the current version of db_path are loaded (no build is started)."""
+    cached = _loaded.get(db_path)
+    try:
+        return cached is not None and cached[0] == index.source_fingerprint(db_path)
+    except OSError:
+        return False
+
+
+def load_embeddings(db_path: str) -> dict[str, Any] | None:
+    """Memory-mapped arrays for db_path, or None while they are being built (build started)."""
+    _require_numpy()
+    fingerprint = index.source_fingerprint(db_path)
+    with _lock:
+        cached = _loaded.get(db_path)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        if db_path in _building or _failed.get(db_path) == fingerprint:
+            return None
+    meta = _read_meta(db_path)
+    if meta.get("source_fingerprint") == fingerprint and meta.get("embedder") == get_embedder().name:
+        arrays = {name: np.load(_artifact(db_path, name), mmap_mode="r") for name in _ARRAYS}
+        with _lock:
+            _loaded[db_path] = (fingerprint, arrays)
+        return arrays
+    with _lock:
+        if db_path in _building:
+            return None
+        _building.add(db_path)
+    threading.Thread(
+        target=_build_in_background,
+        args=(db_path, fingerprint),
+        name="origin-conversation-embed",
+        daemon=True,
+    ).start()
+    return None
+
+
+def vector_search(
+    arrays: dict[str, Any],
+    query: str,
+    k: int,
+    roles: tuple[str, ...] | None = None,
+    start_ts: float | None = None,
+    end_ts: float | None = None,
+    embedder: Embedder | None = None,
+) -> list[tuple[int, float]]:
+    """Top-k (rowid, cosine score) for query among rows passing the role/date masks."""
+    _require_numpy()
+    q = (embedder or get_embedder()).embed([query])[0].astype(np.float32)
+    vectors, n = arrays["vectors"], arrays["rowids"].shape[0]
+    best_rows = np.empty(0, dtype=np.int64)
+    best_scores = np.empty(0, dtype=np.float32)
+    for lo in range(0, n, _SCORE_BATCH):
+        hi = min(lo + _SCORE_BATCH, n)
+        scores = vectors[lo:hi] @ q
+        mask = np.ones(hi - lo, dtype=bool)
+        if roles:
+            mask &= np.isin(arrays["roles"][lo:hi], [ROLE_CODES.get(r, 0) for r in roles])
+        if start_ts is not None:
+            mask &= arrays["ts"][lo:hi] >= start_ts
+        if end_ts is not None:
+            mask &= (arrays["ts"][lo:hi] <= end_ts) & (arrays["ts"][lo:hi] > index.UNDATED_TS)
+        idx = np.flatnonzero(mask & (scores > 0))
+        if idx.size == 0:
+            continue
+        rows = np.concatenate([best_rows, idx + lo])
+        cand = np.concatenate([best_scores, scores[idx]])
+        if cand.size > k:
+            top = np.argpartition(-cand, k - 1)[:k]
+            rows, cand = rows[top], cand[top]
+        best_rows, best_scores = rows, cand
+    order = np.lexsort((best_rows, -best_scores))
+    rowids = arrays["rowids"]
+    return [(int(rowids[best_rows[i]]), float(best_scores[i])) for i in order]
+
+
+def fusion_scores(rankings: list[list[int]], k: int = 60) -> dict[int, float]:
+    """Reciprocal rank fusion scores: score(d) = sum over lists of 1 / (k + rank), in first-seen order."""
+    scores: dict[int, float] = {}
+    for ranking in rankings:
+        for rank, rowid in enumerate(ranking, start=1):
+            scores[rowid] = scores.get(rowid, 0.0) + 1.0 / (k + rank)
+    return scores
+
@@ -1,15 +1,26 @@
 # SPDX-License-Identifier: AGPL-3.0-only
 # origin_conversation MCP server - SMCP-style tool registration.
-"""MCP server with conversation_search tool; uses mcp.server.Server and stdio transport."""
+"""MCP server with conversation_search, conversation_search_batch, conversation_context and conversation_stats tools; uses mcp.server.Server and stdio transport."""
+import asyncio
 import logging
 
 from mcp.server import Server
 from mcp.types import TextContent, Tool
 
-from .search import conversation_search
+from . import deadline, metrics
+from .coalesce import SingleFlight, freeze
+from .context import conversation_context
+from .executor import SearchBusyError, SearchExecutor
+from .search import conversation_search, conversation_search_batch, db_identities, search_key
+from .stats import conversation_stats
 
 logger = logging.getLogger(__name__)
 
+_TIMEOUT_PROPERTY = {
+    "type": "number",
+    "description": "Stop after this many seconds (at most the server's limit, by default 30). A search that runs out of time returns the results found so far, marked [truncated: ...], with next_cursor to continue.",
+}
+
 # Server enforces default limit 50 and max 200 regardless of client; schema default is advisory.
 CONVERSATION_SEARCH_SCHEMA = {
     "type": "object",
@@ -36,6 +47,106 @@ CONVERSATION_SEARCH_SCHEMA = {
             "description": "Maximum number of results to return.",
             "default": 50,
         },
+        "mode": {
+            "type": "string",
+            "enum": ["text", "semantic", "substring", "regex", "fuzzy"],
+            "description": "text (default): full-text match ranked by relevance and recency. semantic: also ranks by meaning (local embeddings) and fuses both rankings; requires query; single page (no cursor). substring: exact text anywhere, e.g. part of an identifier or URL (case-insensitive for ASCII). regex: Python regular expression (case-sensitive unless (?i)). fuzzy: text with typos (case-insensitive; 1 edit from 6 characters, 2 from 12). substring, regex and fuzzy require query and return newest first.",
+            "default": "text",
+        },
+        "max_bytes": {
+            "type": "integer",
+            "description": "Output budget in bytes (roughly 4 bytes per token), next_cursor line included. Results stop before the budget is exceeded; next_cursor continues from there.",
+        },
+        "cursor": {
+            "type": "string",
+            "description": "Continue a previous search: pass the next_cursor value from the end of its result, with the same other arguments.",
+        },
+        "snippet_chars": {
+            "type": "integer",
+            "description": "Show only windows of about this many characters around the matches in each message (up to 3, matches marked **like this**) instead of its first 2000 characters. e.g. 300. Much smaller output for long messages.",
+        },
+        "timeout_seconds": _TIMEOUT_PROPERTY,
+    },
+    "required": [],
+    "additionalProperties": False,
+}
+
+CONVERSATION_SEARCH_BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "queries": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    name: prop
+                    for name, prop in CONVERSATION_SEARCH_SCHEMA["properties"].items()
+                    if name != "timeout_seconds"
+                },
+                "additionalProperties": False,
+            },
+            "minItems": 1,
+            "maxItems": 20,
+            "description": "Searches to run, each with the conversation_search arguments (its own limit, cursor, max_bytes).",
+        },
+        "max_bytes": {
+            "type": "integer",
+            "description": "Combined output budget in bytes for all queries; each query gets an equal share of what earlier queries left.",
+        },
+        "timeout_seconds": _TIMEOUT_PROPERTY,
+    },
+    "required": ["queries"],
+    "additionalProperties": False,
+}
+
+CONVERSATION_CONTEXT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "message_id": {
+            "type": "string",
+            "description": "Id of the message to center on (shown as 'id: ...' on every search result).",
+        },
+        "conversation_id": {
+            "type": "string",
+            "description": "Conversation of the message to center on; use with position instead of message_id.",
+        },
+        "position": {
+            "type": "integer",
+            "description": "Position of the message within conversation_id.",
+        },
+        "before": {
+            "type": "integer",
+            "description": "Number of earlier messages to include (max 50).",
+            "default": 5,
+        },
+        "after": {
+            "type": "integer",
+            "description": "Number of later messages to include (max 50).",
+            "default": 5,
+        },
+        "max_bytes": {
+            "type": "integer",
+            "description": "Output budget in bytes (roughly 4 bytes per token); later messages are dropped first.",
+        },
+        "timeout_seconds": _TIMEOUT_PROPERTY,
+    },
+    "required": [],
+    "additionalProperties": False,
+}
+
+CONVERSATION_STATS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        **{
+            name: CONVERSATION_SEARCH_SCHEMA["properties"][name]
+            for name in ("query", "roles", "start_date", "end_date")
+        },
+        "top": {
+            "type": "integer",
+            "description": "Number of conversations with the most matching messages to list (max 100).",
+            "default": 10,
+        },
+        "timeout_seconds": _TIMEOUT_PROPERTY,
     },
     "required": [],
     "additionalProperties": False,
@@ -48,21 +159,126 @@ TOOLS: list[Tool] = [
         name="conversation_search",
         description=(
             "Search prior conversation history (canonical ChatGPT export). "
-            "Hybrid-style: text match on content and titles. Optional filters: roles (user/assistant/tool), "
-            "start_date and end_date (ISO 8601 inclusive). Returns matching messages with timestamps and content."
+            "Hybrid-style: full-text match on content and titles ranked by relevance and recency; "
+            "mode=semantic adds local vector search fused with the text ranking; mode=substring, regex or fuzzy "
+            "find exact fragments (code, URLs, partial identifiers), regular expressions or mistyped text. Optional filters: roles (user/assistant/tool), "
+            "start_date and end_date (ISO 8601 inclusive). Returns matching messages with timestamps and content; "
+            "a full page ends with next_cursor, which can be passed as cursor to get the next page."
         ),
         inputSchema=CONVERSATION_SEARCH_SCHEMA,
     ),
+    Tool(
+        name="conversation_search_batch",
+        description=(
+            "Run several conversation_search queries in one call (up to 20), e.g. the same topic under "
+            "different phrasings or date ranges. Each entry takes the conversation_search arguments; "
+            "results are returned grouped per query in order, each under a '=== Query N' header, "
+            "with an optional combined max_bytes budget."
+        ),
+        inputSchema=CONVERSATION_SEARCH_BATCH_SCHEMA,
+    ),
+    Tool(
+        name="conversation_context",
+        description=(
+            "Show the messages around one message of a conversation: the given number before and after it, "
+            "in order, with the message itself marked '>>>'. Identify it by message_id (from a "
+            "conversation_search result) or by conversation_id and position. Pass the id of the first or last "
+            "message shown to read further."
+        ),
+        inputSchema=CONVERSATION_CONTEXT_SCHEMA,
+    ),
+    Tool(
+        name="conversation_stats",
+        description=(
+            "Count messages instead of listing them: for the same filters as conversation_search (query, roles, "
+            "start_date, end_date; dates select whole UTC days), returns totals by role, a monthly histogram "
+            "and the conversations with the most matching messages. Use it for questions like how many "
+            "assistant messages per month mention X, or which conversations are longest."
+        ),
+        inputSchema=CONVERSATION_STATS_SCHEMA,
+    ),
 ]
 
 
+def _parse_search_arguments(arguments: dict) -> tuple[dict, str | None]:
+    """conversation_search keyword arguments from tool arguments, or (_, error text) for invalid roles."""
+    query = arguments.get("query") or None
+    roles = arguments.get("roles")
+    if roles is not None and not isinstance(roles, list):
+        roles = [roles]
+    if roles:
+        invalid = set(roles) - ALLOWED_ROLES
+        if invalid:
+            return {}, f"Invalid role(s): {sorted(invalid)}. Allowed: user, assistant, tool."
+    limit = arguments.get("limit")
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            limit = 50
+    else:
+        limit = 50
+    return {
+        "query": query,
+        "roles": roles,
+        "start_date": arguments.get("start_date") or None,
+        "end_date": arguments.get("end_date") or None,
+        "limit": max(1, min(limit, 200)),
+        "cursor": arguments.get("cursor") or None,
+        "max_bytes": _parse_max_bytes(arguments.get("max_bytes")),
+        "mode": arguments.get("mode") or None,
+        "snippet_chars": _parse_snippet_chars(arguments.get("snippet_chars")),
+    }, None
+
+
+def _parse_max_bytes(value) -> int | None:
+    if value is None:
+        return None
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_snippet_chars(value) -> int | None:
+    """snippet_chars clamped to 20..2000; None (whole messages) if absent, invalid or not positive."""
+    if value is None:
+        return None
+    try:
+        chars = int(value)
+    except (TypeError, ValueError):
+        return None
+    return max(20, min(chars, 2000)) if chars > 0 else None
+
+
+def _parse_timeout(value) -> float | None:
+    """timeout_seconds as a float; None (the server default) if absent, invalid or not positive."""
+    if value is None:
+        return None
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        return None
+    return seconds if seconds > 0 else None
+
+
 def create_server() -> Server:
     """Create MCP server instance (no tools registered yet)."""
     return Server(name="origin-conversation-mcp", version="0.1.0")
 
 
-def register_tools(server: Server) -> None:
-    """Register conversation_search and list_tools / call_tool handlers."""
+def register_tools(server: Server, executor: SearchExecutor | None = None) -> None:
+    """Register the search tools and list_tools / call_tool handlers.
+
+    Searches run on executor's worker threads so SQLite work never blocks the event loop;
+    a default SearchExecutor (sized from the environment) is created if none is given.
+    Identical calls in flight at the same time share one execution (see coalesce.py). Each
+    execution runs under a deadline (see deadline.py) that is also tripped when the MCP
+    request is cancelled, so abandoned SQLite work stops.
+    """
+    if executor is None:
+        executor = SearchExecutor()
+    flights = SingleFlight()
 
     @server.list_tools()
     async def list_tools():
@@ -70,42 +286,124 @@ def register_tools(server: Server) -> None:
 
     @server.call_tool()
     async def call_tool(tool_name: str, arguments: dict):
-        if tool_name != "conversation_search":
+        if tool_name == "conversation_search":
+            run = _conversation_search
+        elif tool_name == "conversation_search_batch":
+            run = _conversation_search_batch
+        elif tool_name == "conversation_context":
+            run = _conversation_context
+        elif tool_name == "conversation_stats":
+            run = _conversation_stats
+        else:
             return [TextContent(type="text", text=f"Unknown tool: {tool_name}")]
         try:
-            query = arguments.get("query") or None
-            roles = arguments.get("roles")
-            if roles is not None and not isinstance(roles, list):
-                roles = [roles]
-            if roles:
-                invalid = set(roles) - ALLOWED_ROLES
-                if invalid:
-                    return [
-                        TextContent(
-                            type="text",
-                            text=f"Invalid role(s): {sorted(invalid)}. Allowed: user, assistant, tool.",
-                        )
-                    ]
-            start_date = arguments.get("start_date") or None
-            end_date = arguments.get("end_date") or None
-            limit = arguments.get("limit")
-            if limit is not None:
+            with metrics.timed(metrics.CALL_STAGE_SECONDS, "total"):
+                text, outcome = await _guarded(tool_name, run, arguments)
+        except asyncio.CancelledError:
+            metrics.TOOL_CALLS.labels("cancelled").inc()
+            raise
+        metrics.TOOL_CALLS.labels(outcome).inc()
+        return [TextContent(type="text", text=text)]
+
+    async def _conversation_search(arguments: dict) -> tuple[str, str]:
+        kwargs, error = _parse_search_arguments(arguments)
+        if error:
+            return error, "invalid"
+        key = search_key(**kwargs)
+        timeout = _parse_timeout(arguments.get("timeout_seconds"))
+        return await _shared("conversation_search", key, timeout, conversation_search, **kwargs)
+
+    async def _conversation_search_batch(arguments: dict) -> tuple[str, str]:
+        queries = arguments.get("queries")
+        if not isinstance(queries, list) or not all(isinstance(q, dict) for q in queries):
+            return "Invalid argument: queries must be a list of search objects.", "invalid"
+        specs = []
+        for i, spec in enumerate(queries, 1):
+            kwargs, error = _parse_search_arguments(spec)
+            if error:
+                return f"Query {i}: {error}", "invalid"
+            specs.append(kwargs)
+        max_bytes = _parse_max_bytes(arguments.get("max_bytes"))
+        key = (tuple(search_key(**spec) for spec in specs), max_bytes)
+        timeout = _parse_timeout(arguments.get("timeout_seconds"))
+        # One executor slot for the whole batch: its searches share a connection.
+        return await _shared(
+            "conversation_search_batch", key, timeout, conversation_search_batch, specs, max_bytes=max_bytes
+        )
+
+    async def _conversation_context(arguments: dict) -> tuple[str, str]:
+        kwargs = {
+            "message_id": arguments.get("message_id") or None,
+            "conversation_id": arguments.get("conversation_id") or None,
+        }
+        for name in ("position", "before", "after"):
+            if arguments.get(name) is not None:
                 try:
-                    limit = int(limit)
+                    kwargs[name] = int(arguments[name])
                 except (TypeError, ValueError):
-                    limit = 50
-            else:
-                limit = 50
-            result = conversation_search(
-                query=query,
-                roles=roles,
-                start_date=start_date,
-                end_date=end_date,
-                limit=max(1, min(limit, 200)),
-            )
-            return [TextContent(type="text", text=result)]
+                    return f"Invalid argument: {name} must be an integer.", "invalid"
+        kwargs["max_bytes"] = _parse_max_bytes(arguments.get("max_bytes"))
+        timeout = _parse_timeout(arguments.get("timeout_seconds"))
+        return await _shared("conversation_context", freeze(kwargs), timeout, conversation_context, **kwargs)
+
+    async def _conversation_stats(arguments: dict) -> tuple[str, str]:
+        kwargs, error = _parse_search_arguments(arguments)
+        if error:
+            return error, "invalid"
+        top = arguments.get("top")
+        try:
+            top = int(top) if top is not None else 10
+        except (TypeError, ValueError):
+            top = 10
+        stats_kwargs = {
+            "query": kwargs["query"],
+            "roles": sorted(set(kwargs["roles"])) if kwargs["roles"] else None,
+            "start_date": kwargs["start_date"],
+            "end_date": kwargs["end_date"],
+            "top": top,
+        }
+        timeout = _parse_timeout(arguments.get("timeout_seconds"))
+        return await _shared("conversation_stats", freeze(stats_kwargs), timeout, conversation_stats, **stats_kwargs)
+
+    async def _shared(tool_name: str, key, timeout: float | None, fn, *args, **kwargs) -> tuple[str, str]:
+        """_execute(fn, ...), shared with identical calls (same key, time limit and DBs) already in flight."""
+        seconds = deadline.effective_timeout(timeout)
+
+        def run():
+            return _execute(seconds, fn, *args, **kwargs)
+
+        if not flights.enabled:
+            return await run()
+        try:
+            # stat / glob of the DBs off the event loop (a slow disk must not stall other calls)
+            dbs = await asyncio.to_thread(db_identities)
+        except FileNotFoundError:  # reported by the call itself
+            return await run()
+        return await flights.run((tool_name, key, seconds, dbs), tool_name, run)
+
+    async def _execute(seconds: float | None, fn, *args, **kwargs) -> tuple[str, str]:
+        """Run fn on the executor under a deadline of seconds; (result, "ok" or "timeout" if cut short)."""
+        limit = deadline.Deadline(seconds)
+        try:
+            result = await executor.run(deadline.call, limit, fn, *args, **kwargs)
+        except asyncio.CancelledError:
+            limit.cancel()  # stops the SQLite statement the worker thread is running
+            raise
+        return result, "timeout" if limit.stopped() else "ok"
+
+    async def _guarded(tool_name: str, run, arguments: dict) -> tuple[str, str]:
+        """Run a tool body; returns (result text, outcome for metrics), mapping errors to text."""
+        try:
+            return await run(arguments)
+        except SearchBusyError as e:
+            logger.warning("call_tool %s rejected: %s", tool_name, e)
+            return f"Server busy: {e}", "busy"
+        except deadline.Interrupted as e:
+            return str(e), "timeout"
         except FileNotFoundError as e:
-            return [TextContent(type="text", text=f"Database not found: {e}")]
+            return f"Database not found: {e}", "not_found"
+        except ValueError as e:
+            return f"Invalid argument: {e}", "invalid"
         except Exception as e:
-            logger.error("call_tool conversation_search failed: %s", e, exc_info=True)
-            return [TextContent(type="text", text=f"Error: {e}")]
+            logger.error("call_tool %s failed: %s", tool_name, e, exc_info=True)
+            return f"Error: {e}", "error"
@@ -0,0 +1,214 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# origin_conversation - Opt-in log of slow searches with their query plans.
+"""
+Slow-query log: one JSON line per search slower than CONVERSATION_SLOW_QUERY_MS.
+
+The metrics histograms say that searches are slow, not which ones or why. With the
+threshold set, each search (a conversation_search call, or one entry of a batch) is
+traced on its worker thread: its stage timings (metrics.collect_stages), the work SQLite
+did vs the rows returned, and the SQL it ran. If it took at least the threshold, the
+EXPLAIN QUERY PLAN of each statement is captured on the connection that ran it (same
+attached sidecar, same parameters) and a record is appended to log_path():
+
+  {"ts": "...", "pid": 123, "elapsed_ms": 812.4, "db": ["..."], "args": {...normalized...},
+   "stages_ms": {"plan": 0.3, "execute": 806.2, ...}, "vm_steps": 48210000,
+   "result_rows_read": 51, "rows_returned": 50, "truncated": false,
+   "plans": [{"db": "...", "sql": "...", "plan": ["SCAN m", ...]}]}
+
+vm_steps is the scan work: SQLite virtual machine instructions the search ran, counted by
+the progress handler (deadline.count_ops) in steps of deadline._PROGRESS_OPS. It grows
+with the rows a statement visits, matched or not. result_rows_read is only the rows read
+from the statements' results (at most limit + 1 per DB).
+
+SCAN lines in the plans point at full scans and "USE TEMP B-TREE FOR ORDER BY" at sorts
+the index does not cover. The file rotates at CONVERSATION_SLOW_QUERY_LOG_BYTES with
+_BACKUPS old files kept. Searches are not slowed down when the threshold is unset (the
+default), and only by a few dict updates when it is.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterator
+
+from . import deadline, index, metrics
+from .pool import _env_int
+
+logger = logging.getLogger(__name__)
+
+_LOG_SUFFIX = ".slow.jsonl"
+_DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+_BACKUPS = 3
+
+
+def threshold_ms() -> float | None:
+    """CONVERSATION_SLOW_QUERY_MS as a number; None (log off) if unset, invalid or not positive."""
+    try:
+        ms = float(os.environ.get("CONVERSATION_SLOW_QUERY_MS", "0"))
+    except ValueError:
+        return None
+    return ms if ms > 0 else None
+
+
+def log_path(db_path: str) -> str:
+    """Where records of searches of db_path go, with {pid} replaced (one file per --http worker).
+
+    CONVERSATION_SLOW_QUERY_LOG if set; a relative path is taken relative to the index
+    directory, not the working directory (a stdio server runs wherever its client starts
+    it). Default: <db name>.slow.jsonl in the index directory (next to the DB unless
+    CONVERSATION_INDEX_DIR is set).
+    """
+    directory = os.path.dirname(index.sidecar_path(db_path))
+    path = os.environ.get("CONVERSATION_SLOW_QUERY_LOG", "").strip() or os.path.basename(db_path) + _LOG_SUFFIX
+    return os.path.join(directory, path.replace("{pid}", str(os.getpid())))
+
+
+class Trace:
+    """What one search did, collected while it runs on a worker thread."""
+
+    def __init__(self, threshold: float, db_paths: list[str], args: dict[str, Any]) -> None:
+        self.threshold = threshold
+        self.db_paths = db_paths
+        self.args = args
+        self.started = time.perf_counter()
+        self.result_rows_read = 0
+        self.vm_steps: Callable[[], int] = lambda: 0
+        self.rows_returned = 0
+        self.plans: list[dict[str, Any]] = []
+
+    @property
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    @property
+    def slow(self) -> bool:
+        return self.elapsed_ms >= self.threshold
+
+
+_local = threading.local()
+
+
+def current() -> Trace | None:
+    return getattr(_local, "trace", None)
+
+
+@contextmanager
+def trace(db_paths: list[str], args: dict[str, Any]) -> Iterator[None]:
+    """Trace the search in the block; log it on exit if it took at least the threshold."""
+    threshold = threshold_ms()
+    if threshold is None:
+        yield
+        return
+    previous = current()
+    record = Trace(threshold, db_paths, args)
+    _local.trace = record
+    error: BaseException | None = None
+    try:
+        with metrics.collect_stages() as stages, deadline.count_ops() as record.vm_steps:
+            yield
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _local.trace = previous
+        if record.slow:
+            _write(record, stages, error)
+
+
+def rows(read: int, returned: int) -> None:
+    """Count rows read from statement results and rows returned for the traced search (if any)."""
+    record = current()
+    if record is not None:
+        record.result_rows_read += read
+        record.rows_returned += returned
+
+
+def explain(conn: sqlite3.Connection, db_path: str, sql: str, params: list[Any]) -> None:
+    """Capture EXPLAIN QUERY PLAN of a statement of the traced search, once it is slow."""
+    record = current()
+    if record is None or not record.slow:
+        return
+    entry: dict[str, Any] = {"db": db_path, "sql": " ".join(sql.split())}
+    try:
+        entry["plan"] = _plan_lines(conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall())
+    except sqlite3.Error as e:
+        entry["plan_error"] = str(e)
+    record.plans.append(entry)
+
+
+def _plan_lines(rows: list[Any]) -> list[str]:
+    """EXPLAIN QUERY PLAN rows (id, parent, notused, detail) as lines indented by depth."""
+    depth: dict[int, int] = {0: -1}
+    lines = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node] + detail)
+    return lines
+
+
+_handler_lock = threading.Lock()
+_handler: logging.Handler | None = None
+_handler_path: str | None = None
+_records = logging.getLogger(f"{__name__}.records")
+_records.propagate = False
+_records.setLevel(logging.INFO)
+
+
+def _write(record: Trace, stages: dict[str, float], error: BaseException | None) -> None:
+    line = {
+        "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "pid": os.getpid(),
+        "elapsed_ms": round(record.elapsed_ms, 3),
+        "db": record.db_paths,
+        "args": record.args,
+        "stages_ms": {stage: round(seconds * 1000, 3) for stage, seconds in stages.items()},
+        "vm_steps": record.vm_steps(),
+        "result_rows_read": record.result_rows_read,
+        "rows_returned": record.rows_returned,
+        "truncated": deadline.stopped(),
+        "plans": record.plans,
+    }
+    if error is not None:
+        line["error"] = f"{type(error).__name__}: {error}"
+    try:
+        _ensure_handler(log_path(record.db_paths[0]))
+        _records.info(json.dumps(line, ensure_ascii=False, default=str))
+    except OSError as e:
+        logger.warning("Could not write slow-query log %s: %s", log_path(record.db_paths[0]), e)
+
+
+def _ensure_handler(path: str) -> None:
+    """Attach a rotating file handler for path (again if the path changed)."""
+    global _handler, _handler_path
+    with _handler_lock:
+        if _handler is not None and _handler_path == path:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            path,
+            maxBytes=max(0, _env_int("CONVERSATION_SLOW_QUERY_LOG_BYTES", _DEFAULT_MAX_BYTES)),
+            backupCount=_BACKUPS,
+            encoding="utf-8",
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        if _handler is not None:
+            _records.removeHandler(_handler)
+            _handler.close()
+        _records.addHandler(handler)
+        _handler, _handler_path = handler, path
+        logger.info("Logging searches slower than %g ms to %s", threshold_ms() or 0, path)
+
+
+def reset() -> None:
+    """Close the log file (e.g. between tests)."""
+    global _handler, _handler_path
+    with _handler_lock:
+        if _handler is not None:
+            _records.removeHandler(_handler)
+            _handler.close()
+        _handler, _handler_path = None, None
@@ -0,0 +1,279 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# origin_conversation - In-memory columnar snapshot of the export (--in-memory).
+"""
+In-memory columnar snapshot of messages and conversations (requires numpy).
+
+With CONVERSATION_IN_MEMORY=1 (--in-memory), each DB is loaded once into compact arrays,
+sorted in result order (normalized time descending, then rowid descending):
+rowids (int64), neg_ts (float64 epoch, negated so it ascends; index.UNDATED_TS if
+unknown), roles (uint8 codes, as in semantic.ROLE_CODES), conv (int32 index into the
+conversations) and content as int64 offsets into one contiguous ASCII-lowercased UTF-8
+buffer (NUL-separated); titles are stored the same way. A newest-first search (substring
+mode, or text mode without a query; text queries keep BM25 ranking on SQLite) then needs
+no SQLite scan: a date range or cursor is a slice of the sorted arrays, role filters are
+vectorized masks, and the query is a case-insensitive substring search over the buffer
+(the same match as substring mode's SQL). The window is scanned in growing chunks and stops once limit + 1 rows
+qualify; only those rows are then read from SQLite (by rowid) to format the page.
+Like the FTS sidecar and embeddings, a snapshot is tied to the DB fingerprint, reloaded
+in the background when the DB changes, and search uses SQLite until it is ready.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, NamedTuple
+from urllib.parse import quote
+
+from . import index
+from .semantic import ROLE_CODES
+
+np: Any = None  # numpy, imported on first use (see semantic._require_numpy)
+
+logger = logging.getLogger(__name__)
+
+_SEPARATOR = b"\0"
+_FIRST_CHUNK = 4096
+_MAX_CHUNK = 262144
+
+_lock = threading.Lock()
+_loading: set[str] = set()
+_failed: dict[str, str] = {}
+_loaded: dict[str, tuple[str, "Snapshot"]] = {}  # db_path -> (fingerprint, snapshot)
+
+
+def in_memory_enabled() -> bool:
+    """Whether CONVERSATION_IN_MEMORY asks for in-memory snapshots (off by default)."""
+    return os.environ.get("CONVERSATION_IN_MEMORY", "").strip().lower() in ("1", "on", "true", "yes")
+
+
+class Snapshot(NamedTuple):
+    rowids: Any
+    neg_ts: Any  # -ts, ascending
+    roles: Any
+    conv: Any
+    offsets: Any  # len(rowids) + 1 offsets into content
+    content: bytes
+    title_offsets: Any
+    titles: bytes
+    load_seconds: float
+
+    @property
+    def nbytes(self) -> int:
+        """Resident size of the arrays and buffers."""
+        arrays = (self.rowids, self.neg_ts, self.roles, self.conv, self.offsets, self.title_offsets)
+        return sum(a.nbytes for a in arrays) + len(self.content) + len(self.titles)
+
+    def search(
+        self,
+        query: str | None,
+        roles: tuple[str, ...] | None,
+        start_ts: float | None,
+        end_ts: float | None,
+        after: tuple[float, int] | None,
+        n: int,
+    ) -> list[tuple[int, float]]:
+        """Up to n (rowid, ts) matching the filters in result order, after the (ts, rowid) position."""
+        lo, hi = self._window(start_ts, end_ts, after)
+        codes = [ROLE_CODES.get(r, 0) for r in roles] if roles else None
+        needle = query.encode("utf-8").lower() if query else None
+        title_hits = self._title_hits(needle) if needle else None
+        out: list[tuple[int, float]] = []
+        chunk = _FIRST_CHUNK
+        while lo < hi and len(out) < n:
+            end = min(lo + chunk, hi)
+            mask = np.ones(end - lo, dtype=bool) if codes is None else np.isin(self.roles[lo:end], codes)
+            if needle is not None:
+                mask &= self._content_hits(needle, lo, end) | np.isin(self.conv[lo:end], title_hits)
+            for i in np.flatnonzero(mask)[: n - len(out)] + lo:
+                out.append((int(self.rowids[i]), -float(self.neg_ts[i])))
+            lo, chunk = end, min(chunk * 2, _MAX_CHUNK)
+        return out
+
+    def _window(
+        self, start_ts: float | None, end_ts: float | None, after: tuple[float, int] | None
+    ) -> tuple[int, int]:
+        """[lo, hi) of rows in the date range and after the cursor position (ts is descending)."""
+        neg = self.neg_ts
+        lo, hi = 0, len(neg)
+        if end_ts is not None:
+            lo = int(np.searchsorted(neg, -end_ts, "left"))
+        if start_ts is not None:
+            hi = int(np.searchsorted(neg, -start_ts, "right"))
+        elif end_ts is not None:
+            hi = int(np.searchsorted(neg, -index.UNDATED_TS, "left"))  # undated never match a range
+        if after is not None:
+            ts, rowid = after
+            first = int(np.searchsorted(neg, -ts, "left"))
+            last = int(np.searchsorted(neg, -ts, "right"))
+            tied = -self.rowids[first:last]  # ascending
+            lo = max(lo, first + int(np.searchsorted(tied, -rowid, "right")))
+        return lo, hi
+
+    def _content_hits(self, needle: bytes, lo: int, hi: int) -> Any:
+        """Mask of rows lo..hi whose content contains needle."""
+        hits = np.zeros(hi - lo, dtype=bool)
+        content, offsets = self.content, self.offsets
+        pos, stop = int(offsets[lo]), int(offsets[hi])
+        while True:
+            pos = content.find(needle, pos, stop)
+            if pos < 0:
+                return hits
+            i = int(np.searchsorted(offsets, pos, "right")) - 1
+            hits[i - lo] = True
+            pos = int(offsets[i + 1])  # next message
+
+    def _title_hits(self, needle: bytes) -> Any:
+        """Indices of conversations whose title contains needle."""
+        found = []
+        pos = 0
+        while (pos := self.titles.find(needle, pos)) >= 0:
+            i = int(np.searchsorted(self.title_offsets, pos, "right")) - 1
+            found.append(i)
+            pos = int(self.title_offsets[i + 1])
+        return np.array(found, dtype=np.int32)
+
+
+def _require_numpy() -> None:
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise RuntimeError("--in-memory requires numpy (pip install origin-conversation[semantic])") from None
+        np = numpy
+
+
+def _pack(texts: list[bytes]) -> tuple[Any, bytes]:
+    """Offsets (len(texts) + 1) and the NUL-separated buffer of texts."""
+    lengths = np.fromiter((len(t) + len(_SEPARATOR) for t in texts), dtype=np.int64, count=len(texts))
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets, _SEPARATOR.join(texts) + (_SEPARATOR if texts else b"")
+
+
+def load(db_path: str) -> Snapshot:
+    """Read db_path into a Snapshot (messages without a conversation are left out, as in search)."""
+    from .search import _create_time_comparable
+
+    _require_numpy()
+    started = time.perf_counter()
+    fingerprint = index.source_fingerprint(db_path)
+    with sqlite3.connect(f"file:{quote(db_path, safe='')}?mode=ro", uri=True) as conn:
+        conv_index: dict[str, int] = {}
+        titles: list[bytes] = []
+        for conv_id, title in conn.execute("SELECT id, title FROM conversations"):
+            if conv_id not in conv_index:
+                conv_index[conv_id] = len(titles)
+                titles.append((title or "").encode("utf-8").lower())
+        rowids, ts, roles, conv, contents = [], [], [], [], []
+        for rowid, role, create_time, conv_id, content in conn.execute(
+            "SELECT m.rowid, m.role, m.create_time, m.conversation_id, m.content "
+            "FROM messages m JOIN conversations c ON c.id = m.conversation_id"
+        ):
+            t = _create_time_comparable(create_time)
+            rowids.append(rowid)
+            ts.append(index.UNDATED_TS if t is None else t)
+            roles.append(ROLE_CODES.get(role, 0))
+            conv.append(conv_index[conv_id])
+            contents.append((content or "").encode("utf-8").lower())
+    rowid_arr = np.array(rowids, dtype=np.int64)
+    ts_arr = np.array(ts, dtype=np.float64)
+    order = np.lexsort((-rowid_arr, -ts_arr))  # ts DESC, then rowid DESC
+    offsets, content = _pack([contents[i] for i in order])
+    del contents
+    title_offsets, title_buffer = _pack(titles)
+    snapshot = Snapshot(
+        rowid_arr[order],
+        -ts_arr[order],
+        np.array(roles, dtype=np.uint8)[order],
+        np.array(conv, dtype=np.int32)[order],
+        offsets,
+        content,
+        title_offsets,
+        title_buffer,
+        time.perf_counter() - started,
+    )
+    with _lock:
+        _loaded[db_path] = (fingerprint, snapshot)
+    return snapshot
+
+
+def _load_in_background(db_path: str, fingerprint: str) -> None:
+    try:
+        snapshot = load(db_path)
+        logger.info(
+            "Loaded in-memory snapshot of %s: %d messages, %.1f MiB in %.2fs",
+            db_path, len(snapshot.rowids), snapshot.nbytes / 2**20, snapshot.load_seconds,
+        )
+    except Exception as e:
+        logger.warning("In-memory snapshot failed for %s (using SQLite): %s", db_path, e)
+        with _lock:
+            _failed[db_path] = fingerprint
+    finally:
+        with _lock:
+            _loading.discard(db_path)
+
+
+def is_loaded(db_path: str) -> bool:
+    """Whether a snapshot of the current version of db_path is loaded (nothing is started)."""
+    cached = _loaded.get(db_path)
+    try:
+        return cached is not None and cached[0] == index.source_fingerprint(db_path)
+    except OSError:
+        return False
+
+
+def get(db_path: str) -> Snapshot | None:
+    """The snapshot of db_path if in-memory mode is on and it is loaded and current.
+
+    Otherwise start loading it in the background (once per DB version) and return None so
+    the caller uses SQLite meanwhile.
+    """
+    if not in_memory_enabled():
+        return None
+    try:
+        _require_numpy()
+        fingerprint = index.source_fingerprint(db_path)
+    except (RuntimeError, OSError):
+        return None
+    with _lock:
+        cached = _loaded.get(db_path)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        if db_path in _loading or _failed.get(db_path) == fingerprint:
+            return None
+        _loaded.pop(db_path, None)  # drop the stale snapshot before loading the new one
+        _loading.add(db_path)
+    threading.Thread(
+        target=_load_in_background,
+        args=(db_path, fingerprint),
+        name="origin-conversation-snapshot",
+        daemon=True,
+    ).start()
+    return None
+
+
+def preload(db_paths: list[str]) -> list[str]:
+    """Load snapshots of db_paths now (at startup); return one report line per DB."""
+    lines = []
+    for db_path in db_paths:
+        with _lock:
+            _loading.add(db_path)  # searches meanwhile use SQLite instead of starting a load
+        try:
+            snapshot = load(db_path)
+        finally:
+            with _lock:
+                _loading.discard(db_path)
+        lines.append(
+            f"in-memory snapshot {db_path}: {len(snapshot.rowids)} messages, "
+            f"{snapshot.nbytes / 2**20:.1f} MiB resident, loaded in {snapshot.load_seconds:.2f}s"
+        )
+    return lines
+
+
+def reset() -> None:
+    """Drop loaded snapshots (e.g. between tests)."""
+    with _lock:
+        _loaded.clear()
+        _failed.clear()
@@ -0,0 +1,121 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# origin_conversation - Match-centered snippets of message content.
+"""
+Snippets: the parts of a message around its matches instead of its first characters.
+
+With snippet_chars, search shows each result's content as up to _MAX_WINDOWS windows
+centered on the matches, about snippet_chars characters in all, with the matches marked
+**like this**, whitespace collapsed and elided text shown as "…". Match offsets come
+from the FTS index where the search used it (highlight() over msg_fts, which uses the
+token positions the index stores); otherwise they are located in Python the way the mode
+matches (query words as prefixes, the literal query, the regex, the fuzzy alignment).
+A message with no match in its content (e.g. a title match, or a semantic neighbour)
+shows its first snippet_chars characters.
+"""
+import re
+from typing import Iterable
+
+from . import patterns
+
+# highlight() markers around matched tokens; control characters that exports do not contain.
+MARK_START = "\x02"
+MARK_END = "\x03"
+
+_MAX_WINDOWS = 3
+_ELLIPSIS = "…"
+_HIGHLIGHT = "**"
+_WHITESPACE = re.compile(r"\s+")
+
+
+def marked_spans(marked: str) -> tuple[str, list[tuple[int, int]]]:
+    """Strip MARK_START / MARK_END from highlight() output; return the text and the marked spans."""
+    parts = re.split(f"([{MARK_START}{MARK_END}])", marked)
+    text: list[str] = []
+    spans: list[tuple[int, int]] = []
+    length = 0
+    start = None
+    for part in parts:
+        if part == MARK_START:
+            start = length
+        elif part == MARK_END:
+            if start is not None and length > start:
+                spans.append((start, length))
+            start = None
+        else:
+            text.append(part)
+            length += len(part)
+    return "".join(text), spans
+
+
+def word_spans(query: str, text: str) -> list[tuple[int, int]]:
+    """Spans of words of text starting with a word of query (case-insensitive), like the FTS query."""
+    tokens = re.findall(r"\w+", query)
+    if not tokens:
+        return []
+    pattern = re.compile(r"(?<!\w)(?:" + "|".join(re.escape(t) for t in tokens) + r")\w*", re.IGNORECASE)
+    return [m.span() for m in pattern.finditer(text)]
+
+
+def substring_spans(query: str, text: str) -> list[tuple[int, int]]:
+    """Spans of query in text, ASCII case-insensitive (as LIKE matches)."""
+    pattern = re.compile(re.escape(query), re.IGNORECASE | re.ASCII)
+    return [m.span() for m in pattern.finditer(text)]
+
+
+def regex_spans(query: str, text: str) -> list[tuple[int, int]]:
+    """Non-empty spans of matches of the regex query in text."""
+    return [m.span() for m in patterns.compile_regex(query).finditer(text) if m.end() > m.start()]
+
+
+def snippet(text: str, spans: Iterable[tuple[int, int]], width: int) -> str:
+    """Windows around spans (the first _MAX_WINDOWS), about width characters in all, matches marked.
+
+    Without spans, the first width characters.
+    """
+    spans = sorted(spans)
+    if not spans:
+        head = _WHITESPACE.sub(" ", text[:width]).strip()
+        return head + (_ELLIPSIS if len(text) > width else "")
+    share = width // min(len(spans), _MAX_WINDOWS)
+    # Group matches that fit in one window, then pad each group to its share.
+    groups: list[list[int]] = []
+    for start, end in spans:
+        if groups and end - groups[-1][0] <= share:
+            groups[-1][1] = max(groups[-1][1], end)
+        elif len(groups) < _MAX_WINDOWS:
+            groups.append([start, end])
+        else:
+            break
+    windows: list[tuple[int, int]] = []
+    for start, end in groups:
+        pad = max(0, share - (end - start)) // 2
+        lo = max(0, start - pad)
+        hi = min(len(text), end + pad, lo + share)  # a match longer than share is cut (see _mark)
+        if windows and lo <= windows[-1][1]:
+            lo = windows.pop()[0]
+        windows.append((lo, hi))
+    out = f" {_ELLIPSIS} ".join(_mark(text, lo, hi, spans) for lo, hi in windows)
+    if windows[0][0] > 0:
+        out = f"{_ELLIPSIS} {out}"
+    if windows[-1][1] < len(text):
+        out = f"{out} {_ELLIPSIS}"
+    return out
+
+
+def _mark(text: str, lo: int, hi: int, spans: list[tuple[int, int]]) -> str:
+    """text[lo:hi] with the spans in it (clipped) wrapped in _HIGHLIGHT, whitespace collapsed.
+
+    A span cut at hi ends in _ELLIPSIS inside the marks.
+    """
+    out: list[str] = []
+    pos = lo
+    for start, end in spans:
+        cut = end > hi
+        start, end = max(start, pos), min(end, hi)
+        if end <= start:
+            continue
+        out.append(text[pos:start])
+        out.append(f"{_HIGHLIGHT}{text[start:end]}{_ELLIPSIS if cut else ''}{_HIGHLIGHT}")
+        pos = end
+    out.append(text[pos:hi])
+    return _WHITESPACE.sub(" ", "".join(out)).strip()
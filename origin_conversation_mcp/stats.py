@@ -0,0 +1,237 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# origin_conversation - Facet counts over the conversation export.
+"""
+conversation_stats: message counts by role and month, and the largest conversations, for
+the same filters as conversation_search (query, roles, date range).
+
+Without a query the counts come from aggregates precomputed into the sidecar when it is
+built (agg_day: messages per UTC day and role; agg_conv_day: per conversation, day and
+role), so a call groups a few small tables whatever the size of the export. With a query
+the FTS matches are grouped in SQL. Either way no message content is read or formatted.
+While the sidecar is building, the same groups are computed over the messages table.
+Date ranges select whole UTC days.
+With several DBs, a conversation found in more than one (a re-dump) counts once (see _merge).
+"""
+import heapq
+import math
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, NamedTuple
+
+from . import index, metrics, pool
+from .cache import result_cache
+from .search import SearchKey, _attach_index, _fts_query, _resolve, search_key
+
+_DEFAULT_TOP = 10
+_MAX_TOP = 100
+_SECONDS_PER_DAY = 86400
+_UNDATED = "undated"
+
+
+class Facets(NamedTuple):
+    """Counts for one DB (or several, merged)."""
+
+    by_month: dict[str | None, dict[str, int]]  # "YYYY-MM" (None: undated) -> role -> messages
+    # Conversations with at least one counted message: id -> (messages, first_ts, last_ts).
+    conversations: dict[str, tuple[int, float | None, float | None]]
+    titles: dict[str, str | None]  # titles of the top conversations
+
+
+def conversation_stats(
+    query: str | None = None,
+    roles: list[str] | None = None,
+    start_date: str | None = None,
+    end_date: str | None = None,
+    top: int = _DEFAULT_TOP,
+) -> str:
+    """
+    Return facet counts for messages matching the filters: totals by role, a monthly
+    histogram (UTC) and the top conversations by matching messages.
+    - query, roles, start_date, end_date: as for conversation_search; dates select whole days
+    - top: number of conversations to list, clamped to 0.._MAX_TOP
+    """
+    key = search_key(query, roles, start_date, end_date, 0)
+    top = max(0, min(int(top), _MAX_TOP))
+    db_paths, identity = _resolve()
+    cache_key = ("stats", key, top)
+    with metrics.timed(metrics.SEARCH_STAGE_SECONDS, "cache_lookup"):
+        cached = result_cache.get(identity, cache_key)
+    if cached is not None:
+        return cached
+    pool.retain(db_paths)
+    days = (
+        math.floor(key.start_ts / _SECONDS_PER_DAY) if key.start_ts is not None else None,
+        math.floor(key.end_ts / _SECONDS_PER_DAY) if key.end_ts is not None else None,
+    )
+    shards = []
+    for db_path in db_paths:
+        with pool.connection(db_path) as conn:
+            shards.append(_facets(conn, db_path, key, days, top))
+    result = _format(_merge(shards), top)
+    result_cache.put(identity, cache_key, result)
+    return result
+
+
+def _facets(
+    conn: pool.PooledConnection, db_path: str, key: SearchKey, days: tuple[int | None, int | None], top: int
+) -> Facets:
+    """Facets for one DB: from the sidecar aggregates, grouped FTS matches, or a scan."""
+    with metrics.timed(metrics.SEARCH_STAGE_SECONDS, "plan"):
+        indexed = _attach_index(conn, db_path)
+        fts_match = _fts_query(key.query) if key.query else None
+        if indexed and not key.query:
+            day_sql, conv_sql, params = _aggregate_sql(key, days)
+        else:
+            day_sql, conv_sql, params = _match_sql(key, days, fts_match if indexed else None)
+    with metrics.timed(metrics.SEARCH_STAGE_SECONDS, "execute"):
+        by_month: dict[str | None, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        for day, role, n in conn.execute(day_sql, params):
+            by_month[_month(day)][role or "unknown"] += n
+        conversations = {
+            conv_id: (n, first_ts, last_ts) for conv_id, n, first_ts, last_ts in conn.execute(conv_sql, params)
+        }
+        titles = _titles(conn, _top(conversations, top))
+    return Facets(by_month, conversations, titles)
+
+
+def _aggregate_sql(key: SearchKey, days: tuple[int | None, int | None]) -> tuple[str, str, list[Any]]:
+    """Grouping SQL over the precomputed ix.agg_day / ix.agg_conv_day tables."""
+    where, params = [], []
+    if key.roles:
+        where.append(f"role IN ({','.join('?' * len(key.roles))})")
+        params.extend(key.roles)
+    if days[0] is not None:
+        where.append("day >= ?")
+        params.append(days[0])
+    if days[1] is not None:
+        where.append("day <= ?")
+        params.append(days[1])
+    clause = " WHERE " + " AND ".join(where) if where else ""
+    day_sql = f"SELECT day, role, sum(n) FROM ix.agg_day{clause} GROUP BY day, role"
+    conv_sql = (
+        "SELECT conversation_id, sum(n) AS n, min(first_ts) AS first_ts, max(last_ts) AS last_ts "
+        f"FROM ix.agg_conv_day{clause} GROUP BY conversation_id"
+    )
+    return day_sql, conv_sql, params
+
+
+def _match_sql(
+    key: SearchKey, days: tuple[int | None, int | None], fts_match: str | None
+) -> tuple[str, str, list[Any]]:
+    """Grouping SQL over matching messages: FTS matches if fts_match, else a LIKE / filter scan."""
+    where, params = [], []
+    if fts_match:
+        source = """ix.msg_fts
+            JOIN ix.msg_doc d ON d.doc = msg_fts.rowid
+            JOIN ix.msg_time t ON t.rowid = d.msg_rowid
+            JOIN messages m ON m.rowid = d.msg_rowid
+            JOIN conversations c ON c.id = m.conversation_id"""
+        ts = f"NULLIF(t.ts, {index.UNDATED_TS!r})"
+        where.append("msg_fts MATCH ?")
+        params.append(fts_match)
+    else:
+        source = "messages m JOIN conversations c ON c.id = m.conversation_id"
+        ts = "ct_epoch(m.create_time)"
+        if key.query:
+            q = f"%{key.query}%"
+            where.append("(m.content LIKE ? OR c.title LIKE ?)")
+            params.extend([q, q])
+    if key.roles:
+        where.append(f"m.role IN ({','.join('?' * len(key.roles))})")
+        params.extend(key.roles)
+    if days[0] is not None:
+        where.append(f"{ts} >= ?")
+        params.append(days[0] * _SECONDS_PER_DAY)
+    if days[1] is not None:
+        where.append(f"{ts} < ?")
+        params.append((days[1] + 1) * _SECONDS_PER_DAY)
+    clause = " WHERE " + " AND ".join(where) if where else ""
+    day_sql = f"SELECT utc_day({ts}), m.role, count(*) FROM {source}{clause} GROUP BY 1, 2"
+    conv_sql = (
+        f"SELECT m.conversation_id AS conversation_id, count(*) AS n, min({ts}) AS first_ts, "
+        f"max({ts}) AS last_ts FROM {source}{clause} GROUP BY m.conversation_id"
+    )
+    return day_sql, conv_sql, params
+
+
+def _top(conversations: dict[str, tuple[int, float | None, float | None]], top: int) -> list[str]:
+    """Ids of the top conversations by messages (ties by id)."""
+    return [conv_id for _, conv_id in heapq.nsmallest(top, ((-v[0], k) for k, v in conversations.items()))]
+
+
+def _titles(conn: pool.PooledConnection, conversation_ids: list[str]) -> dict[str, str]:
+    if not conversation_ids:
+        return {}
+    placeholders = ",".join("?" * len(conversation_ids))
+    return dict(conn.execute(f"SELECT id, title FROM conversations WHERE id IN ({placeholders})", conversation_ids))
+
+
+def _month(day: int | None) -> str | None:
+    if day is None:
+        return None
+    return datetime.fromtimestamp(day * _SECONDS_PER_DAY, tz=timezone.utc).strftime("%Y-%m")
+
+
+def _merge(shards: list[Facets]) -> Facets:
+    """Sum per-DB message counts; merge conversations by id.
+
+    Federated re-dumps hold the same conversation in several DBs: it counts once, with the
+    most messages any one DB has for it (the most complete dump) and the widest time span.
+    Messages are counted per DB, as federated search returns each DB's copy. The global top
+    is within the per-DB tops (a conversation's count is its count in some DB, where at
+    most as many rank above it), so their titles suffice.
+    """
+    if len(shards) == 1:
+        return shards[0]
+    by_month: dict[str | None, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    conversations: dict[str, tuple[int, float | None, float | None]] = {}
+    titles: dict[str, str | None] = {}
+    for facets in shards:
+        for month, counts in facets.by_month.items():
+            for role, n in counts.items():
+                by_month[month][role] += n
+        for conv_id, (n, first_ts, last_ts) in facets.conversations.items():
+            seen = conversations.get(conv_id)
+            if seen is not None:
+                n = max(n, seen[0])
+                first_ts = min((t for t in (first_ts, seen[1]) if t is not None), default=None)
+                last_ts = max((t for t in (last_ts, seen[2]) if t is not None), default=None)
+            conversations[conv_id] = (n, first_ts, last_ts)
+        for conv_id, title in facets.titles.items():
+            titles.setdefault(conv_id, title)
+    return Facets(by_month, conversations, titles)
+
+
+def _format(facets: Facets, top: int) -> str:
+    by_role: dict[str, int] = defaultdict(int)
+    for counts in facets.by_month.values():
+        for role, n in counts.items():
+            by_role[role] += n
+    total = sum(by_role.values())
+    if not total:
+        return "No matching messages."
+    lines = [
+        f"Messages: {total} in {len(facets.conversations)} conversation{'s' if len(facets.conversations) != 1 else ''}",
+        f"By role: {_counts(by_role)}",
+        "By month (UTC):",
+    ]
+    for month in sorted(facets.by_month, key=lambda m: (m is None, m)):
+        counts = facets.by_month[month]
+        lines.append(f"  {month or _UNDATED}: {sum(counts.values())} ({_counts(counts)})")
+    top_ids = _top(facets.conversations, top)
+    if top_ids:
+        lines.append("Top conversations:")
+        for conv_id in top_ids:
+            n, first_ts, last_ts = facets.conversations[conv_id]
+            title = facets.titles.get(conv_id)
+            span = f"{_day(first_ts)} to {_day(last_ts)}" if first_ts is not None else _UNDATED
+            lines.append(f"  {n}  {(title or '').strip() or conv_id[:8]} (conv: {conv_id}; {span})")
+    return "\n".join(lines)
+
+
+def _counts(counts: dict[str, int]) -> str:
+    return ", ".join(f"{role} {n}" for role, n in sorted(counts.items()))
+
+
+def _day(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d")
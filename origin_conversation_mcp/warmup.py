@@ -0,0 +1,140 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# origin_conversation - Start-up warm-up in the background.
+"""
+Warm-up run at server start, concurrently with importing the MCP SDK and the client
+handshake, so the first search does not pay for it.
+
+In a background thread: resolve the DB(s) (resolve_db), make sure each sidecar index is
+built (index), open a pooled connection, attach the sidecar and read the pages a first
+search touches (connect), ask the kernel to read the sidecar into the page cache
+(prefetch; posix_fadvise, up to CONVERSATION_MMAP_SIZE bytes) and, with --in-memory, load
+the snapshots (snapshot). Each stage is timed into origin_conversation_startup_seconds;
+status() reports progress for GET /ready under --sse / --http. Searches that arrive
+before warm-up finishes are served as usual (LIKE fallback while an index builds).
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any
+
+from . import index, metrics, pool, snapshot
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_thread: threading.Thread | None = None
+_started = 0.0
+_stages: dict[str, float] = {}
+_finished = threading.Event()
+_error: str | None = None
+
+
+def start(in_memory: bool = False) -> threading.Thread:
+    """Start the warm-up thread (once per process) and return it."""
+    global _thread, _started
+    with _lock:
+        if _thread is None:
+            _started = time.perf_counter()
+            _thread = threading.Thread(
+                target=_run, args=(in_memory,), name="origin-conversation-warmup", daemon=True
+            )
+            _thread.start()
+        return _thread
+
+
+def _stage(name: str, seconds: float) -> None:
+    with _lock:
+        _stages[name] = _stages.get(name, 0.0) + seconds
+    metrics.STARTUP_SECONDS.labels(name).observe(seconds)
+
+
+def _timed(name: str, fn: Any, *args: Any) -> Any:
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        _stage(name, time.perf_counter() - started)
+
+
+def _run(in_memory: bool) -> None:
+    global _error
+    from .search import _get_db_paths
+
+    try:
+        db_paths = _timed("resolve_db", _get_db_paths)
+        for db_path in db_paths:
+            sidecar = _timed("index", index.prepare_sidecar, db_path)
+            _timed("connect", _connect, db_path)
+            if sidecar is not None:
+                _timed("prefetch", _prefetch, sidecar)
+        if in_memory:
+            for line in _timed("snapshot", snapshot.preload, db_paths):
+                logger.info("Loaded %s", line)
+    except Exception as e:
+        logger.warning("Warm-up failed (searches will retry): %s", e)
+        _error = str(e)
+    finally:
+        _stage("warm_total", time.perf_counter() - _started)
+        _finished.set()
+
+
+def _connect(db_path: str) -> None:
+    """Open a pooled connection, attach the sidecar and read the pages a first search needs."""
+    from .search import _attach_index
+
+    with pool.connection(db_path) as conn:
+        conn.execute("SELECT 1 FROM messages LIMIT 1").fetchall()
+        conn.execute("SELECT 1 FROM conversations LIMIT 1").fetchall()
+        if _attach_index(conn, db_path):
+            conn.execute("SELECT value FROM ix.meta WHERE key = 'max_ts'").fetchall()
+            conn.execute("SELECT rowid FROM ix.msg_time ORDER BY ts DESC LIMIT 1").fetchall()
+            conn.execute("SELECT rowid FROM ix.msg_fts WHERE msg_fts MATCH 'warmup' LIMIT 1").fetchall()
+
+
+def _prefetch(path: str) -> None:
+    """Ask the kernel to start reading path into the page cache (no-op where unsupported)."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    limit = pool._env_int("CONVERSATION_MMAP_SIZE", pool._DEFAULT_MMAP_SIZE)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, min(os.fstat(fd).st_size, limit), os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+
+def is_ready() -> bool:
+    """Whether warm-up has finished without error."""
+    return _finished.is_set() and _error is None
+
+
+def wait(timeout: float | None = None) -> bool:
+    """Block until warm-up has finished (or timeout); return whether it has."""
+    return _finished.wait(timeout)
+
+
+def status() -> dict[str, Any]:
+    """Readiness and per-stage seconds so far (JSON-serializable)."""
+    with _lock:
+        stages = {name: round(seconds, 4) for name, seconds in _stages.items()}
+    return {
+        "ready": is_ready(),
+        "started": _thread is not None,
+        "finished": _finished.is_set(),
+        "error": _error,
+        "stages": stages,
+    }
+
+
+def reset() -> None:
+    """Forget warm-up state (e.g. between tests); a running thread is waited for briefly."""
+    global _thread, _error
+    thread = _thread
+    if thread is not None:
+        thread.join(timeout=5)
+    with _lock:
+        _thread = None
+        _stages.clear()
+        _error = None
+        _finished.clear()
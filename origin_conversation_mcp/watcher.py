@@ -0,0 +1,181 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# origin_conversation - Resolve the db/ export once and watch for newer ones.
+"""
+Cached resolution of the newest db/*.db with a polling watcher.
+
+The db/ directory is globbed once; after that the resolved path is kept and a background
+thread polls db/ every CONVERSATION_DB_POLL_SECONDS. A newer export is adopted only after
+its size and mtime are unchanged across two polls (so a copy in progress is not picked
+up) and after it has been warmed: sidecar index built (incrementally, from the previous
+export's; see index.py) and a pooled connection opened.
+The swap itself is a single assignment, so a burst of queries never sees a half-switched
+DB.
+For federated search, resolve_all() returns every *.db in db/ as shards; once it has been
+called, the same poll also adds new exports (stable and warmed, as above) to the shard
+list and drops deleted ones.
+"""
+import logging
+import os
+import threading
+from pathlib import Path
+
+from . import index, pool
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_POLL_SECONDS = 5.0
+
+
+def _poll_interval() -> float:
+    try:
+        return float(os.environ.get("CONVERSATION_DB_POLL_SECONDS", str(_DEFAULT_POLL_SECONDS)))
+    except ValueError:
+        return _DEFAULT_POLL_SECONDS
+
+
+def all_dbs(db_dir: Path) -> list[Path]:
+    """Every *.db in db_dir, newest first by mtime; raises FileNotFoundError if the dir or files are missing."""
+    if not db_dir.is_dir():
+        raise FileNotFoundError(f"db/ directory not found: {db_dir}")
+    candidates = sorted(db_dir.glob("*.db"), key=lambda p: p.stat().st_mtime, reverse=True)
+    if not candidates:
+        raise FileNotFoundError(f"No *.db file in {db_dir}")
+    return candidates
+
+
+def newest_db(db_dir: Path) -> Path:
+    """Newest *.db in db_dir by mtime; raises FileNotFoundError if the dir or files are missing."""
+    return all_dbs(db_dir)[0]
+
+
+def warm(db_path: str) -> None:
+    """Prepare db_path for searching: build its sidecar index and open a pooled connection."""
+    sidecar = index.prepare_sidecar(db_path)
+    with pool.connection(db_path) as conn:
+        conn.execute("SELECT 1 FROM messages LIMIT 1").fetchall()
+        if sidecar is not None:
+            from .search import _attach_index
+
+            _attach_index(conn, db_path)
+
+
+class DbWatcher:
+    """Holds the current db/ export and swaps in newer ones after warming them."""
+
+    def __init__(self, db_dir: Path, current: str, poll_interval: float) -> None:
+        self.db_dir = db_dir
+        self.current = current
+        self.poll_interval = poll_interval
+        self.shards: list[str] | None = None  # set by track_shards()
+        self._pending: tuple[str, int, int] | None = None
+        self._shard_sightings: dict[str, tuple[int, int]] = {}
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self.poll_interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="origin-conversation-db-watch", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.check_once()
+            except Exception as e:
+                logger.warning("db/ watch failed: %s", e)
+
+    def track_shards(self) -> list[str]:
+        """Start keeping the list of all exports in db/ (for federated search) and return it."""
+        if self.shards is None:
+            self.shards = [str(p) for p in all_dbs(self.db_dir)]
+        return self.shards
+
+    def check_once(self) -> bool:
+        """Poll db/ once; return True if a newer export was swapped in."""
+        try:
+            listing = all_dbs(self.db_dir)
+        except FileNotFoundError:
+            return False
+        if self.shards is not None:
+            self._refresh_shards(listing)
+        newest = listing[0]
+        path = str(newest)
+        if path == self.current:
+            self._pending = None
+            return False
+        st = newest.stat()
+        seen = (path, st.st_size, st.st_mtime_ns)
+        if self._pending != seen:
+            # First sighting (or still being written): adopt only once it is stable.
+            self._pending = seen
+            return False
+        self._pending = None
+        warm(path)
+        previous, self.current = self.current, path
+        logger.warning("Switched conversation DB: %s -> %s", previous, path)
+        return True
+
+    def _refresh_shards(self, listing: list[Path]) -> None:
+        """Add exports that are stable across two polls (after warming them); drop deleted ones."""
+        known = set(self.shards or ())
+        sightings: dict[str, tuple[int, int]] = {}
+        shards: list[str] = []
+        for p in listing:
+            path = str(p)
+            if path in known:
+                shards.append(path)
+                continue
+            st = p.stat()
+            sightings[path] = (st.st_size, st.st_mtime_ns)
+            if self._shard_sightings.get(path) == sightings[path]:
+                warm(path)
+                logger.warning("Added conversation DB shard: %s", path)
+                shards.append(path)
+        self._shard_sightings = sightings
+        for path in known - set(shards):
+            logger.warning("Removed conversation DB shard: %s", path)
+        self.shards = shards
+
+
+_lock = threading.Lock()
+_watchers: dict[Path, DbWatcher] = {}
+
+
+def _watcher(db_dir: Path) -> DbWatcher:
+    watcher = _watchers.get(db_dir)
+    if watcher is not None:
+        return watcher
+    current = str(newest_db(db_dir))
+    with _lock:
+        watcher = _watchers.get(db_dir)
+        if watcher is None:
+            watcher = DbWatcher(db_dir, current, _poll_interval())
+            _watchers[db_dir] = watcher
+            watcher.start()
+    return watcher
+
+
+def resolve(db_dir: Path) -> str:
+    """Current export in db_dir: resolved on first call, then kept up to date by a watcher."""
+    return _watcher(db_dir).current
+
+
+def resolve_all(db_dir: Path) -> list[str]:
+    """Every export in db_dir (newest first) as federated-search shards, kept up to date by the watcher."""
+    watcher = _watcher(db_dir)
+    return watcher.shards if watcher.shards is not None else watcher.track_shards()
+
+
+def reset() -> None:
+    """Stop all watchers and forget resolved paths (e.g. between tests)."""
+    with _lock:
+        watchers = list(_watchers.values())
+        _watchers.clear()
+    for watcher in watchers:
+        watcher.stop()
@@ -7,6 +7,22 @@ from pathlib import Path
 
 import pytest
 
+from origin_conversation_mcp import metrics, pool, slowlog, snapshot, warmup, watcher
+from origin_conversation_mcp.cache import result_cache
+
+
+@pytest.fixture(autouse=True)
+def _reset_process_state():
+    """Drop pooled connections, resolved db/ paths, warm-up state, snapshots, cached results, metrics and the slow-query log file so each test starts fresh."""
+    yield
+    warmup.reset()
+    metrics.registry.reset()
+    pool.close_all()
+    watcher.reset()
+    snapshot.reset()
+    result_cache.clear()
+    slowlog.reset()
+
 
 @pytest.fixture
 def temp_db(tmp_path):
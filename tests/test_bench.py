@@ -0,0 +1,80 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+"""Tests for origin_conversation_mcp.bench."""
+import json
+import sqlite3
+
+import pytest
+
+from origin_conversation_mcp import bench
+
+
+@pytest.fixture
+def synthetic_db(tmp_path):
+    return bench.generate_db(str(tmp_path / "synthetic.db"), 400, seed=3)
+
+
+class TestGenerateDb:
+    """generate_db."""
+
+    def test_shape(self, synthetic_db):
+        with sqlite3.connect(synthetic_db) as conn:
+            assert conn.execute("SELECT count(*) FROM messages").fetchone()[0] == 400
+            assert conn.execute("SELECT count(*) FROM conversations").fetchone()[0] > 1
+            roles = {r for (r,) in conn.execute("SELECT DISTINCT role FROM messages")}
+            types = {t for (t,) in conn.execute("SELECT DISTINCT typeof(create_time) FROM messages")}
+            orphans = conn.execute(
+                "SELECT count(*) FROM messages m LEFT JOIN conversations c ON c.id = m.conversation_id "
+                "WHERE c.id IS NULL"
+            ).fetchone()[0]
+            first_positions = conn.execute(
+                "SELECT DISTINCT min(position) FROM messages GROUP BY conversation_id"
+            ).fetchall()
+        assert roles == {"user", "assistant", "tool"}
+        assert types == {"real", "text", "null"}
+        assert orphans == 0
+        assert first_positions == [(0,)]
+
+    def test_deterministic(self, synthetic_db, tmp_path):
+        again = bench.generate_db(str(tmp_path / "again.db"), 400, seed=3)
+        query = "SELECT id, content, create_time FROM messages ORDER BY rowid LIMIT 20"
+        with sqlite3.connect(synthetic_db) as a, sqlite3.connect(again) as b:
+            assert a.execute(query).fetchall() == b.execute(query).fetchall()
+
+
+def test_parse_size():
+    assert bench.parse_size("10k") == 10_000
+    assert bench.parse_size("1M") == 1_000_000
+    assert bench.parse_size("2500") == 2500
+
+
+def test_percentile():
+    values = [float(v) for v in range(1, 101)]
+    assert bench.percentile(values, 50) == pytest.approx(50.5)
+    assert bench.percentile(values, 99) == pytest.approx(99.01)
+    assert bench.percentile([3.0], 95) == 3.0
+
+
+def test_run_case(synthetic_db):
+    result = bench.run_case(synthetic_db, bench.cases(3)["query_common"], repeats=5)
+    assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"] <= result["max_ms"]
+    assert result["first_ms"] > 0
+
+
+def test_run_writes_results_per_case(tmp_path):
+    report = bench.run([300], str(tmp_path), repeats=2, seed=3, case_names=["roles_only"])
+    json.dumps(report)
+    assert report["sizes"][0]["messages"] == 300
+    (result,) = report["results"]
+    assert result["case"] == "roles_only" and result["params"] == {"roles": ["assistant", "tool"]}
+    assert result["p99_ms"] >= result["p50_ms"]
+    with pytest.raises(ValueError, match="Unknown case"):
+        bench.run([300], str(tmp_path), case_names=["nope"])
+
+
+def test_compare_flags_regressions():
+    row = {"messages": 10, "case": "q", "p50_ms": 1.0, "p95_ms": 2.0, "p99_ms": 3.0}
+    lines, regressed = bench.compare({"results": [row]}, {"results": [dict(row, p95_ms=3.0)]})
+    assert regressed
+    assert "!" in lines[1]
+    _, regressed = bench.compare({"results": [row]}, {"results": [dict(row, p50_ms=1.05)]})
+    assert not regressed
@@ -0,0 +1,59 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+"""Tests for origin_conversation_mcp.cache."""
+import time
+
+from origin_conversation_mcp.cache import ResultCache
+
+
+def test_hit_and_miss_counted():
+    c = ResultCache(max_bytes=1024, ttl=60)
+    assert c.get("db", "k") is None
+    c.put("db", "k", "value")
+    assert c.get("db", "k") == "value"
+    stats = c.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"], stats["bytes"]) == (1, 1, 1, 5)
+
+
+def test_lru_eviction_by_bytes():
+    c = ResultCache(max_bytes=10, ttl=60)
+    c.put("db", "a", "aaaa")
+    c.put("db", "b", "bbbb")
+    assert c.get("db", "a") == "aaaa"  # a is now most recently used
+    c.put("db", "c", "cccc")
+    assert c.get("db", "b") is None
+    assert c.get("db", "a") == "aaaa"
+    assert c.get("db", "c") == "cccc"
+    assert c.stats()["evictions"] == 1
+    assert c.stats()["bytes"] == 8
+
+
+def test_size_counts_utf8_bytes_and_skips_oversized():
+    c = ResultCache(max_bytes=4, ttl=60)
+    c.put("db", "k", "éé")
+    assert c.stats()["bytes"] == 4
+    c.put("db", "big", "x" * 5)
+    assert c.get("db", "big") is None
+    assert c.get("db", "k") == "éé"
+
+
+def test_ttl_expiry():
+    c = ResultCache(max_bytes=1024, ttl=0.01)
+    c.put("db", "k", "v")
+    time.sleep(0.02)
+    assert c.get("db", "k") is None
+    assert c.stats()["entries"] == 0
+
+
+def test_identity_change_invalidates():
+    c = ResultCache(max_bytes=1024, ttl=60)
+    c.put("db1", "k", "v")
+    assert c.get("db2", "k") is None
+    assert c.get("db1", "k") is None
+    assert c.stats()["invalidations"] == 1
+
+
+def test_disabled_when_zero_bytes():
+    c = ResultCache(max_bytes=0, ttl=60)
+    c.put("db", "k", "v")
+    assert c.get("db", "k") is None
+    assert c.stats()["misses"] == 0
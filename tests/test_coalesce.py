@@ -0,0 +1,112 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+"""Tests for origin_conversation_mcp.coalesce."""
+import asyncio
+
+import pytest
+
+from origin_conversation_mcp import metrics
+from origin_conversation_mcp.coalesce import SingleFlight, freeze
+
+
+@pytest.mark.asyncio
+async def test_identical_calls_share_one_execution():
+    flights = SingleFlight(enabled=True)
+    release = asyncio.Event()
+    runs = []
+
+    async def work(tag):
+        runs.append(tag)
+        await release.wait()
+        return f"result {tag}"
+
+    calls = [asyncio.ensure_future(flights.run("k", "t", lambda: work(1))) for _ in range(3)]
+    other = asyncio.ensure_future(flights.run("other", "t", lambda: work(2)))
+    await asyncio.sleep(0)
+    assert flights.in_flight == 2
+    release.set()
+    assert await asyncio.gather(*calls) == ["result 1"] * 3
+    assert await other == "result 2"
+    assert runs == [1, 2]
+    assert metrics.COALESCED_CALLS.labels("t").value == 2
+    assert flights.in_flight == 0
+    # Finished flights are not reused: a later call runs again.
+    assert await flights.run("k", "t", lambda: work(3)) == "result 3"
+
+
+@pytest.mark.asyncio
+async def test_exception_reaches_every_caller():
+    flights = SingleFlight(enabled=True)
+    release = asyncio.Event()
+
+    async def fail():
+        await release.wait()
+        raise ValueError("bad cursor")
+
+    calls = [asyncio.ensure_future(flights.run("k", "t", fail)) for _ in range(2)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    assert [str(e) for e in results] == ["bad cursor", "bad cursor"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_shared_work():
+    flights = SingleFlight(enabled=True)
+    release = asyncio.Event()
+
+    async def work():
+        await release.wait()
+        return "done"
+
+    first = asyncio.ensure_future(flights.run("k", "t", work))
+    second = asyncio.ensure_future(flights.run("k", "t", work))
+    await asyncio.sleep(0)
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+    assert await second == "done"
+    assert first.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_work_is_cancelled_when_every_caller_is():
+    flights = SingleFlight(enabled=True)
+    cancelled = asyncio.Event()
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    callers = [asyncio.ensure_future(flights.run("k", "t", work)) for _ in range(2)]
+    await asyncio.sleep(0)
+    for caller in callers:
+        caller.cancel()
+    await asyncio.wait_for(cancelled.wait(), 1)
+    assert flights.in_flight == 0
+    # A new identical call starts its own execution instead of joining the cancelled one.
+    assert await flights.run("k", "t", lambda: asyncio.sleep(0, "again")) == "again"
+
+
+@pytest.mark.asyncio
+async def test_disabled_runs_every_call(monkeypatch):
+    monkeypatch.setenv("CONVERSATION_COALESCE", "off")
+    flights = SingleFlight()
+    runs = []
+
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0)
+        return len(runs)
+
+    await asyncio.gather(*(flights.run("k", "t", work) for _ in range(3)))
+    assert len(runs) == 3
+    assert metrics.COALESCED_CALLS.labels("t").value == 0
+
+
+def test_freeze_makes_arguments_hashable():
+    key = freeze({"roles": ["user"], "before": 2, "extra": {"b": [1], "a": None}})
+    assert key == (("before", 2), ("extra", (("a", None), ("b", (1,)))), ("roles", ("user",)))
+    hash(key)
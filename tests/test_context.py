@@ -0,0 +1,72 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+"""Tests for origin_conversation_mcp.context."""
+import sqlite3
+
+import pytest
+
+from origin_conversation_mcp import context, index, search
+
+
+@pytest.fixture
+def thread_db(temp_db, monkeypatch):
+    with sqlite3.connect(temp_db) as conn:
+        conn.executemany(
+            "INSERT INTO messages (id, conversation_id, role, content, create_time, position) "
+            "VALUES (?, 'conv1', ?, ?, ?, ?)",
+            [
+                (f"t{i}", "user" if i % 2 else "assistant", f"turn {i}", 1700000100.0 + i, i)
+                for i in range(2, 12)
+            ],
+        )
+    monkeypatch.setenv("CONVERSATION_DB", temp_db)
+    return temp_db
+
+
+def _contents(result):
+    return [block.split("\n", 1)[1] for block in result.split(search._RESULT_SEPARATOR)]
+
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_window_around_message_id(thread_db, monkeypatch, indexed):
+    if indexed:
+        index.build_sidecar(thread_db)
+    else:
+        monkeypatch.setattr(index, "ensure_sidecar", lambda db_path: None)
+    result = context.conversation_context(message_id="t5", before=2, after=3)
+    assert _contents(result) == ["turn 3", "turn 4", "turn 5", "turn 6", "turn 7", "turn 8"]
+    anchored = [block for block in result.split(search._RESULT_SEPARATOR) if block.startswith(">>> ")]
+    assert len(anchored) == 1 and anchored[0].endswith("turn 5")
+
+
+def test_window_by_position_stops_at_conversation_edges(thread_db):
+    index.build_sidecar(thread_db)
+    result = context.conversation_context(conversation_id="conv1", position=1, before=5, after=2)
+    assert _contents(result) == ["hello world", "hi there", "turn 2", "turn 3"]
+    assert context.conversation_context(conversation_id="conv1", position=11, after=4).endswith("turn 11")
+
+
+def test_uses_sidecar_index(thread_db):
+    index.build_sidecar(thread_db)
+    with search.pool.connection(thread_db) as conn:
+        assert context._source(conn, thread_db, context._CONV_COLUMNS) == "ix.msg_pos"
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT rowid FROM ix.msg_pos WHERE conversation_id = ? "
+            "AND (position, rowid) < (?, ?) ORDER BY position DESC, rowid DESC LIMIT 5",
+            ("conv1", 5, 9),
+        ).fetchall()
+    assert any("msg_pos_conv" in row[-1] for row in plan)
+
+
+def test_invalid_or_missing_anchor(thread_db):
+    with pytest.raises(ValueError, match="Pass message_id"):
+        context.conversation_context(conversation_id="conv1")
+    with pytest.raises(ValueError, match="No message with id 'nope'"):
+        context.conversation_context(message_id="nope")
+
+
+def test_search_hit_id_chains_into_context(thread_db):
+    index.build_sidecar(thread_db)
+    hit = search.conversation_search(query="turn 9", limit=1)
+    message_id = hit.split("; id: ", 1)[1].split(")", 1)[0]
+    assert message_id == "t9"
+    assert "turn 8" in context.conversation_context(message_id=message_id, before=1, after=0)
@@ -0,0 +1,72 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+"""Tests for origin_conversation_mcp.deadline."""
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from origin_conversation_mcp import deadline, pool
+
+# Counts to a billion: far longer than any test waits.
+_ENDLESS = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 1000000000) SELECT count(*) FROM n"
+
+
+def test_effective_timeout(monkeypatch):
+    monkeypatch.delenv("CONVERSATION_SEARCH_TIMEOUT", raising=False)
+    assert deadline.effective_timeout(None) == 30.0
+    assert deadline.effective_timeout(2.5) == 2.5
+    assert deadline.effective_timeout(120) == 30.0  # never past the server's limit
+    monkeypatch.setenv("CONVERSATION_SEARCH_TIMEOUT", "0")
+    assert deadline.effective_timeout(None) is None
+    assert deadline.effective_timeout(120) == 120
+    monkeypatch.setenv("CONVERSATION_SEARCH_TIMEOUT", "soon")
+    assert deadline.default_timeout() == 30.0
+
+
+def test_time_limit_interrupts_statement(temp_db):
+    limit = deadline.Deadline(0.05)
+
+    def run():
+        with pool.connection(temp_db) as conn:
+            return conn.execute(_ENDLESS).fetchone()
+
+    started = time.perf_counter()
+    with pytest.raises(deadline.Interrupted, match="0.05 s time limit"):
+        deadline.call(limit, run)
+    assert time.perf_counter() - started < 2
+    # The connection went back to the pool without the handler.
+    with pool.connection(temp_db) as conn:
+        assert conn.execute("SELECT count(*) FROM messages").fetchone()[0] == 4
+
+
+def test_cancel_from_another_thread(temp_db):
+    limit = deadline.Deadline(None)
+    errors = []
+
+    def run():
+        try:
+            with deadline.active(limit), pool.connection(temp_db) as conn:
+                conn.execute(_ENDLESS).fetchone()
+        except sqlite3.OperationalError as e:
+            errors.append(e)
+
+    worker = threading.Thread(target=run)
+    worker.start()
+    time.sleep(0.05)
+    limit.cancel()
+    worker.join(2)
+    assert not worker.is_alive()
+    assert len(errors) == 1 and limit.reason == "the request was cancelled"
+
+
+def test_stopped_deadline_does_not_start_work():
+    limit = deadline.Deadline(0)
+    with pytest.raises(deadline.Interrupted):
+        deadline.call(limit, pytest.fail, "should not run")
+
+
+def test_no_deadline_leaves_connection_alone(temp_db):
+    assert deadline.current() is None and not deadline.stopped()
+    with pool.connection(temp_db) as conn:
+        assert conn.execute("SELECT count(*) FROM messages").fetchone()[0] == 4
@@ -0,0 +1,119 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+"""Tests for origin_conversation_mcp.executor."""
+import asyncio
+import threading
+
+import pytest
+
+from origin_conversation_mcp.executor import SearchBusyError, SearchExecutor
+
+
+def test_sizes_from_env(monkeypatch):
+    monkeypatch.setenv("CONVERSATION_SEARCH_WORKERS", "3")
+    monkeypatch.setenv("CONVERSATION_SEARCH_QUEUE", "7")
+    ex = SearchExecutor()
+    try:
+        assert (ex.workers, ex.max_queue) == (3, 7)
+    finally:
+        ex.shutdown()
+
+
+def test_invalid_env_uses_defaults(monkeypatch):
+    monkeypatch.setenv("CONVERSATION_SEARCH_QUEUE", "lots")
+    ex = SearchExecutor(workers=0)
+    try:
+        assert ex.workers == 1
+        assert ex.max_queue == 32
+    finally:
+        ex.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_runs_off_event_loop_thread():
+    ex = SearchExecutor(workers=1, max_queue=0)
+    try:
+        name = await ex.run(lambda: threading.current_thread().name)
+        assert name.startswith("origin-conversation-search")
+        assert await ex.run(lambda a, *, b: a + b, 1, b=2) == 3
+    finally:
+        ex.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_event_loop_stays_responsive():
+    ex = SearchExecutor(workers=1, max_queue=0)
+    release = threading.Event()
+    try:
+        task = asyncio.ensure_future(ex.run(release.wait, 5))
+        await asyncio.sleep(0.01)
+        ticks = 0
+        for _ in range(3):
+            await asyncio.sleep(0)
+            ticks += 1
+        assert ticks == 3
+        assert not task.done()
+        release.set()
+        assert await task is True
+    finally:
+        release.set()
+        ex.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_rejects_beyond_queue_depth():
+    ex = SearchExecutor(workers=1, max_queue=1)
+    release = threading.Event()
+    try:
+        first = asyncio.ensure_future(ex.run(release.wait, 5))
+        second = asyncio.ensure_future(ex.run(release.wait, 5))
+        await asyncio.sleep(0.01)
+        assert ex.in_flight == 2
+        with pytest.raises(SearchBusyError, match="workers=1, queue=1"):
+            await ex.run(release.wait, 5)
+        release.set()
+        assert await asyncio.gather(first, second) == [True, True]
+        assert ex.in_flight == 0
+        assert await ex.run(lambda: "ok") == "ok"
+    finally:
+        release.set()
+        ex.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_exception_propagates_and_releases_slot():
+    ex = SearchExecutor(workers=1, max_queue=0)
+
+    def boom():
+        raise ValueError("bad")
+
+    try:
+        with pytest.raises(ValueError, match="bad"):
+            await ex.run(boom)
+        assert ex.in_flight == 0
+    finally:
+        ex.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_call_holds_slot_until_thread_returns():
+    ex = SearchExecutor(workers=1, max_queue=0)
+    release = threading.Event()
+    try:
+        task = asyncio.ensure_future(ex.run(release.wait, 5))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert ex.in_flight == 1
+        with pytest.raises(SearchBusyError):
+            await ex.run(lambda: "ok")
+        release.set()
+        for _ in range(100):
+            if not ex.in_flight:
+                break
+            await asyncio.sleep(0.01)
+        assert ex.in_flight == 0
+        assert await ex.run(lambda: "ok") == "ok"
+    finally:
+        release.set()
+        ex.shutdown()
@@ -0,0 +1,48 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+"""Tests for origin_conversation_mcp.http_app."""
+import pytest
+
+pytest.importorskip("httpx")
+
+from starlette.testclient import TestClient
+
+from origin_conversation_mcp.http_app import MCP_PATH, create_app
+
+_HEADERS = {"Accept": "application/json, text/event-stream"}
+
+
+def _rpc(client, request_id, method, params=None):
+    body = {"jsonrpc": "2.0", "id": request_id, "method": method}
+    if params is not None:
+        body["params"] = params
+    response = client.post(MCP_PATH, json=body, headers=_HEADERS)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/json")
+    return response.json()
+
+
+def test_stateless_requests_need_no_session(temp_db, monkeypatch):
+    monkeypatch.setenv("CONVERSATION_DB", temp_db)
+    with TestClient(create_app()) as client:
+        tools = _rpc(client, 1, "tools/list")["result"]["tools"]
+        assert "conversation_search" in [t["name"] for t in tools]
+        # No initialize and no mcp-session-id: every call stands alone.
+        for request_id in (2, 3):
+            params = {"name": "conversation_search", "arguments": {"query": "hello"}}
+            result = _rpc(client, request_id, "tools/call", params)
+            assert "hello world" in result["result"]["content"][0]["text"]
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert 'origin_conversation_tool_calls_total{outcome="ok"} 2' in response.text
+
+
+def test_ready_reports_warmup(temp_db, monkeypatch):
+    from origin_conversation_mcp import warmup
+
+    monkeypatch.setenv("CONVERSATION_DB", temp_db)
+    with TestClient(create_app()) as client:
+        assert warmup.wait(10)
+        response = client.get("/ready")
+        assert response.status_code == 200
+        body = response.json()
+        assert body["ready"] is True and "connect" in body["stages"]
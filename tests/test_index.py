@@ -0,0 +1,257 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+"""Tests for origin_conversation_mcp.index."""
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+import pytest
+
+from origin_conversation_mcp import index
+
+
+@pytest.fixture(autouse=True)
+def _index_env(monkeypatch):
+    monkeypatch.delenv("CONVERSATION_INDEX", raising=False)
+    monkeypatch.delenv("CONVERSATION_INDEX_DIR", raising=False)
+    monkeypatch.delenv("CONVERSATION_TRIGRAM_INDEX", raising=False)
+
+
+def _wait_ready(db_path, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        path = index.ensure_sidecar(db_path)
+        if path:
+            return path
+        time.sleep(0.01)
+    raise AssertionError("index not built in time")
+
+
+def _export(path, conversations):
+    """Write a canonical-export-style DB from [(id, title, [(msg_id, role, content, ts)])]."""
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE conversations (id TEXT PRIMARY KEY, title TEXT)")
+    conn.execute(
+        "CREATE TABLE messages (id TEXT, conversation_id TEXT, role TEXT, content TEXT, "
+        "create_time REAL, position INTEGER)"
+    )
+    for conv_id, title, messages in conversations:
+        conn.execute("INSERT INTO conversations (id, title) VALUES (?, ?)", (conv_id, title))
+        conn.executemany(
+            "INSERT INTO messages (id, conversation_id, role, content, create_time, position) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(msg_id, conv_id, role, content, ts, i) for i, (msg_id, role, content, ts) in enumerate(messages)],
+        )
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+def _documents(sidecar):
+    """(msg_rowid, content, title) of every FTS document, and the rowids matching a few terms (words, then trigrams)."""
+    with sqlite3.connect(sidecar) as conn:
+        docs = conn.execute(
+            "SELECT d.msg_rowid, f.content, f.title FROM msg_fts f JOIN msg_doc d ON d.doc = f.rowid ORDER BY 1"
+        ).fetchall()
+        hits = [
+            sorted(
+                r
+                for (r,) in conn.execute(
+                    "SELECT d.msg_rowid FROM msg_fts JOIN msg_doc d ON d.doc = msg_fts.rowid WHERE msg_fts MATCH ?",
+                    (term,),
+                )
+            )
+            for term in ("alpha", "beta", "gamma", "delta", "title:apples")
+        ]
+        hits += [
+            sorted(
+                r
+                for (r,) in conn.execute(
+                    "SELECT d.msg_rowid FROM msg_tri JOIN msg_doc d ON d.doc = msg_tri.rowid WHERE msg_tri MATCH ?",
+                    (term,),
+                )
+            )
+            for term in ('"lph" AND "pha"', '"amm"', '"a a"', '"ppl"', '"ELT"')
+        ]
+    return docs, hits
+
+
+class TestSidecarPath:
+    """Tests for sidecar_path."""
+
+    def test_next_to_db(self, temp_db):
+        assert index.sidecar_path(temp_db) == temp_db + ".idx"
+
+    def test_index_dir_override(self, temp_db, tmp_path, monkeypatch):
+        monkeypatch.setenv("CONVERSATION_INDEX_DIR", str(tmp_path / "ix"))
+        assert index.sidecar_path(temp_db) == str(tmp_path / "ix" / "test.db.idx")
+
+
+class TestBuildSidecar:
+    """Tests for build_sidecar."""
+
+    def test_builds_fts_and_meta(self, temp_db):
+        path = index.build_sidecar(temp_db)
+        assert os.path.isfile(path)
+        assert not os.path.exists(f"{path}.{os.getpid()}.tmp")
+        meta = index.read_meta(path)
+        assert meta["version"] == index._SIDECAR_VERSION
+        assert meta["source_fingerprint"] == index.source_fingerprint(temp_db)
+        assert float(meta["max_ts"]) == 1700001060.0
+        with sqlite3.connect(path) as conn:
+            hits = conn.execute("SELECT rowid FROM msg_fts WHERE msg_fts MATCH 'hello'").fetchall()
+            titles = conn.execute("SELECT count(*) FROM msg_fts WHERE msg_fts MATCH 'title:second'").fetchone()
+            times = conn.execute("SELECT ts FROM msg_time ORDER BY rowid").fetchall()
+            stats = conn.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = 'msg_time'").fetchone()
+        assert len(hits) == 1
+        assert stats[0].startswith("4 ")
+        assert titles[0] == 2
+        assert [t for (t,) in times] == [1700000000.0, 1700000060.0, 1700001000.0, 1700001060.0]
+
+    def test_context_indexes_only_when_export_lacks_them(self, temp_db):
+        with sqlite3.connect(index.build_sidecar(temp_db)) as conn:
+            assert index.has_index(conn, "main", "msg_pos", ("conversation_id", "position"))
+            assert index.has_index(conn, "main", "msg_pos", ("id",))
+            assert conn.execute("SELECT count(*) FROM msg_pos").fetchone()[0] == 4
+        with sqlite3.connect(temp_db) as conn:
+            conn.execute("CREATE INDEX messages_conv_pos ON messages (conversation_id, position, role)")
+            conn.execute("CREATE INDEX messages_id ON messages (id)")
+            assert not index.has_index(conn, "main", "messages", ("position",))
+        with sqlite3.connect(index.build_sidecar(temp_db)) as conn:
+            tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert "msg_pos" not in tables
+
+    def test_missing_tables_raise_and_leave_no_tmp(self, tmp_path):
+        db = tmp_path / "empty.db"
+        sqlite3.connect(str(db)).close()
+        with pytest.raises(sqlite3.Error):
+            index.build_sidecar(str(db))
+        assert not os.path.exists(f"{db}.idx.{os.getpid()}.tmp")
+
+    @pytest.mark.skipif(os.name != "posix", reason="stale builds are detected by pid")
+    def test_removes_temp_files_of_exited_builds(self, temp_db):
+        exited = subprocess.Popen([sys.executable, "-c", ""])
+        exited.wait()
+        target = index.sidecar_path(temp_db)
+        stale = [f"{target}.{exited.pid}.tmp", f"{target}.{exited.pid}.tmp-journal"]
+        running = f"{target}.{os.getppid()}.tmp"
+        for path in (*stale, running):
+            open(path, "w").close()
+        index.build_sidecar(temp_db)
+        assert not any(os.path.exists(path) for path in stale)
+        assert os.path.exists(running)
+
+    def test_new_export_updates_previous_sidecar(self, tmp_path):
+        a = ("a", "Apples", [("a1", "user", "alpha one", 1700000000.0), ("a2", "assistant", "beta two", 1700000100.0)])
+        b = ("b", "Bananas", [("b1", "user", "gamma three", 1700001000.0), ("b2", "tool", "delta", 1700001100.0)])
+        c = ("c", "Cherries", [("c1", "user", "alpha gamma", 1700002000.0)])
+        index.build_sidecar(_export(tmp_path / "old.db", [a, b, c]))
+        a_changed = (*a[:2], [*a[2], ("a3", "user", "delta again", 1700000200.0)])
+        d = ("d", "Apples again", [("d1", "user", "beta gamma", 1700003000.0)])
+        new_export = [b, a_changed, d]  # c removed; b first, so every rowid moves
+        updated = index.build_sidecar(_export(tmp_path / "new.db", new_export))
+        meta = index.read_meta(updated)
+        assert meta["updated_from"] == "old.db.idx"
+        assert meta["reindexed_conversations"] == "2"
+        fresh_dir = tmp_path / "fresh"
+        fresh_dir.mkdir()
+        fresh = index.build_sidecar(_export(fresh_dir / "new.db", new_export))
+        assert index.read_meta(fresh)["updated_from"] == ""
+        assert _documents(updated) == _documents(fresh)
+        with sqlite3.connect(updated) as conn:
+            assert conn.execute("SELECT count(*) FROM conv_fp").fetchone()[0] == 3
+            assert conn.execute("SELECT count(*) FROM agg_conv_day").fetchone()[0] == 5
+
+    def test_unrelated_export_not_used_as_base(self, tmp_path):
+        a = ("a", "Apples", [("a1", "user", "alpha one", 1700000000.0)])
+        b = ("b", "Bananas", [("b1", "user", "gamma three", 1700001000.0)])
+        c = ("c", "Cherries", [("c1", "user", "alpha gamma", 1700002000.0)])
+        index.build_sidecar(_export(tmp_path / "shard-1.db", [a, b]))
+        other = index.build_sidecar(_export(tmp_path / "shard-2.db", [c]))
+        assert index.read_meta(other)["updated_from"] == ""
+        redump = index.build_sidecar(_export(tmp_path / "shard-1-new.db", [a, b, c]))
+        assert index.read_meta(redump)["updated_from"] == "shard-1.db.idx"
+
+    def test_large_deletions_merge_segments(self, tmp_path):
+        convs = [(f"c{i}", f"Title {i}", [(f"m{i}", "user", f"alpha {i}", 1700000000.0 + i)]) for i in range(10)]
+        index.build_sidecar(_export(tmp_path / "old.db", convs))
+        updated = index.build_sidecar(_export(tmp_path / "new.db", convs[:7]))
+        assert index.read_meta(updated)["updated_from"] == "old.db.idx"
+        with sqlite3.connect(updated) as conn:
+            for table in ("msg_fts", "msg_tri"):
+                assert conn.execute(f"SELECT count(DISTINCT segid) FROM {table}_idx").fetchone()[0] == 1
+            assert conn.execute("SELECT count(*) FROM msg_fts WHERE msg_fts MATCH 'alpha'").fetchone()[0] == 7
+
+    def test_trigram_index_follows_setting(self, tmp_path, monkeypatch):
+        conversations = [("a", "Apples", [("a1", "user", "alpha one", 1700000000.0)])]
+        monkeypatch.setenv("CONVERSATION_TRIGRAM_INDEX", "off")
+        without = index.build_sidecar(_export(tmp_path / "old.db", conversations))
+        with sqlite3.connect(without) as conn:
+            assert not index.has_table(conn, "main", "msg_tri")
+        monkeypatch.delenv("CONVERSATION_TRIGRAM_INDEX")
+        updated = index.build_sidecar(_export(tmp_path / "new.db", conversations))
+        assert index.read_meta(updated)["updated_from"] == "old.db.idx"
+        with sqlite3.connect(updated) as conn:
+            assert conn.execute("SELECT rowid FROM msg_tri WHERE msg_tri MATCH 'LPH'").fetchall() == [(1,)]
+
+    def test_unusable_base_falls_back_to_full_build(self, temp_db, tmp_path):
+        with sqlite3.connect(str(tmp_path / "other.db.idx")) as conn:
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("INSERT INTO meta VALUES ('version', ?)", (index._SIDECAR_VERSION,))
+        path = index.build_sidecar(temp_db)
+        assert index.read_meta(path)["updated_from"] == ""
+        with sqlite3.connect(path) as conn:
+            assert conn.execute("SELECT count(*) FROM msg_fts WHERE msg_fts MATCH 'hello'").fetchone()[0] == 1
+
+
+class TestEnsureSidecar:
+    """Tests for ensure_sidecar."""
+
+    def test_builds_in_background_then_ready(self, temp_db):
+        path = _wait_ready(temp_db)
+        assert path == index.sidecar_path(temp_db)
+
+    def test_disabled_by_env(self, temp_db, monkeypatch):
+        monkeypatch.setenv("CONVERSATION_INDEX", "off")
+        assert index.ensure_sidecar(temp_db) is None
+        assert not os.path.exists(index.sidecar_path(temp_db))
+
+    def test_stale_sidecar_is_rebuilt(self, temp_db):
+        index.build_sidecar(temp_db)
+        with sqlite3.connect(temp_db) as conn:
+            conn.execute(
+                "INSERT INTO messages (id, conversation_id, role, content, create_time, position) "
+                "VALUES ('m5', 'conv2', 'user', 'fresh words', 1700002000.0, 2)"
+            )
+        stamp = time.time() + 5
+        os.utime(temp_db, (stamp, stamp))
+        path = _wait_ready(temp_db)
+        assert index.read_meta(path)["source_fingerprint"] == index.source_fingerprint(temp_db)
+        with sqlite3.connect(path) as conn:
+            assert conn.execute("SELECT count(*) FROM msg_fts WHERE msg_fts MATCH 'fresh'").fetchone()[0] == 1
+
+    def test_failed_build_not_retried(self, tmp_path):
+        db = tmp_path / "broken.db"
+        sqlite3.connect(str(db)).close()
+        assert index.ensure_sidecar(str(db)) is None
+        deadline = time.monotonic() + 5
+        while str(db) not in index._failed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert index.ensure_sidecar(str(db)) is None
+        assert str(db) not in index._building
+
+
+class TestPrepareSidecar:
+    """Tests for prepare_sidecar."""
+
+    def test_builds_synchronously(self, temp_db):
+        path = index.prepare_sidecar(temp_db)
+        assert path == index.sidecar_path(temp_db)
+        assert index.ensure_sidecar(temp_db) == path
+
+    def test_failure_returns_none(self, tmp_path):
+        db = tmp_path / "empty.db"
+        sqlite3.connect(str(db)).close()
+        assert index.prepare_sidecar(str(db)) is None
+        assert str(db) not in index._building
@@ -49,3 +49,74 @@ def test_parse_args_sse(monkeypatch):
     assert args.sse is True
     assert hasattr(args, "port")
     assert hasattr(args, "host")
+
+
+def test_parse_args_http(monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["origin-conversation-mcp", "--http", "--workers", "3"])
+    args = main._parse_args()
+    assert args.http is True and args.sse is False
+    assert args.workers == 3
+
+
+def test_parse_args_rejects_sse_with_http(monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", ["origin-conversation-mcp", "--sse", "--http"])
+    with pytest.raises(SystemExit):
+        main._parse_args()
+    assert "not allowed with argument" in capsys.readouterr().err
+
+
+def test_parse_args_in_memory(monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["origin-conversation-mcp", "--in-memory"])
+    assert main._parse_args().in_memory is True
+    monkeypatch.setattr(sys, "argv", ["origin-conversation-mcp"])
+    assert main._parse_args().in_memory is False
+
+
+def test_run_http_warms_sidecar_and_runs_factory(temp_db, monkeypatch):
+    import uvicorn
+
+    from origin_conversation_mcp import index
+
+    calls = []
+    monkeypatch.setattr(uvicorn, "run", lambda app, **kwargs: calls.append((app, kwargs)))
+    monkeypatch.setenv("CONVERSATION_DB", temp_db)
+    monkeypatch.delenv("CONVERSATION_SEARCH_WORKERS", raising=False)
+    monkeypatch.setattr(
+        sys, "argv", ["origin-conversation-mcp", "--http", "--workers", "2", "--search-workers", "3"]
+    )
+    main._run_http(main._parse_args())
+    assert calls == [
+        (
+            "origin_conversation_mcp.http_app:create_app",
+            {"factory": True, "host": "127.0.0.1", "port": 8000, "workers": 2, "log_level": "info"},
+        )
+    ]
+    assert os.environ["CONVERSATION_SEARCH_WORKERS"] == "3"
+    assert index.ensure_sidecar(temp_db) is not None
+
+
+def test_main_starts_warmup_before_serving_stdio(temp_db, monkeypatch):
+    from origin_conversation_mcp import warmup
+
+    seen = []
+
+    async def fake_stdio(args):
+        seen.append(warmup.status()["started"])
+
+    monkeypatch.setattr(main, "_run_stdio", fake_stdio)
+    monkeypatch.setenv("CONVERSATION_DB", temp_db)
+    monkeypatch.setattr(sys, "argv", ["origin-conversation-mcp"])
+    main.main()
+    assert seen == [True]
+    assert warmup.wait(10)
+
+
+def test_dump_metrics_writes_summary_to_stderr(capsys):
+    from origin_conversation_mcp import metrics
+
+    main._dump_metrics()
+    assert capsys.readouterr().err == ""
+    metrics.SEARCH_STAGE_SECONDS.labels("execute").observe(0.002)
+    main._dump_metrics()
+    err = capsys.readouterr().err
+    assert "origin_conversation_search_stage_seconds[execute] count=1" in err
@@ -0,0 +1,68 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+"""Tests for origin_conversation_mcp.metrics."""
+import pytest
+
+from origin_conversation_mcp import metrics, search
+
+
+class TestHistogram:
+    """Histogram buckets and quantiles."""
+
+    def test_observe_and_quantile(self):
+        h = metrics.Histogram(buckets=(0.01, 0.1, 1.0))
+        for v in (0.005, 0.005, 0.05, 0.5, 5.0):
+            h.observe(v)
+        counts, total, count = h.snapshot()
+        assert counts == [2, 1, 1, 1]
+        assert count == 5 and total == pytest.approx(5.56)
+        assert h.quantile(0.4) == 0.01
+        assert h.quantile(0.6) == 0.1
+        assert h.quantile(1.0) == 1.0
+
+    def test_empty_quantile(self):
+        assert metrics.Histogram().quantile(0.5) == 0.0
+
+
+def test_stopwatch_accumulates():
+    family = metrics.Family("test_stopwatch_seconds", "test", "histogram", "stage")
+    sw = metrics.Stopwatch()
+    with sw:
+        pass
+    with sw:
+        pass
+    sw.observe(family, "x")
+    assert family.labels("x").snapshot()[2] == 1
+    assert sw.elapsed >= 0
+
+
+def test_render_prometheus_format():
+    metrics.SEARCH_STAGE_SECONDS.labels("plan").observe(0.003)
+    metrics.ROWS_FETCHED.labels().inc(7)
+    text = metrics.registry.render()
+    assert "# TYPE origin_conversation_search_stage_seconds histogram" in text
+    assert 'origin_conversation_search_stage_seconds_bucket{stage="plan",le="0.0025"} 0' in text
+    assert 'origin_conversation_search_stage_seconds_bucket{stage="plan",le="0.005"} 1' in text
+    assert 'origin_conversation_search_stage_seconds_bucket{stage="plan",le="+Inf"} 1' in text
+    assert 'origin_conversation_search_stage_seconds_count{stage="plan"} 1' in text
+    assert "origin_conversation_rows_fetched_total 7" in text
+
+
+def test_search_records_stages_and_rows(temp_db, monkeypatch):
+    monkeypatch.setenv("CONVERSATION_DB", temp_db)
+    result = search.conversation_search(limit=2)
+    assert search._NEXT_CURSOR_PREFIX in result
+    stages = {stage for stage, _ in metrics.SEARCH_STAGE_SECONDS.children()}
+    assert {"resolve_db", "cache_lookup", "connect", "plan", "execute", "format"} <= stages
+    assert metrics.ROWS_FETCHED.labels().value == 3  # two shown plus the look-ahead row
+    assert metrics.ROWS_RETURNED.labels().value == 2
+    search.conversation_search(limit=2)  # cache hit: no new rows
+    assert metrics.ROWS_RETURNED.labels().value == 2
+    assert metrics.SEARCH_STAGE_SECONDS.labels("cache_lookup").snapshot()[2] == 2
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setattr(metrics, "_enabled", False)
+    metrics.ROWS_RETURNED.labels().inc(3)
+    metrics.SEARCH_STAGE_SECONDS.labels("plan").observe(1.0)
+    assert metrics.ROWS_RETURNED.labels().value == 0
+    assert metrics.SEARCH_STAGE_SECONDS.labels("plan").snapshot()[2] == 0
@@ -0,0 +1,145 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+"""Tests for origin_conversation_mcp.optimize."""
+import hashlib
+import json
+import re
+import sqlite3
+import sys
+
+import pytest
+
+from origin_conversation_mcp import __main__ as entry
+from origin_conversation_mcp import bench, index, optimize, pool, search
+
+_ID = re.compile(r"; id: (msg-\d+)\)")
+
+
+@pytest.fixture
+def export_db(tmp_path):
+    return bench.generate_db(str(tmp_path / "export.db"), 600, seed=5)
+
+
+@pytest.fixture
+def optimized(export_db, tmp_path):
+    out = str(tmp_path / "export.opt.db")
+    summary = optimize.optimize(export_db, out, page_size=16384)
+    return out, summary
+
+
+def _ids(db_path, monkeypatch, index_on, **params):
+    monkeypatch.setenv("CONVERSATION_DB", db_path)
+    monkeypatch.setenv("CONVERSATION_INDEX", "1" if index_on else "0")
+    pool.close_all()
+    search.result_cache.clear()
+    index.prepare_sidecar(db_path)
+    return _ID.findall(search.conversation_search(limit=25, **params))
+
+
+class TestOptimize:
+    """optimize()."""
+
+    def test_tuned_copy(self, export_db, optimized):
+        out, summary = optimized
+        with sqlite3.connect(out) as conn:
+            assert conn.execute("PRAGMA page_size").fetchone()[0] == 16384
+            indexes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+            types = {t for (t,) in conn.execute("SELECT DISTINCT typeof(create_time) FROM messages")}
+            stats = {r[0] for r in conn.execute("SELECT tbl FROM sqlite_stat1")}
+            assert optimize.epoch_times(conn)
+        assert set(summary["indexes"]) <= indexes
+        assert {"messages_create_time_role", "conversations_id_title"} <= indexes
+        assert types == {"real", "null"}
+        assert {"messages", "conversations"} <= stats
+        assert summary["normalized_rows"] > 0
+
+    def test_input_untouched(self, export_db, tmp_path):
+        with open(export_db, "rb") as f:
+            before = hashlib.sha256(f.read()).hexdigest()
+        optimize.optimize(export_db, str(tmp_path / "out.db"))
+        with open(export_db, "rb") as f:
+            assert hashlib.sha256(f.read()).hexdigest() == before
+        with sqlite3.connect(export_db) as conn:
+            assert not optimize.epoch_times(conn)
+
+    def test_existing_output(self, export_db, optimized):
+        out, _ = optimized
+        with pytest.raises(FileExistsError):
+            optimize.optimize(export_db, out)
+        assert "messages_create_time_role" in optimize.optimize(export_db, out, force=True)["indexes"]
+        with pytest.raises(ValueError):
+            optimize.optimize(export_db, export_db, force=True)
+
+    def test_existing_indexes_kept(self, export_db, tmp_path):
+        with sqlite3.connect(export_db) as conn:
+            conn.execute("CREATE INDEX mine ON messages (conversation_id, position, role)")
+        summary = optimize.optimize(export_db, str(tmp_path / "out.db"))
+        assert "messages_conversation_position" not in summary["indexes"]
+
+    def test_text_create_time_left_alone(self, tmp_path):
+        path = str(tmp_path / "text.db")
+        with sqlite3.connect(path) as conn:
+            conn.execute("CREATE TABLE conversations (id TEXT PRIMARY KEY, title TEXT)")
+            conn.execute(
+                "CREATE TABLE messages (id TEXT, conversation_id TEXT, role TEXT, content TEXT, "
+                "create_time TEXT, position INTEGER)"
+            )
+            conn.execute("INSERT INTO conversations VALUES ('c1', 'T')")
+            conn.execute("INSERT INTO messages VALUES ('m1', 'c1', 'user', 'hi', '2024-01-05T12:00:00Z', 0)")
+        summary = optimize.optimize(path, str(tmp_path / "out.db"))
+        assert summary["normalized_rows"] is None
+        with sqlite3.connect(str(tmp_path / "out.db")) as conn:
+            assert not optimize.epoch_times(conn)
+            assert conn.execute("SELECT create_time FROM messages").fetchone()[0] == "2024-01-05T12:00:00Z"
+
+
+class TestSearchOnOptimized:
+    """Searches return the same messages on the optimized copy, with and without the sidecar."""
+
+    @pytest.mark.parametrize(
+        "params",
+        [
+            {},
+            {"roles": ["assistant"]},
+            {"start_date": "2023-06-01", "end_date": "2023-12-31"},
+            {"query": bench.cases(5)["query_common"]["query"]},
+        ],
+    )
+    def test_same_results(self, export_db, optimized, monkeypatch, params):
+        out, _ = optimized
+        expected = _ids(export_db, monkeypatch, True, **params)
+        assert expected
+        assert _ids(out, monkeypatch, True, **params) == expected
+        if "query" not in params:
+            # Time-ordered: the column the raw plan sorts on now holds the sidecar's timestamps.
+            assert _ids(out, monkeypatch, False, **params) == expected
+
+    def test_range_uses_column(self, optimized, monkeypatch):
+        out, _ = optimized
+        monkeypatch.setenv("CONVERSATION_DB", out)
+        with pool.connection(out) as conn:
+            assert conn.epoch_times
+            key = search.SearchKey(query=None, roles=None, start_ts=0.0, end_ts=None, limit=10)
+            sql = search._build_sql(conn, out, key, use_index=False)[0]
+        assert "m.create_time >= ?" in sql
+        assert "ct_epoch" not in sql
+
+
+def test_query_set(optimized):
+    out, _ = optimized
+    cases = optimize.query_set(out)
+    assert {"newest", "roles_only", "date_range_only", "query_common", "query_rare"} <= set(cases)
+    assert cases["date_range_only"]["start_date"] < cases["date_range_only"]["end_date"]
+
+
+def test_main_report(export_db, tmp_path, monkeypatch, capsys):
+    out, report = str(tmp_path / "out.db"), tmp_path / "report.json"
+    monkeypatch.setattr(sys, "argv", ["origin-conversation-mcp", "optimize", export_db, out, "--repeats", "1", "--json", str(report)])
+    with pytest.raises(SystemExit) as exc:
+        entry.main()
+    assert exc.value.code == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].startswith("page_size 8192")
+    data = json.loads(report.read_text())
+    assert {r["plan"] for r in data["results"]} == {"indexed", "scan"}
+    assert all(r["after"]["p50_ms"] >= 0 for r in data["results"])
+    assert optimize.main([export_db, out]) == 1  # exists, no --force
@@ -0,0 +1,76 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+"""Tests for origin_conversation_mcp.patterns."""
+import random
+
+import pytest
+
+from origin_conversation_mcp import patterns
+
+
+def _distance(pattern, text):
+    """Fewest edits turning pattern into some substring of text (dynamic programming)."""
+    prev = [0] * (len(text) + 1)
+    for i, p in enumerate(pattern, 1):
+        cur = [i] + [0] * len(text)
+        for j, t in enumerate(text, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (p != t))
+        prev = cur
+    return min(prev)
+
+
+def test_within_edits_matches_dynamic_programming():
+    rng = random.Random(7)
+    for _ in range(3000):
+        pattern = "".join(rng.choice("abc") for _ in range(rng.randint(1, 9)))
+        text = "".join(rng.choice("abc") for _ in range(rng.randint(0, 16)))
+        k = rng.randint(0, 3)
+        assert patterns.within_edits(pattern, text, k) == (_distance(pattern, text) <= k), (pattern, text, k)
+
+
+def test_fuzzy_matcher_tolerates_max_edits():
+    matches = patterns.fuzzy_matcher("conversaton_serch")  # 17 characters: 2 edits
+    assert matches("Call CONVERSATION_SEARCH with a cursor")
+    assert not matches("conversion search")
+    assert not matches(None)
+    assert patterns.fuzzy_matcher("rust")("Rust") and not patterns.fuzzy_matcher("rust")("rest")
+    rng = random.Random(11)
+    for _ in range(2000):
+        query = "".join(rng.choice("abcd") for _ in range(rng.randint(1, 14)))
+        text = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 30)))
+        expected = _distance(query, text) <= patterns.max_edits(query)
+        assert patterns.fuzzy_matcher(query)(text) == expected, (query, text)
+
+
+def test_filters_require_trigrams():
+    assert patterns.substring_filter("ab") is None
+    assert patterns.substring_filter('a"bc') == '"a""b" AND """bc"'
+    # 1 edit: one of two pieces is intact; exact below 6 characters.
+    assert patterns.fuzzy_filter("Parquet") == '("par") OR ("que" AND "uet")'
+    assert patterns.fuzzy_filter("abcde") == '"abc" AND "bcd" AND "cde"'
+    assert patterns.fuzzy_filter("ab") is None
+
+
+def test_regex_filter_uses_required_literals():
+    regex = patterns.compile_regex(r"https?://example\.org/(issues|pull)/\d+")
+    assert patterns.regex_filter(regex) == (
+        '("htt" AND "ttp") AND ("://" AND "//e" AND "/ex" AND "exa" AND "xam" AND "amp" AND "mpl" '
+        'AND "ple" AND "le." AND "e.o" AND ".or" AND "org" AND "rg/") AND (("iss" AND "ssu" AND "sue" '
+        'AND "ues") OR ("pul" AND "ull"))'
+    )
+    assert patterns.regex_filter(patterns.compile_regex(r"\d{4}-\d{2}")) is None
+    assert patterns.regex_filter(patterns.compile_regex(r"(abc)?xy")) is None
+
+
+def test_invalid_regex_raises_value_error():
+    with pytest.raises(ValueError, match="Invalid regex"):
+        patterns.compile_regex("(unclosed")
+
+
+def test_like_pattern_escapes_wildcards():
+    assert patterns.like_pattern(r"100%_a\b") == r"%100\%\_a\\b%"
+
+
+def test_fuzzy_spans_cover_the_aligned_text():
+    text = "The fix was to pin uvloop to 0.19"
+    assert [text[s:e] for s, e in patterns.fuzzy_spans("UVLOOOP", text)] == ["uvloop"]
+    assert patterns.fuzzy_spans("missing", text) == []
@@ -0,0 +1,96 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+"""Tests for origin_conversation_mcp.pool."""
+import os
+import shutil
+import sqlite3
+import time
+
+import pytest
+
+from origin_conversation_mcp import pool
+
+
+class TestConnection:
+    """Tests for pool.connection."""
+
+    def test_connection_reused(self, temp_db):
+        with pool.connection(temp_db) as first:
+            pass
+        with pool.connection(temp_db) as second:
+            pass
+        assert first is second
+
+    def test_concurrent_borrowers_get_distinct_connections(self, temp_db):
+        with pool.connection(temp_db) as a, pool.connection(temp_db) as b:
+            assert a is not b
+
+    def test_pragmas_applied(self, temp_db, monkeypatch):
+        monkeypatch.setenv("CONVERSATION_CACHE_KIB", "1024")
+        with pool.connection(temp_db) as conn:
+            assert conn.execute("PRAGMA query_only").fetchone()[0] == 1
+            assert conn.execute("PRAGMA cache_size").fetchone()[0] == -1024
+            assert conn.execute("PRAGMA mmap_size").fetchone()[0] > 0
+
+    def test_read_only(self, temp_db):
+        with pool.connection(temp_db) as conn:
+            with pytest.raises(sqlite3.OperationalError):
+                conn.execute("DELETE FROM messages")
+
+    def test_ct_epoch_registered(self, temp_db):
+        with pool.connection(temp_db) as conn:
+            assert conn.execute("SELECT ct_epoch('2024-01-15')").fetchone()[0] == 1705276800.0
+
+
+class TestReopen:
+    """The pool drains and reopens when the DB identity changes."""
+
+    def test_reopens_on_mtime_change(self, temp_db):
+        with pool.connection(temp_db) as first:
+            pass
+        stamp = time.time() + 5
+        os.utime(temp_db, (stamp, stamp))
+        with pool.connection(temp_db) as second:
+            pass
+        assert second is not first
+        with pytest.raises(sqlite3.ProgrammingError):
+            first.execute("SELECT 1")
+
+    def test_reopens_on_file_swap(self, temp_db, tmp_path):
+        with pool.connection(temp_db) as first:
+            pass
+        replacement = tmp_path / "replacement.db"
+        shutil.copy(temp_db, replacement)
+        os.replace(replacement, temp_db)
+        with pool.connection(temp_db) as second:
+            pass
+        assert second is not first
+
+    def test_reopens_on_path_change(self, temp_db, tmp_path):
+        other = tmp_path / "other.db"
+        shutil.copy(temp_db, other)
+        with pool.connection(temp_db) as first:
+            pass
+        with pool.connection(str(other)) as second:
+            assert pool.get_pool(str(other)).db_path == str(other)
+        assert second is not first
+
+    def test_pools_per_path_until_retain(self, temp_db, tmp_path):
+        other = tmp_path / "other.db"
+        shutil.copy(temp_db, other)
+        with pool.connection(temp_db) as first:
+            pass
+        with pool.connection(str(other)):
+            pass
+        with pool.connection(temp_db) as again:
+            assert again is first
+        pool.retain([str(other)])
+        with pytest.raises(sqlite3.ProgrammingError):
+            first.execute("SELECT 1")
+        with pool.connection(temp_db) as reopened:
+            assert reopened is not first
+
+    def test_checked_out_connection_closed_on_release_after_drain(self, temp_db):
+        with pool.connection(temp_db) as conn:
+            pool.close_all()
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
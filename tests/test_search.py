@@ -5,7 +5,7 @@ from pathlib import Path
 
 import pytest
 
-from origin_conversation_mcp import search
+from origin_conversation_mcp import bench, search
 
 
 class TestGetDbPath:
@@ -99,6 +99,7 @@ class TestConversationSearch:
             assert "hello" in result
             assert "user" in result
             assert "First chat" in result or "conv1" in result
+            assert "; id: m1)" in result
         finally:
             os.environ.pop("CONVERSATION_DB", None)
 
@@ -138,3 +139,709 @@ class TestConversationSearch:
             assert result == "No matching messages."
         finally:
             os.environ.pop("CONVERSATION_DB", None)
+
+
+class TestFtsQuery:
+    """Tests for _fts_query."""
+
+    def test_words_quoted_as_prefixes(self):
+        assert search._fts_query("hello world") == '"hello"* "world"*'
+
+    def test_operators_and_punctuation_neutralized(self):
+        assert search._fts_query('foo OR "bar" -baz*') == '"foo"* "OR"* "bar"* "baz"*'
+
+    def test_no_words_returns_none(self):
+        assert search._fts_query("?!") is None
+
+
+class TestIndexedSearch:
+    """conversation_search through the sidecar FTS index."""
+
+    @pytest.fixture
+    def indexed_db(self, temp_db, monkeypatch):
+        import sqlite3
+
+        with sqlite3.connect(temp_db) as conn:
+            conn.executemany(
+                "INSERT INTO messages (id, conversation_id, role, content, create_time, position) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    ("m5", "conv1", "user", "asyncio gather question", 1600000000.0, 2),
+                    ("m6", "conv2", "assistant", "use asyncio.gather for asyncio tasks", 1700002000.0, 2),
+                ],
+            )
+        search.index.build_sidecar(temp_db)
+        monkeypatch.setenv("CONVERSATION_DB", temp_db)
+        return temp_db
+
+    def test_matches_words_and_prefixes(self, indexed_db):
+        result = search.conversation_search(query="asyn gath", limit=10)
+        assert "asyncio gather question" in result
+        assert "use asyncio.gather" in result
+
+    def test_title_match(self, indexed_db):
+        result = search.conversation_search(query="Second", roles=["tool"], limit=10)
+        assert "tool result" in result
+
+    def test_ranked_by_relevance_and_recency(self, indexed_db):
+        result = search.conversation_search(query="asyncio", limit=10)
+        assert result.index("use asyncio.gather") < result.index("asyncio gather question")
+
+    def test_like_fallback_while_building(self, temp_db, monkeypatch):
+        monkeypatch.setenv("CONVERSATION_DB", temp_db)
+        monkeypatch.setattr(search.index, "ensure_sidecar", lambda db_path: None)
+        result = search.conversation_search(query="lo wor", limit=10)
+        assert "hello world" in result
+
+
+class TestDateRangeInSql:
+    """Date ranges are applied in SQL, for float and ISO create_time, at any DB size."""
+
+    @pytest.fixture
+    def mixed_db(self, temp_db, monkeypatch):
+        import sqlite3
+
+        with sqlite3.connect(temp_db) as conn:
+            # 6000 newer rows would have hidden older matches behind the old 5000-row fetch cap.
+            conn.executemany(
+                "INSERT INTO messages (id, conversation_id, role, content, create_time, position) "
+                "VALUES (?, 'conv1', 'user', 'filler', ?, ?)",
+                [(f"f{i}", 1710000000.0 + i, 10 + i) for i in range(6000)],
+            )
+            conn.execute(
+                "INSERT INTO messages (id, conversation_id, role, content, create_time, position) "
+                "VALUES ('iso1', 'conv2', 'assistant', 'iso stamped', '2023-06-15T12:00:00Z', 5)"
+            )
+        monkeypatch.setenv("CONVERSATION_DB", temp_db)
+        return temp_db
+
+    @pytest.mark.parametrize("indexed", [False, True])
+    def test_old_matches_found_past_newer_rows(self, mixed_db, monkeypatch, indexed):
+        if indexed:
+            search.index.build_sidecar(mixed_db)
+        else:
+            monkeypatch.setattr(search.index, "ensure_sidecar", lambda db_path: None)
+        result = search.conversation_search(start_date="2023-11-14", end_date="2023-11-14", limit=10)
+        assert "hello world" in result
+        assert "foo bar" in result
+        assert "filler" not in result
+
+    @pytest.mark.parametrize("indexed", [False, True])
+    def test_iso_create_time_in_range(self, mixed_db, monkeypatch, indexed):
+        if indexed:
+            search.index.build_sidecar(mixed_db)
+        else:
+            monkeypatch.setattr(search.index, "ensure_sidecar", lambda db_path: None)
+        result = search.conversation_search(start_date="2023-06-15", end_date="2023-06-15", limit=10)
+        assert result.startswith("[2023-06-15T12:00:00Z] assistant")
+        assert result.count("---") == 0
+
+    def test_indexed_range_uses_ts_index(self, mixed_db):
+        import sqlite3
+
+        path = search.index.build_sidecar(mixed_db)
+        with sqlite3.connect(path) as conn:
+            plan = conn.execute(
+                "EXPLAIN QUERY PLAN SELECT rowid FROM msg_time WHERE ts >= ? AND ts <= ? "
+                "ORDER BY ts DESC, rowid DESC LIMIT 10",
+                (1.0, 2.0),
+            ).fetchall()
+        assert any("msg_time_ts" in row[-1] for row in plan)
+
+    def test_indexed_undated_ordered_by_normalized_time(self, mixed_db):
+        search.index.build_sidecar(mixed_db)
+        result = search.conversation_search(roles=["assistant"], limit=10)
+        assert result.index("hi there") < result.index("iso stamped")
+
+
+class TestDateRange:
+    """Tests for _date_range."""
+
+    def test_date_only_end_covers_day(self):
+        start, end = search._date_range("2024-01-15", "2024-01-15")
+        assert end - start == pytest.approx(search._SECONDS_PER_DAY - search._END_OF_DAY_EPSILON)
+
+    def test_unset(self):
+        assert search._date_range(None, None) == (None, None)
+
+
+class TestSearchKey:
+    """Tests for search_key."""
+
+    def test_equivalent_arguments_share_key(self):
+        a = search.search_key("  hello ", ["user", "assistant"], "2024-01-15", "2024-01-20", 10)
+        b = search.search_key("hello", ["assistant", "user", "user"], "2024-01-15T00:00:00Z", "2024-01-20", 10)
+        assert a == b
+
+    def test_empty_query_and_roles_normalized(self):
+        assert search.search_key("   ", [], None, None, 5) == search.search_key(None, None, None, None, 5)
+
+    def test_limit_distinguishes(self):
+        assert search.search_key("x", None, None, None, 5) != search.search_key("x", None, None, None, 6)
+
+
+class TestResultCache:
+    """conversation_search serves repeats from result_cache and invalidates on DB change."""
+
+    def test_repeat_served_from_cache(self, temp_db, monkeypatch):
+        monkeypatch.setenv("CONVERSATION_DB", temp_db)
+        monkeypatch.setenv("CONVERSATION_INDEX", "off")
+        calls = []
+        real = search._search
+        monkeypatch.setattr(search, "_search", lambda *a: calls.append(a) or real(*a))
+        first = search.conversation_search(query="hello", roles=["user", "assistant"], limit=10)
+        second = search.conversation_search(query=" hello", roles=["assistant", "user"], limit=10)
+        assert first == second
+        assert len(calls) == 1
+        assert search.result_cache.stats()["hits"] >= 1
+
+    def test_db_change_invalidates(self, temp_db, monkeypatch):
+        import sqlite3
+        import time
+
+        monkeypatch.setenv("CONVERSATION_DB", temp_db)
+        monkeypatch.setenv("CONVERSATION_INDEX", "off")
+        assert search.conversation_search(query="brand new", limit=10) == "No matching messages."
+        with sqlite3.connect(temp_db) as conn:
+            conn.execute(
+                "INSERT INTO messages (id, conversation_id, role, content, create_time, position) "
+                "VALUES ('m9', 'conv1', 'user', 'brand new text', 1700005000.0, 9)"
+            )
+        stamp = time.time() + 5
+        os.utime(temp_db, (stamp, stamp))
+        assert "brand new text" in search.conversation_search(query="brand new", limit=10)
+
+
+class TestCursorPagination:
+    """Keyset pagination through next_cursor / cursor."""
+
+    @pytest.fixture
+    def paged_db(self, temp_db, monkeypatch):
+        import sqlite3
+
+        with sqlite3.connect(temp_db) as conn:
+            rows = [(f"p{i}", "conv1", "assistant", f"page item {i}", 1710000000.0 + i // 2, 10 + i) for i in range(25)]
+            rows.append(("p-undated", "conv1", "assistant", "page item undated", None, 99))
+            rows.append(("p-iso", "conv2", "assistant", "page item iso", "2023-01-01T00:00:00Z", 100))
+            conn.executemany(
+                "INSERT INTO messages (id, conversation_id, role, content, create_time, position) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        monkeypatch.setenv("CONVERSATION_DB", temp_db)
+        return temp_db
+
+    @staticmethod
+    def _walk(**kwargs):
+        pages, cursor = [], None
+        while True:
+            result = search.conversation_search(cursor=cursor, **kwargs)
+            body, _, cursor = result.partition("\n\n" + search._NEXT_CURSOR_PREFIX)
+            pages.append(body)
+            if not cursor:
+                return pages
+            assert len(pages) < 50
+
+    @staticmethod
+    def _items(pages):
+        return [block.split("\n", 1)[1] for page in pages for block in page.split("\n\n---\n\n")]
+
+    @pytest.mark.parametrize("indexed", [False, True])
+    def test_walk_covers_every_row_once_in_order(self, paged_db, monkeypatch, indexed):
+        if indexed:
+            search.index.build_sidecar(paged_db)
+        else:
+            monkeypatch.setattr(search.index, "ensure_sidecar", lambda db_path: None)
+        full = search.conversation_search(roles=["assistant"], limit=200)
+        pages = self._walk(roles=["assistant"], limit=4)
+        items = self._items(pages)
+        assert items == self._items([full])
+        assert len(items) == len(set(items)) == 28
+        assert "page item undated" in items
+        if indexed:
+            assert items[0] == "page item 24"
+            assert items[-2:] == ["page item iso", "page item undated"]
+
+    def test_walk_relevance_order(self, paged_db):
+        search.index.build_sidecar(paged_db)
+        full = search.conversation_search(query="page item", limit=200)
+        pages = self._walk(query="page item", limit=5)
+        assert self._items(pages) == self._items([full])
+        assert len(self._items(pages)) == 27
+
+    def test_walk_with_date_range(self, paged_db):
+        search.index.build_sidecar(paged_db)
+        pages = self._walk(start_date="2024-03-09", end_date="2024-03-10", limit=3)
+        items = self._items(pages)
+        assert len(items) == 25
+        assert all(item.startswith("page item") for item in items)
+
+    def test_no_cursor_on_last_page(self, paged_db):
+        result = search.conversation_search(roles=["tool"], limit=1)
+        assert search._NEXT_CURSOR_PREFIX not in result
+
+    def test_cursor_survives_index_becoming_ready(self, paged_db, monkeypatch):
+        with monkeypatch.context() as m:
+            m.setattr(search.index, "ensure_sidecar", lambda db_path: None)
+            # Raw create_time DESC sorts ISO strings before floats: iso, 24, 23, 22.
+            first = search.conversation_search(roles=["assistant"], limit=4)
+        cursor = first.rsplit(search._NEXT_CURSOR_PREFIX, 1)[1]
+        search.index.build_sidecar(paged_db)
+        second = search.conversation_search(roles=["assistant"], limit=3, cursor=cursor)
+        assert "page item 21" in second.split("\n\n---\n\n")[0]
+
+    @staticmethod
+    def _walk_across_index_ready(db_paths, monkeypatch, raw_pages, **kwargs):
+        """Walk with the index unavailable for raw_pages pages, then ready for the rest."""
+        pages, cursor = [], None
+        with monkeypatch.context() as m:
+            m.setattr(search.index, "ensure_sidecar", lambda db_path: None)
+            for _ in range(raw_pages):
+                result = search.conversation_search(cursor=cursor, **kwargs)
+                body, _, cursor = result.partition("\n\n" + search._NEXT_CURSOR_PREFIX)
+                pages.append(body)
+        for p in db_paths:
+            search.index.build_sidecar(p)
+        while cursor:
+            result = search.conversation_search(cursor=cursor, **kwargs)
+            body, _, cursor = result.partition("\n\n" + search._NEXT_CURSOR_PREFIX)
+            pages.append(body)
+            assert len(pages) < 200
+        return [block for page in pages for block in page.split("\n\n---\n\n")]
+
+    def test_walk_across_index_ready_mixed_create_time(self, tmp_path, monkeypatch):
+        db = bench.generate_db(str(tmp_path / "mixed.db"), 400, seed=7)
+        monkeypatch.setenv("CONVERSATION_DB", db)
+        blocks = self._walk_across_index_ready([db], monkeypatch, 3, limit=25)
+        assert len(blocks) == len(set(blocks)) == 400
+
+    def test_invalid_cursor_raises(self, paged_db):
+        with pytest.raises(ValueError, match="Invalid cursor"):
+            search.conversation_search(cursor="%%%")
+        with pytest.raises(ValueError, match="Invalid cursor"):
+            search.conversation_search(cursor=search._encode_cursor("x", 1, 1))
+
+    def test_mismatched_cursor_ordering_raises(self, paged_db):
+        search.index.build_sidecar(paged_db)
+        with pytest.raises(ValueError, match="does not match"):
+            search.conversation_search(cursor=search._encode_cursor(search._ORDER_RELEVANCE, -1.0, 1))
+
+    def test_time_cursor_seeks_index(self, paged_db):
+        import sqlite3
+
+        path = search.index.build_sidecar(paged_db)
+        predicate, params = search._keyset_predicate(
+            search._ORDER_TIME, search._encode_cursor(search._ORDER_TIME, 1710000005.0, 20)
+        )
+        with sqlite3.connect(path) as conn:
+            plan = conn.execute(
+                f"EXPLAIN QUERY PLAN SELECT rowid FROM msg_time t WHERE {predicate} "
+                "ORDER BY t.ts DESC, t.rowid DESC LIMIT 5",
+                params,
+            ).fetchall()
+        assert any("SEARCH" in row[-1] and "msg_time_ts" in row[-1] for row in plan)
+
+
+class TestMaxBytes:
+    """Byte-budgeted, streaming result formatting."""
+
+    @pytest.fixture
+    def big_db(self, temp_db, monkeypatch):
+        import sqlite3
+
+        with sqlite3.connect(temp_db) as conn:
+            conn.executemany(
+                "INSERT INTO messages (id, conversation_id, role, content, create_time, position) "
+                "VALUES (?, 'conv1', 'assistant', ?, ?, ?)",
+                [(f"b{i}", f"block {i} " + "x" * 500, 1710000000.0 + i, 10 + i) for i in range(20)],
+            )
+        monkeypatch.setenv("CONVERSATION_DB", temp_db)
+        return temp_db
+
+    def test_budget_caps_output_and_returns_cursor(self, big_db):
+        result = search.conversation_search(roles=["assistant"], limit=20, max_bytes=2000)
+        body, _, cursor = result.partition("\n\n" + search._NEXT_CURSOR_PREFIX)
+        assert len(result.encode("utf-8")) <= 2000  # next_cursor line included
+        assert body.count(search._RESULT_SEPARATOR) == 2  # three ~560-byte blocks fit
+        assert cursor
+        following = search.conversation_search(roles=["assistant"], limit=20, max_bytes=2000, cursor=cursor)
+        assert "block 16 " in following.split(search._RESULT_SEPARATOR)[0]
+
+    def test_first_block_truncated_to_budget(self, big_db):
+        result = search.conversation_search(roles=["assistant"], limit=5, max_bytes=150)
+        body, _, cursor = result.partition("\n\n" + search._NEXT_CURSOR_PREFIX)
+        assert len(result.encode("utf-8")) == 150 and cursor
+        assert "block 19" in body
+        following = search.conversation_search(roles=["assistant"], limit=5, max_bytes=150, cursor=cursor)
+        assert "block 18" in following
+
+    def test_budget_fits_cursor_line(self, big_db):
+        unbounded = search.conversation_search(roles=["assistant"], limit=3)
+        body = unbounded.partition("\n\n" + search._NEXT_CURSOR_PREFIX)[0]
+        # Exactly the three blocks: no room left for the cursor line, so only two fit.
+        result = search.conversation_search(roles=["assistant"], limit=20, max_bytes=len(body.encode("utf-8")))
+        assert result.count(search._RESULT_SEPARATOR) == 1
+        assert len(result.encode("utf-8")) <= len(body.encode("utf-8"))
+
+    def test_no_budget_returns_full_limit(self, big_db):
+        result = search.conversation_search(roles=["assistant"], limit=20)
+        assert result.count(search._RESULT_SEPARATOR) == 19
+
+    def test_stops_reading_rows_at_budget(self, big_db, monkeypatch):
+        formatted = []
+        real = search._format_row
+        monkeypatch.setattr(search, "_format_row", lambda row: formatted.append(row) or real(row))
+        search.conversation_search(roles=["assistant"], limit=20, max_bytes=1200)
+        assert len(formatted) == 3
+
+
+class TestSearchBatch:
+    """conversation_search_batch."""
+
+    @pytest.fixture
+    def batch_db(self, temp_db, monkeypatch):
+        import sqlite3
+
+        with sqlite3.connect(temp_db) as conn:
+            conn.executemany(
+                "INSERT INTO messages (id, conversation_id, role, content, create_time, position) "
+                "VALUES (?, 'conv1', 'assistant', ?, ?, ?)",
+                [(f"b{i}", f"block {i} " + "x" * 500, 1710000000.0 + i, 10 + i) for i in range(20)],
+            )
+        monkeypatch.setenv("CONVERSATION_DB", temp_db)
+        return temp_db
+
+    @staticmethod
+    def _sections(result):
+        return [s.partition("\n")[2] for s in result.split(search._BATCH_HEADER_PREFIX)[1:]]
+
+    def test_grouped_in_order_matching_single_searches(self, batch_db):
+        specs = [{"query": "Python"}, {"roles": ["user"], "limit": 2}, {"query": "nothing-matches"}]
+        result = search.conversation_search_batch(specs)
+        assert result.startswith('=== Query 1: "Python" (limit 50)\n')
+        assert "=== Query 2: (no query) (roles: user; limit 2)\n" in result
+        sections = [s.rstrip("\n") for s in self._sections(result)]
+        assert sections == [search.conversation_search(**spec) for spec in specs]
+
+    def test_shares_one_connection(self, batch_db, monkeypatch):
+        borrowed = []
+        real = search.pool.connection
+        monkeypatch.setattr(search.pool, "connection", lambda p: borrowed.append(p) or real(p))
+        search.conversation_search_batch([{"query": "block"}, {"roles": ["assistant"]}, {"query": "Python"}])
+        assert len(borrowed) == 1
+
+    def test_combined_budget_carries_over(self, batch_db):
+        result = search.conversation_search_batch(
+            [{"query": "nothing-matches"}, {"roles": ["assistant"], "limit": 20}], max_bytes=2400
+        )
+        first, second = self._sections(result)
+        body = second.partition("\n\n" + search._NEXT_CURSOR_PREFIX)[0]
+        # The empty first result leaves almost all of the budget to the second query.
+        assert 1600 < len(body.encode("utf-8")) <= 2400 - len(first.rstrip("\n").encode("utf-8"))
+        assert search._NEXT_CURSOR_PREFIX in second
+
+    def test_rejects_empty_or_oversized(self, batch_db):
+        with pytest.raises(ValueError, match="at least one"):
+            search.conversation_search_batch([])
+        with pytest.raises(ValueError, match="At most"):
+            search.conversation_search_batch([{"query": "x"}] * (search._BATCH_MAX_QUERIES + 1))
+
+
+class TestFederatedSearch:
+    """Several DBs searched as shards: parallel per-shard queries, k-way merged."""
+
+    @pytest.fixture
+    def shards(self, temp_db, tmp_path, monkeypatch):
+        import shutil
+        import sqlite3
+
+        paths = []
+        for name, offset in (("a", 0), ("b", 1)):
+            path = tmp_path / f"shard-{name}.db"
+            shutil.copy(temp_db, path)
+            with sqlite3.connect(path) as conn:
+                conn.execute("DELETE FROM messages")
+                rows = [
+                    (f"{name}{i}", "conv1", "assistant", f"shard {name} note {i}", 1710000000.0 + (i + offset) // 2, i)
+                    for i in range(12)
+                ]
+                rows.append((f"{name}-undated", "conv2", "user", f"shard {name} note undated", None, 0))
+                rows.append((f"{name}-iso", "conv2", "user", f"shard {name} note iso", f"2023-0{offset + 1}-01T00:00:00Z", 1))
+                conn.executemany(
+                    "INSERT INTO messages (id, conversation_id, role, content, create_time, position) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+            paths.append(str(path))
+        monkeypatch.setenv("CONVERSATION_DB", os.pathsep.join(paths))
+        return paths
+
+    def test_get_db_paths(self, shards, tmp_path, monkeypatch):
+        assert search._get_db_paths() == shards
+        monkeypatch.setenv("CONVERSATION_DB", os.pathsep.join([shards[0], str(tmp_path / "missing.db")]))
+        assert search._get_db_paths() == [shards[0]]
+        monkeypatch.setenv("CONVERSATION_DB", shards[1])
+        monkeypatch.setenv("CONVERSATION_FEDERATED", "1")
+        assert search._get_db_paths() == [shards[1]]  # a single-file override wins
+
+    def test_federated_db_dir(self, shards, tmp_path, monkeypatch):
+        import shutil
+
+        db_dir = tmp_path / "db"
+        db_dir.mkdir()
+        for p in shards:
+            shutil.copy(p, db_dir / Path(p).name)
+        monkeypatch.setattr(search, "_db_dir", lambda module_file: db_dir)
+        monkeypatch.delenv("CONVERSATION_DB")
+        monkeypatch.setenv("CONVERSATION_DB_POLL_SECONDS", "0")
+        assert search._get_db_paths() == [search._get_db_path()]
+        search.watcher.reset()
+        monkeypatch.setenv("CONVERSATION_FEDERATED", "1")
+        assert sorted(search._get_db_paths()) == sorted(str(db_dir / Path(p).name) for p in shards)
+        result = search.conversation_search(query="note", limit=100)
+        assert "shard a note 3" in result and "shard b note 3" in result
+
+    @pytest.mark.parametrize("indexed", [False, True])
+    def test_walk_covers_both_shards_once_in_order(self, shards, monkeypatch, indexed):
+        if indexed:
+            for p in shards:
+                search.index.build_sidecar(p)
+        else:
+            monkeypatch.setattr(search.index, "ensure_sidecar", lambda db_path: None)
+        full = TestCursorPagination._items([search.conversation_search(limit=200)])
+        items = TestCursorPagination._items(TestCursorPagination._walk(limit=3))
+        assert items == full
+        assert len(items) == len(set(items)) == 28
+        if indexed:
+            assert items[:2] == ["shard b note 11", "shard a note 11"]
+            # Ties (same ts) are ordered by shard path.
+            assert items[-2:] == ["shard a note undated", "shard b note undated"]
+
+    def test_walk_relevance_order(self, shards):
+        for p in shards:
+            search.index.build_sidecar(p)
+        full = search.conversation_search(query="note", limit=200)
+        items = TestCursorPagination._items(TestCursorPagination._walk(query="note", limit=4))
+        assert items == TestCursorPagination._items([full])
+        assert len(items) == 28
+
+    def test_limit_applies_globally(self, shards):
+        for p in shards:
+            search.index.build_sidecar(p)
+        result = search.conversation_search(roles=["assistant"], limit=5)
+        body = result.split("\n\n" + search._NEXT_CURSOR_PREFIX)[0]
+        assert len(body.split("\n\n---\n\n")) == 5
+        assert search._NEXT_CURSOR_PREFIX in result
+
+    def test_pattern_mode_merged_by_time(self, shards):
+        for p in shards:
+            search.index.build_sidecar(p)
+        items = TestCursorPagination._items(TestCursorPagination._walk(query=r"note 1\d", mode="regex", limit=3))
+        # Ties (same ts) are ordered by shard path.
+        assert items == ["shard b note 11", "shard a note 11", "shard a note 10", "shard b note 10"]
+
+    @pytest.mark.parametrize(
+        "params",
+        [{}, {"start_date": "2023-01-01", "end_date": "2024-12-31"}],
+    )
+    def test_walk_across_index_ready_mixed_create_time(self, tmp_path, monkeypatch, params):
+        paths = [bench.generate_db(str(tmp_path / f"shard-{seed}.db"), 300, seed=seed) for seed in (7, 8)]
+        monkeypatch.setenv("CONVERSATION_DB", os.pathsep.join(paths))
+        with monkeypatch.context() as m:
+            m.setattr(search.index, "ensure_sidecar", lambda db_path: None)
+            full = search.conversation_search(limit=1000, **params).split("\n\n---\n\n")
+        blocks = TestCursorPagination._walk_across_index_ready(paths, monkeypatch, 3, limit=20, **params)
+        assert blocks == full
+        assert len(blocks) == len(set(blocks))
+
+    def test_single_db_cursor_rejected(self, shards):
+        with pytest.raises(ValueError, match="does not match"):
+            search.conversation_search(cursor=search._encode_cursor(search._ORDER_RAW_TIME, 1.0, 1))
+
+
+class TestPatternModes:
+    """mode substring / regex / fuzzy: trigram candidates from the sidecar, checked exactly."""
+
+    @pytest.fixture
+    def code_db(self, temp_db, monkeypatch):
+        import sqlite3
+
+        contents = [
+            "see https://github.com/sanctumos/origin_conversation/issues/42 for details",
+            "call conversation_search(query=..., limit=20)",
+            "The CONVERSATION_SEARCH tool returns next_cursor",
+            "grep 100% of the logs for build_sidecar",
+            "renamed build-sidecar to build_sidecar_v2",
+            "ticket ABC-1234 and ABC-99",
+            "nothing to see here",
+        ] + [f"filler message {i} about search" for i in range(10)]
+        with sqlite3.connect(temp_db) as conn:
+            conn.executemany(
+                "INSERT INTO messages (id, conversation_id, role, content, create_time, position) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(f"c{i}", "conv1", "assistant", text, 1710000000.0 + i, 10 + i) for i, text in enumerate(contents)],
+            )
+        monkeypatch.setenv("CONVERSATION_DB", temp_db)
+        return temp_db
+
+    @staticmethod
+    def _ids(result):
+        return sorted(line.rsplit("; id: ", 1)[1].rstrip(")") for line in result.splitlines() if "; id: " in line)
+
+    @pytest.mark.parametrize(
+        "query", ["conversation_search", "origin_conversation/issues", "100%", "Build_Sidecar", "chat", "se", "b"]
+    )
+    def test_substring_same_as_like_path(self, code_db, monkeypatch, query):
+        with monkeypatch.context() as m:
+            m.setattr(search.index, "ensure_sidecar", lambda db_path: None)
+            scanned = search.conversation_search(query=query, mode="substring", limit=100)
+        search.index.build_sidecar(code_db)
+        indexed = search.conversation_search(query=query, mode="substring", limit=100)
+        assert self._ids(indexed) == self._ids(scanned)
+        if "%" not in query and "_" not in query:
+            with monkeypatch.context() as m:
+                m.setattr(search.index, "ensure_sidecar", lambda db_path: None)
+                like = search.conversation_search(query=query, limit=100)
+            assert self._ids(indexed) == self._ids(like)
+
+    def test_substring_takes_wildcards_literally(self, code_db):
+        search.index.build_sidecar(code_db)
+        assert self._ids(search.conversation_search(query="100%", mode="substring")) == ["c3"]
+        assert self._ids(search.conversation_search(query="build_sidecar", mode="substring")) == ["c3", "c4"]
+        assert self._ids(search.conversation_search(query="build%sidecar", mode="substring")) == []
+
+    def test_narrows_by_trigrams(self, code_db):
+        search.index.build_sidecar(code_db)
+        key = search.search_key("origin_conversation/issues", None, None, None, 10, mode="substring")
+        with search.pool.connection(code_db) as conn:
+            sql, params, order = search._build_sql(conn, code_db, key)
+        assert "msg_tri MATCH ?" in sql and order == search._ORDER_TIME
+        assert '"ori" AND "rig"' in params[0]
+
+    @pytest.mark.parametrize("indexed", [False, True])
+    def test_regex_and_fuzzy(self, code_db, monkeypatch, indexed):
+        if indexed:
+            search.index.build_sidecar(code_db)
+        else:
+            monkeypatch.setattr(search.index, "ensure_sidecar", lambda db_path: None)
+        assert self._ids(search.conversation_search(query=r"ABC-\d{4}\b", mode="regex")) == ["c5"]
+        assert self._ids(search.conversation_search(query=r"issues/\d+", mode="regex")) == ["c0"]
+        assert self._ids(search.conversation_search(query=r"(?i)^the conversation", mode="regex")) == ["c2"]
+        assert self._ids(search.conversation_search(query="conversaton_serch", mode="fuzzy")) == ["c1", "c2"]
+        assert self._ids(search.conversation_search(query="buld_sidecar", mode="fuzzy")) == ["c3", "c4"]
+
+    def test_walk_newest_first(self, code_db):
+        search.index.build_sidecar(code_db)
+        pages = TestCursorPagination._walk(query="search", mode="substring", limit=4)
+        items = TestCursorPagination._items(pages)
+        assert len(items) == 12
+        assert items[0] == "filler message 9 about search"
+        assert items[-2:] == ["The CONVERSATION_SEARCH tool returns next_cursor", "call conversation_search(query=..., limit=20)"]
+
+    def test_invalid_arguments(self, code_db):
+        with pytest.raises(ValueError, match="requires a query"):
+            search.conversation_search(mode="fuzzy")
+        with pytest.raises(ValueError, match="Invalid regex"):
+            search.conversation_search(query="[unclosed", mode="regex")
+
+
+class TestSnippets:
+    """snippet_chars: windows around the matches instead of the head of each message."""
+
+    @pytest.fixture
+    def long_db(self, temp_db, monkeypatch):
+        import sqlite3
+
+        body = "Intro paragraph. " * 150 + "The fix was to pin uvloop to 0.19 in requirements. " + "Outro text. " * 100
+        with sqlite3.connect(temp_db) as conn:
+            conn.execute(
+                "INSERT INTO messages (id, conversation_id, role, content, create_time, position) "
+                "VALUES ('long', 'conv1', 'assistant', ?, 1710000000.0, 5)",
+                (body,),
+            )
+        monkeypatch.setenv("CONVERSATION_DB", temp_db)
+        return temp_db
+
+    @pytest.mark.parametrize("indexed", [False, True])
+    def test_text_mode_window_around_match(self, long_db, monkeypatch, indexed):
+        if indexed:
+            search.index.build_sidecar(long_db)
+        else:
+            monkeypatch.setattr(search.index, "ensure_sidecar", lambda db_path: None)
+        full = search.conversation_search(query="uvloop")
+        result = search.conversation_search(query="uvloop", snippet_chars=80)
+        assert "uvloop" not in full.split("\n", 1)[1]  # past the 2000-character head
+        assert "**uvloop**" in result
+        assert result.startswith("[2024-03-09 16:00] assistant (conv: First chat; id: long)\n… ")
+        assert len(result) < 200 < len(full)
+
+    def test_highlight_comes_from_the_index(self, long_db):
+        search.index.build_sidecar(long_db)
+        key = search.search_key("requirement", None, None, None, 5, snippet_chars=60)
+        with search.pool.connection(long_db) as conn:
+            sql, params, _ = search._build_sql(conn, long_db, key)
+            row = conn.execute(sql, params).fetchone()
+        text, spans = search.snippets.marked_spans(row["marked"])
+        assert [text[s:e] for s, e in spans] == ["requirements"]
+
+    def test_pattern_modes_and_no_match_in_content(self, long_db):
+        search.index.build_sidecar(long_db)
+        assert "**0.19**" in search.conversation_search(query=r"\d+\.\d+", mode="regex", snippet_chars=60)
+        assert "pin **uvloop** to" in search.conversation_search(query="uvlooop", mode="fuzzy", snippet_chars=60)
+        title_hit = search.conversation_search(query="Second", snippet_chars=20)
+        assert "\nfoo bar" in title_hit and "**" not in title_hit
+
+    def test_snippet_chars_part_of_cache_key(self, long_db):
+        assert search.search_key("x", None, None, None, 5) != search.search_key("x", None, None, None, 5, snippet_chars=80)
+        assert search.search_key("x", None, None, None, 5, snippet_chars=0).snippet_chars is None
+
+
+class TestDeadline:
+    """A deadline that stops a search mid-way: partial results, marked, not cached."""
+
+    def test_render_returns_rows_read_before_the_stop(self):
+        import sqlite3
+
+        from origin_conversation_mcp import deadline
+
+        limit = deadline.Deadline(30)
+
+        def rows():
+            yield {"n": 1}
+            yield {"n": 2}
+            limit.cancel()
+            raise sqlite3.OperationalError("interrupted")
+
+        with deadline.active(limit):
+            result = search._render(rows(), 10, None, lambda row: f"after-{row['n']}", None, lambda row: f"row {row['n']}")
+        blocks = result.split(search._RESULT_SEPARATOR)
+        assert blocks[:2] == ["row 1", "row 2\n\n[truncated: the request was cancelled; results are incomplete]\n\nnext_cursor: after-2"]
+
+    def test_other_sqlite_errors_propagate(self):
+        import sqlite3
+
+        from origin_conversation_mcp import deadline
+
+        def rows():
+            raise sqlite3.OperationalError("disk I/O error")
+            yield
+
+        with deadline.active(deadline.Deadline(30)), pytest.raises(sqlite3.OperationalError, match="disk"):
+            search._render(rows(), 10, None, None)
+
+    def test_stopped_search_is_marked_and_not_cached(self, temp_db, monkeypatch):
+        from origin_conversation_mcp import deadline
+        from origin_conversation_mcp.cache import result_cache
+
+        monkeypatch.setenv("CONVERSATION_DB", temp_db)
+        monkeypatch.setattr(deadline, "_PROGRESS_OPS", 1)  # the tiny DB's statements are short
+        limit = deadline.Deadline(30)
+        limit.cancel()
+        with deadline.active(limit):
+            result = search.conversation_search(query="hello")
+        assert result == (
+            "No matching messages found before the search stopped.\n\n"
+            "[truncated: the request was cancelled; results are incomplete]"
+        )
+        assert result_cache.stats()["entries"] == 0
+        assert "hello world" in search.conversation_search(query="hello")
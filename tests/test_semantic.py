@@ -0,0 +1,149 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+"""Tests for origin_conversation_mcp.semantic."""
+import os
+import sqlite3
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from origin_conversation_mcp import index, search, semantic
+
+
+@pytest.fixture
+def semantic_db(temp_db, monkeypatch):
+    with sqlite3.connect(temp_db) as conn:
+        conn.executemany(
+            "INSERT INTO messages (id, conversation_id, role, content, create_time, position) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                ("s1", "conv1", "assistant", "Kubernetes deployments roll out pods gradually", 1700002000.0, 2),
+                ("s2", "conv2", "user", "how do kubernetes deployment rollouts work", 1700003000.0, 2),
+                ("s3", "conv2", "assistant", "bake bread with sourdough starter", 1700004000.0, 3),
+                ("s4", "conv1", "user", "undated deployment note", None, 3),
+            ],
+        )
+    monkeypatch.setenv("CONVERSATION_DB", temp_db)
+    monkeypatch.delenv("CONVERSATION_EMBEDDER", raising=False)
+    return temp_db
+
+
+class TestHashingEmbedder:
+    """Tests for HashingEmbedder."""
+
+    def test_deterministic_and_normalized(self):
+        e = semantic.HashingEmbedder(dim=64)
+        a = e.embed(["hello world", ""])
+        b = semantic.HashingEmbedder(dim=64).embed(["hello world"])
+        assert a.dtype == np.float32 and a.shape == (2, 64)
+        assert np.allclose(a[0], b[0])
+        assert np.isclose(np.linalg.norm(a[0]), 1.0)
+        assert not a[1].any()
+
+    def test_similar_texts_score_higher(self):
+        e = semantic.HashingEmbedder()
+        q, near, far = e.embed(["deploying kubernetes", "kubernetes deployment", "sourdough bread"])
+        assert q @ near > q @ far
+
+
+class TestBuildAndSearch:
+    """build_embeddings / load_embeddings / vector_search."""
+
+    def test_arrays_aligned_to_rowids(self, semantic_db):
+        semantic.build_embeddings(semantic_db)
+        arrays = semantic.load_embeddings(semantic_db)
+        assert isinstance(arrays["vectors"], np.memmap)
+        with sqlite3.connect(semantic_db) as conn:
+            rowids = [r for (r,) in conn.execute("SELECT rowid FROM messages ORDER BY rowid")]
+        assert arrays["rowids"].tolist() == rowids
+        assert arrays["vectors"].shape == (len(rowids), semantic._DEFAULT_DIM)
+        assert arrays["roles"].tolist()[:4] == [1, 2, 1, 3]
+        assert arrays["ts"][-1] == index.UNDATED_TS
+
+    def test_vector_search_with_masks(self, semantic_db):
+        semantic.build_embeddings(semantic_db)
+        arrays = semantic.load_embeddings(semantic_db)
+        hits = semantic.vector_search(arrays, "kubernetes deployment", k=2)
+        assert len(hits) == 2
+        assert hits[0][1] >= hits[1][1]
+        users = semantic.vector_search(arrays, "kubernetes deployment", k=10, roles=("user",))
+        assert {int(arrays["roles"][list(arrays["rowids"]).index(r)]) for r, _ in users} == {1}
+        dated = semantic.vector_search(arrays, "deployment note", k=10, end_ts=1800000000.0)
+        with sqlite3.connect(semantic_db) as conn:
+            undated = conn.execute("SELECT rowid FROM messages WHERE id = 's4'").fetchone()[0]
+        assert undated not in [r for r, _ in dated]
+
+    def test_scoring_batches(self, semantic_db, monkeypatch):
+        semantic.build_embeddings(semantic_db)
+        arrays = semantic.load_embeddings(semantic_db)
+        whole = semantic.vector_search(arrays, "kubernetes", k=3)
+        monkeypatch.setattr(semantic, "_SCORE_BATCH", 2)
+        assert semantic.vector_search(arrays, "kubernetes", k=3) == whole
+
+    def test_failed_build_removes_temp_files(self, semantic_db):
+        class Failing(semantic.HashingEmbedder):
+            def embed(self, texts):
+                raise RuntimeError("embedder down")
+
+        with pytest.raises(RuntimeError, match="embedder down"):
+            semantic.build_embeddings(semantic_db, Failing())
+        directory = os.path.dirname(semantic._meta_path(semantic_db))
+        assert not [name for name in os.listdir(directory) if name.endswith(".tmp")]
+
+    def test_load_builds_in_background(self, semantic_db):
+        assert semantic.load_embeddings(semantic_db) is None
+        deadline = time.monotonic() + 5
+        while (arrays := semantic.load_embeddings(semantic_db)) is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert arrays is not None
+
+    def test_custom_embedder_from_env(self, semantic_db, monkeypatch):
+        monkeypatch.setenv("CONVERSATION_EMBEDDER", "origin_conversation_mcp.semantic:HashingEmbedder")
+        assert isinstance(semantic.get_embedder(), semantic.HashingEmbedder)
+
+
+class TestSemanticMode:
+    """conversation_search(mode="semantic")."""
+
+    def test_fuses_vector_hits_missing_from_text(self, semantic_db):
+        index.build_sidecar(semantic_db)
+        semantic.build_embeddings(semantic_db)
+        text = search.conversation_search(query="kubernetes rollout", limit=10)
+        fused = search.conversation_search(query="kubernetes rollout", limit=10, mode="semantic")
+        assert "Kubernetes deployments roll out" not in text
+        assert "Kubernetes deployments roll out" in fused
+        assert "how do kubernetes deployment rollouts work" in fused
+        assert search._NEXT_CURSOR_PREFIX not in fused
+
+    def test_text_only_while_embeddings_build(self, semantic_db, monkeypatch):
+        monkeypatch.setattr(semantic, "load_embeddings", lambda db_path: None)
+        result = search.conversation_search(query="sourdough", limit=10, mode="semantic")
+        assert "sourdough starter" in result
+
+    def test_requires_query_and_no_cursor(self, semantic_db):
+        with pytest.raises(ValueError, match="requires a query"):
+            search.conversation_search(mode="semantic")
+        with pytest.raises(ValueError, match="cursor"):
+            search.conversation_search(query="x", mode="semantic", cursor="abc")
+
+    def test_unknown_mode(self, semantic_db):
+        with pytest.raises(ValueError, match="Unknown mode"):
+            search.conversation_search(query="x", mode="vibes")
+
+
+def test_federated_semantic_merges_shards(semantic_db, tmp_path, monkeypatch):
+    import shutil
+
+    other = tmp_path / "other.db"
+    shutil.copy(semantic_db, other)
+    with sqlite3.connect(other) as conn:
+        conn.execute("UPDATE messages SET content = 'kubernetes rollout from shard two' WHERE id = 's3'")
+    monkeypatch.setenv("CONVERSATION_DB", os.pathsep.join([semantic_db, str(other)]))
+    for p in (semantic_db, str(other)):
+        index.build_sidecar(p)
+        semantic.build_embeddings(p)
+    result = search.conversation_search(query="kubernetes rollout", limit=10, mode="semantic")
+    assert "kubernetes rollout from shard two" in result
+    assert "Kubernetes deployments roll out" in result
+    assert search._NEXT_CURSOR_PREFIX not in result
@@ -37,9 +37,14 @@ async def test_list_tools():
     assert handler is not None
     result = await handler(None)
     tools = result.result.tools
-    assert len(tools) == 1
-    assert tools[0].name == "conversation_search"
+    assert [t.name for t in tools] == [
+        "conversation_search",
+        "conversation_search_batch",
+        "conversation_context",
+        "conversation_stats",
+    ]
     assert tools[0].inputSchema == CONVERSATION_SEARCH_SCHEMA
+    assert tools[1].inputSchema["required"] == ["queries"]
 
 
 @pytest.mark.asyncio
@@ -80,7 +85,7 @@ async def test_call_tool_invalid_roles():
 async def test_call_tool_database_not_found(monkeypatch):
     from mcp.types import CallToolRequest
 
-    def raise_not_found(*, query=None, roles=None, start_date=None, end_date=None, limit=50):
+    def raise_not_found(**kwargs):
         raise FileNotFoundError("Database not found: /nope.db")
 
     import origin_conversation_mcp.server as server_mod
@@ -100,7 +105,7 @@ async def test_call_tool_database_not_found(monkeypatch):
 async def test_call_tool_logs_exception_on_generic_error(monkeypatch, caplog):
     from mcp.types import CallToolRequest
 
-    def raise_error(*, query=None, roles=None, start_date=None, end_date=None, limit=50):
+    def raise_error(**kwargs):
         raise RuntimeError("internal error")
 
     import origin_conversation_mcp.server as server_mod
@@ -117,3 +122,201 @@ async def test_call_tool_logs_exception_on_generic_error(monkeypatch, caplog):
     assert "Error:" in content[0].text
     assert "internal error" in content[0].text
     assert any("call_tool" in r.message and "internal error" in r.message for r in caplog.records)
+
+
+@pytest.mark.asyncio
+async def test_call_tool_busy_returns_error(monkeypatch):
+    from origin_conversation_mcp.executor import SearchBusyError
+
+    class BusyExecutor:
+        async def run(self, fn, /, *args, **kwargs):
+            raise SearchBusyError("2 searches in progress or queued")
+
+    server = create_server()
+    register_tools(server, BusyExecutor())
+    req = CallToolRequest(params=CallToolParams(name="conversation_search", arguments={}))
+    handler = server.request_handlers.get(CallToolRequest)
+    result = await handler(req)
+    content = result.result.content
+    assert len(content) == 1
+    assert content[0].text.startswith("Server busy:")
+    from origin_conversation_mcp import metrics
+
+    assert metrics.TOOL_CALLS.labels("busy").value == 1
+    assert metrics.CALL_STAGE_SECONDS.labels("total").snapshot()[2] == 1
+
+
+@pytest.mark.asyncio
+async def test_call_tool_invalid_cursor(temp_db, monkeypatch):
+    monkeypatch.setenv("CONVERSATION_DB", temp_db)
+    server = create_server()
+    register_tools(server)
+    req = CallToolRequest(
+        params=CallToolParams(name="conversation_search", arguments={"cursor": "not-a-cursor"})
+    )
+    handler = server.request_handlers.get(CallToolRequest)
+    result = await handler(req)
+    content = result.result.content
+    assert content[0].text.startswith("Invalid argument: Invalid cursor")
+
+
+@pytest.mark.asyncio
+async def test_call_tool_batch(temp_db, monkeypatch):
+    monkeypatch.setenv("CONVERSATION_DB", temp_db)
+    server = create_server()
+    register_tools(server)
+    handler = server.request_handlers.get(CallToolRequest)
+    req = CallToolRequest(
+        params=CallToolParams(
+            name="conversation_search_batch",
+            arguments={"queries": [{"query": "Python"}, {"roles": ["user"], "limit": 1}]},
+        )
+    )
+    result = await handler(req)
+    text = result.result.content[0].text
+    assert text.startswith("=== Query 1: ")
+    assert "=== Query 2: " in text
+    bad = CallToolRequest(
+        params=CallToolParams(
+            name="conversation_search_batch",
+            arguments={"queries": [{"query": "Python"}, {"cursor": "not-a-cursor"}]},
+        )
+    )
+    result = await handler(bad)
+    text = result.result.content[0].text
+    assert text.startswith("Invalid argument: Invalid cursor")
+
+
+@pytest.mark.asyncio
+async def test_call_tool_context(temp_db, monkeypatch):
+    monkeypatch.setenv("CONVERSATION_DB", temp_db)
+    server = create_server()
+    register_tools(server)
+    handler = server.request_handlers.get(CallToolRequest)
+    req = CallToolRequest(
+        params=CallToolParams(name="conversation_context", arguments={"message_id": "m2", "before": 1})
+    )
+    result = await handler(req)
+    text = result.result.content[0].text
+    assert text.startswith("[") and "hello world" in text
+    assert ">>> [" in text
+    missing = CallToolRequest(params=CallToolParams(name="conversation_context", arguments={"message_id": "nope"}))
+    result = await handler(missing)
+    assert result.result.content[0].text.startswith("Invalid argument: No message")
+
+
+@pytest.mark.asyncio
+async def test_call_tool_stats(temp_db, monkeypatch):
+    monkeypatch.setenv("CONVERSATION_DB", temp_db)
+    server = create_server()
+    register_tools(server)
+    handler = server.request_handlers.get(CallToolRequest)
+    req = CallToolRequest(params=CallToolParams(name="conversation_stats", arguments={"roles": ["user"], "top": 1}))
+    result = await handler(req)
+    text = result.result.content[0].text
+    assert text.startswith("Messages: 2 in 2 conversations")
+    assert text.count("(conv: ") == 1
+
+
+def test_parse_snippet_chars():
+    from origin_conversation_mcp.server import _parse_search_arguments
+
+    def snippet_chars(value):
+        return _parse_search_arguments({"snippet_chars": value})[0]["snippet_chars"]
+
+    assert snippet_chars(None) is None
+    assert snippet_chars(300) == 300
+    assert snippet_chars("5") == 20
+    assert snippet_chars(10**6) == 2000
+    assert snippet_chars(0) is None and snippet_chars("many") is None
+
+
+@pytest.mark.asyncio
+async def test_call_tool_coalesces_identical_searches(temp_db, monkeypatch):
+    import asyncio
+    import threading
+
+    import origin_conversation_mcp.server as server_mod
+    from origin_conversation_mcp import metrics, search
+
+    monkeypatch.setenv("CONVERSATION_DB", temp_db)
+    release = threading.Event()
+    runs = []
+
+    def slow_search(**kwargs):
+        runs.append(kwargs["query"])
+        release.wait(5)
+        return f"results for {kwargs['query']}"
+
+    identity_threads = []
+
+    def db_identities():
+        identity_threads.append(threading.current_thread())
+        return search.db_identities()
+
+    monkeypatch.setattr(server_mod, "conversation_search", slow_search)
+    monkeypatch.setattr(server_mod, "db_identities", db_identities)
+    server = create_server()
+    register_tools(server)
+    handler = server.request_handlers.get(CallToolRequest)
+
+    def request(arguments):
+        return CallToolRequest(params=CallToolParams(name="conversation_search", arguments=arguments))
+
+    # Same search after normalization (whitespace, role order); the last one differs.
+    calls = [
+        asyncio.ensure_future(handler(request({"query": "hello", "roles": ["user", "tool"]}))),
+        asyncio.ensure_future(handler(request({"query": " hello ", "roles": ["tool", "user"]}))),
+        asyncio.ensure_future(handler(request({"query": "hello", "roles": ["user", "tool"]}))),
+        asyncio.ensure_future(handler(request({"query": "world"}))),
+    ]
+    await asyncio.sleep(0.05)
+    release.set()
+    texts = [result.result.content[0].text for result in await asyncio.gather(*calls)]
+    assert texts == ["results for hello"] * 3 + ["results for world"]
+    assert sorted(runs) == ["hello", "world"]
+    assert metrics.COALESCED_CALLS.labels("conversation_search").value == 2
+    assert len(identity_threads) == 4 and threading.main_thread() not in identity_threads
+    assert metrics.TOOL_CALLS.labels("ok").value == 4
+
+
+@pytest.mark.asyncio
+async def test_call_tool_timeout_and_cancellation(temp_db, monkeypatch):
+    import asyncio
+    import threading
+    import time
+
+    import origin_conversation_mcp.server as server_mod
+    from origin_conversation_mcp import deadline, metrics
+
+    monkeypatch.setenv("CONVERSATION_DB", temp_db)
+    stopped = threading.Event()
+
+    def slow_search(**kwargs):
+        while not deadline.stopped():
+            time.sleep(0.005)
+        stopped.set()
+        return f"partial\n\n{deadline.truncated_note()}"
+
+    monkeypatch.setattr(server_mod, "conversation_search", slow_search)
+    server = create_server()
+    register_tools(server)
+    handler = server.request_handlers.get(CallToolRequest)
+
+    timed = CallToolRequest(
+        params=CallToolParams(name="conversation_search", arguments={"query": "a", "timeout_seconds": 0.05})
+    )
+    result = await handler(timed)
+    assert result.result.content[0].text == "partial\n\n[truncated: the 0.05 s time limit was reached; results are incomplete]"
+    assert metrics.TOOL_CALLS.labels("timeout").value == 1
+
+    # Cancelling the request (client cancellation or disconnect) stops the worker's search.
+    stopped.clear()
+    abandoned = CallToolRequest(params=CallToolParams(name="conversation_search", arguments={"query": "b"}))
+    task = asyncio.ensure_future(handler(abandoned))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert await asyncio.get_running_loop().run_in_executor(None, stopped.wait, 2)
+    assert metrics.TOOL_CALLS.labels("cancelled").value == 1
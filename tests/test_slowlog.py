@@ -0,0 +1,96 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+"""Tests for origin_conversation_mcp.slowlog."""
+import json
+import os
+
+import pytest
+
+from origin_conversation_mcp import index, search, slowlog
+
+
+@pytest.fixture
+def log_file(tmp_path, temp_db, monkeypatch):
+    path = tmp_path / "slow.jsonl"
+    monkeypatch.setenv("CONVERSATION_DB", temp_db)
+    monkeypatch.setenv("CONVERSATION_SLOW_QUERY_LOG", str(path))
+    monkeypatch.setenv("CONVERSATION_SLOW_QUERY_MS", "0.000001")  # every search is slow
+    return path
+
+
+def _records(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_off_by_default(log_file, monkeypatch):
+    monkeypatch.delenv("CONVERSATION_SLOW_QUERY_MS")
+    assert slowlog.threshold_ms() is None
+    search.conversation_search(query="hello")
+    assert not log_file.exists()
+
+
+def test_records_arguments_stages_rows_and_plan(log_file, temp_db):
+    index.build_sidecar(temp_db)
+    search.conversation_search(query=" hello ", roles=["user"], limit=5)
+    (record,) = _records(log_file)
+    assert record["db"] == [temp_db]
+    assert record["args"]["query"] == "hello" and record["args"]["roles"] == ["user"]
+    assert record["args"]["limit"] == 5 and record["args"]["mode"] == "text"
+    assert {"cache_lookup", "connect", "plan", "execute", "format"} <= set(record["stages_ms"])
+    assert (record["result_rows_read"], record["rows_returned"]) == (1, 1)
+    assert record["truncated"] is False and "error" not in record
+    (plan,) = record["plans"]
+    assert plan["db"] == temp_db and "msg_fts" in plan["sql"]
+    assert any("msg_fts" in line for line in plan["plan"])
+
+
+def test_only_searches_over_threshold(log_file, monkeypatch):
+    monkeypatch.setenv("CONVERSATION_SLOW_QUERY_MS", "60000")
+    search.conversation_search(query="hello")
+    assert not log_file.exists()
+
+
+def test_scan_without_index_is_visible_in_plan(log_file, monkeypatch):
+    monkeypatch.setattr(search.index, "ensure_sidecar", lambda db_path: None)
+    search.conversation_search(query="hello")
+    (record,) = _records(log_file)
+    assert any(line.lstrip().startswith("SCAN") for line in record["plans"][0]["plan"])
+
+
+def test_scan_work_counts_rows_visited(log_file, temp_db, monkeypatch):
+    import sqlite3
+
+    monkeypatch.setattr(search.index, "ensure_sidecar", lambda db_path: None)
+    search.conversation_search(query="no such text", limit=5)
+    with sqlite3.connect(temp_db) as conn:
+        conn.executemany(
+            "INSERT INTO messages (id, conversation_id, role, content, create_time, position) VALUES (?, ?, ?, ?, ?, ?)",
+            [(f"f{i}", "conv1", "user", f"filler {i}", 1600000000.0 + i, 10 + i) for i in range(5000)],
+        )
+    search.conversation_search(query="no such text", limit=5)
+    small, large = _records(log_file)
+    assert large["result_rows_read"] == small["result_rows_read"] == 0
+    assert large["vm_steps"] > small["vm_steps"] and large["vm_steps"] >= 5000
+
+
+def test_default_path_next_to_db(temp_db, monkeypatch, tmp_path):
+    monkeypatch.delenv("CONVERSATION_SLOW_QUERY_LOG", raising=False)
+    assert slowlog.log_path(temp_db) == temp_db + ".slow.jsonl"
+    monkeypatch.setenv("CONVERSATION_SLOW_QUERY_LOG", "logs/slow-{pid}.jsonl")
+    assert slowlog.log_path(temp_db) == os.path.join(os.path.dirname(temp_db), "logs", f"slow-{os.getpid()}.jsonl")
+    monkeypatch.setenv("CONVERSATION_INDEX_DIR", str(tmp_path / "ix"))
+    monkeypatch.delenv("CONVERSATION_SLOW_QUERY_LOG")
+    assert slowlog.log_path(temp_db) == str(tmp_path / "ix" / "test.db.slow.jsonl")
+
+
+def test_rotates_and_expands_pid(tmp_path, log_file, monkeypatch):
+    monkeypatch.setenv("CONVERSATION_SLOW_QUERY_LOG", str(tmp_path / "slow-{pid}.jsonl"))
+    monkeypatch.setenv("CONVERSATION_SLOW_QUERY_LOG_BYTES", "200")
+    for i in range(3):
+        search.conversation_search(query=f"hello{i}")
+    path = tmp_path / f"slow-{os.getpid()}.jsonl"
+    assert path.exists() and (tmp_path / f"slow-{os.getpid()}.jsonl.1").exists()
+
+
+def test_plan_lines_are_indented_by_depth():
+    rows = [(2, 0, 0, "SEARCH m USING INDEX i (x=?)"), (5, 2, 0, "LIST SUBQUERY 1"), (7, 0, 0, "USE TEMP B-TREE FOR ORDER BY")]
+    assert slowlog._plan_lines(rows) == ["SEARCH m USING INDEX i (x=?)", "  LIST SUBQUERY 1", "USE TEMP B-TREE FOR ORDER BY"]
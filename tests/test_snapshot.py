@@ -0,0 +1,127 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+"""Tests for origin_conversation_mcp.snapshot."""
+import sqlite3
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from origin_conversation_mcp import bench, index, search, snapshot
+from origin_conversation_mcp.search import _create_time_comparable
+
+
+@pytest.fixture
+def snap_db(tmp_path, monkeypatch):
+    path = bench.generate_db(str(tmp_path / "snap.db"), 600, seed=5)
+    monkeypatch.setenv("CONVERSATION_DB", path)
+    monkeypatch.setenv("CONVERSATION_IN_MEMORY", "1")
+    return path
+
+
+def _reference(db_path, query=None, roles=None, start_ts=None, end_ts=None):
+    """(rowid, ts) matching like the LIKE scan, in (ts DESC, rowid DESC) order."""
+    where, params = [], []
+    if query:
+        where.append("(m.content LIKE ? OR c.title LIKE ?)")
+        params += [f"%{query}%"] * 2
+    if roles:
+        where.append(f"m.role IN ({','.join('?' * len(roles))})")
+        params += roles
+    with sqlite3.connect(db_path) as conn:
+        conn.create_function("ct_epoch", 1, _create_time_comparable)
+        rows = conn.execute(
+            "SELECT m.rowid, ct_epoch(m.create_time) FROM messages m JOIN conversations c ON c.id = m.conversation_id"
+            + (" WHERE " + " AND ".join(where) if where else ""),
+            params,
+        ).fetchall()
+    rows = [(r, index.UNDATED_TS if ts is None else ts) for r, ts in rows]
+    if start_ts is not None or end_ts is not None:
+        rows = [
+            (r, ts)
+            for r, ts in rows
+            if ts > index.UNDATED_TS
+            and (start_ts is None or ts >= start_ts)
+            and (end_ts is None or ts <= end_ts)
+        ]
+    return sorted(rows, key=lambda row: (-row[1], -row[0]))
+
+
+def test_load_is_sorted_and_compact(snap_db):
+    snap = snapshot.load(snap_db)
+    assert snap.rowids.dtype == np.int64 and snap.roles.dtype == np.uint8 and snap.conv.dtype == np.int32
+    assert (np.diff(snap.neg_ts) >= 0).all()
+    assert len(snap.offsets) == len(snap.rowids) + 1 and snap.offsets[-1] == len(snap.content)
+    assert snap.nbytes >= len(snap.content) + snap.rowids.nbytes
+    assert [(r, ts) for r, ts in snap.search(None, None, None, None, None, 10_000)] == _reference(snap_db)
+    (line,) = snapshot.preload([snap_db])
+    assert f"{len(snap.rowids)} messages" in line and "MiB resident" in line
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        {"query": "LoPe"},
+        {"query": "zzz-not-there"},
+        {"roles": ["tool"]},
+        {"roles": ["user", "assistant"], "start_ts": 1.69e9},
+        {"query": "daexzo", "end_ts": 1.75e9},
+        {"query": "plafa", "roles": ["assistant"], "start_ts": 1.68e9, "end_ts": 1.71e9},
+    ],
+)
+def test_search_matches_sql(snap_db, filters):
+    snap = snapshot.load(snap_db)
+    hits = snap.search(
+        filters.get("query"),
+        tuple(filters["roles"]) if "roles" in filters else None,
+        filters.get("start_ts"),
+        filters.get("end_ts"),
+        None,
+        10_000,
+    )
+    assert hits == _reference(snap_db, **filters)
+    assert hits or filters.get("query") == "zzz-not-there"
+
+
+def test_cursor_walk_through_conversation_search(snap_db, monkeypatch):
+    snapshot.preload([snap_db])
+    monkeypatch.setattr(search, "_build_sql", lambda *a, **k: pytest.fail("SQLite scan used"))
+    pages, cursor = [], None
+    while True:
+        page = search.conversation_search(
+            query="lope", roles=["user", "assistant"], limit=7, cursor=cursor, mode="substring"
+        )
+        body, _, cursor = page.partition("\n\n" + search._NEXT_CURSOR_PREFIX)
+        pages.append(body)
+        if not cursor:
+            break
+    ids = [block.split("; id: ", 1)[1].split(")", 1)[0] for page in pages for block in page.split(search._RESULT_SEPARATOR)]
+    with sqlite3.connect(snap_db) as conn:
+        expected = [
+            conn.execute("SELECT id FROM messages WHERE rowid = ?", (r,)).fetchone()[0]
+            for r, _ in _reference(snap_db, query="lope", roles=["user", "assistant"])
+        ]
+    assert ids == expected
+
+
+def test_same_results_as_indexed_time_order(snap_db, monkeypatch):
+    index.build_sidecar(snap_db)
+    monkeypatch.delenv("CONVERSATION_IN_MEMORY")
+    indexed = search.conversation_search(roles=["assistant"], start_date="2023-06-01", limit=40)
+    monkeypatch.setenv("CONVERSATION_IN_MEMORY", "1")
+    snapshot.preload([snap_db])
+    assert search.conversation_search(roles=["assistant"], start_date="2023-06-01", limit=40) == indexed
+
+
+def test_text_query_keeps_relevance_ranking(snap_db, monkeypatch):
+    index.build_sidecar(snap_db)
+    snapshot.preload([snap_db])
+    monkeypatch.setattr(search, "_snapshot_search", lambda *a: pytest.fail("snapshot used"))
+    ranked = search.conversation_search(query="lope", limit=10)
+    monkeypatch.delenv("CONVERSATION_IN_MEMORY")
+    assert search.conversation_search(query="lope", limit=10) == ranked
+
+
+def test_sqlite_until_loaded(snap_db, monkeypatch):
+    monkeypatch.setattr(snapshot, "_load_in_background", lambda db_path, fingerprint: None)
+    assert snapshot.get(snap_db) is None
+    assert "No matching" not in search.conversation_search(limit=3)
@@ -0,0 +1,48 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+"""Tests for origin_conversation_mcp.snippets."""
+from origin_conversation_mcp import snippets
+
+
+def test_marked_spans_strips_markers():
+    marked = f"say {snippets.MARK_START}hello{snippets.MARK_END} to {snippets.MARK_START}helloworld{snippets.MARK_END}"
+    text, spans = snippets.marked_spans(marked)
+    assert text == "say hello to helloworld"
+    assert [text[s:e] for s, e in spans] == ["hello", "helloworld"]
+
+
+def test_windows_centered_on_matches():
+    text = "x" * 500 + " the needle here " + "y" * 500 + " another needle " + "z" * 500
+    out = snippets.snippet(text, snippets.substring_spans("NEEDLE", text), 40)
+    assert out.count("**needle**") == 2
+    assert out.startswith("… ") and out.endswith(" …") and " … " in out.strip("… ")
+    assert len(out) < 120
+
+
+def test_close_matches_share_a_window_and_windows_are_capped():
+    text = "alpha beta alpha " + "filler " * 40
+    out = snippets.snippet(text, snippets.word_spans("alp", text), 60)
+    assert out.startswith("**alpha** beta **alpha** filler") and out.endswith(" …")
+    dense = " ".join(["alpha beta"] * 50)
+    out = snippets.snippet(dense, snippets.word_spans("alp", dense), 60)
+    assert out.strip("… ").count(" … ") == 2  # 3 windows
+    assert len(out) < 100
+
+
+def test_long_match_is_cut_to_width():
+    text = "lorem ipsum " * 3000 + "needle"
+    out = snippets.snippet(text, [(0, len(text))], 200)
+    assert len(out) <= 200 + 10
+    assert out.startswith("**lorem ipsum") and out.endswith("…** …")
+    two = snippets.snippet(text, [(0, 30000), (30000, len(text))], 200)
+    assert len(two) <= 200 + 20 and two.count("**") == 4
+
+
+def test_no_match_shows_head():
+    assert snippets.snippet("first   line\nsecond line", [], 12) == "first line…"
+    assert snippets.snippet("short", [], 12) == "short"
+
+
+def test_word_spans_match_prefixes_case_insensitively():
+    text = "Python pythonic py-spy"
+    assert [text[s:e] for s, e in snippets.word_spans("PYTHON", text)] == ["Python", "pythonic"]
+    assert [text[s:e] for s, e in snippets.regex_spans(r"py-\w+", text)] == ["py-spy"]
@@ -0,0 +1,114 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+"""Tests for origin_conversation_mcp.stats."""
+import os
+import sqlite3
+
+import pytest
+
+from origin_conversation_mcp import index, stats
+
+
+@pytest.fixture
+def stats_db(temp_db, monkeypatch):
+    with sqlite3.connect(temp_db) as conn:
+        conn.execute("INSERT INTO conversations (id, title) VALUES ('conv3', 'Long chat')")
+        conn.executemany(
+            "INSERT INTO messages (id, conversation_id, role, content, create_time, position) "
+            "VALUES (?, 'conv3', ?, ?, ?, ?)",
+            [
+                ("l1", "user", "deploy the service", "2024-01-31T23:30:00Z", 0),
+                ("l2", "assistant", "deploy with rolling update", 1706745600.0, 1),  # 2024-02-01
+                ("l3", "user", "thanks", 1709251200.0, 2),  # 2024-03-01
+                ("l4", "assistant", "deploy notes", None, 3),
+            ],
+        )
+        # Orphan messages are not counted, as they are never returned by search.
+        conn.execute(
+            "INSERT INTO messages (id, conversation_id, role, content, create_time, position) "
+            "VALUES ('o1', 'gone', 'user', 'deploy orphan', 1706745600.0, 0)"
+        )
+    monkeypatch.setenv("CONVERSATION_DB", temp_db)
+    return temp_db
+
+
+@pytest.fixture(params=[False, True], ids=["scan", "indexed"])
+def indexed(request, stats_db, monkeypatch):
+    if request.param:
+        index.build_sidecar(stats_db)
+    else:
+        monkeypatch.setattr(index, "ensure_sidecar", lambda db_path: None)
+    return request.param
+
+
+def test_overview(stats_db, indexed):
+    result = stats.conversation_stats(top=2)
+    lines = result.splitlines()
+    assert lines[0] == "Messages: 8 in 3 conversations"
+    assert lines[1] == "By role: assistant 3, tool 1, user 4"
+    assert "  2023-11: 4 (assistant 1, tool 1, user 2)" in lines
+    assert "  2024-01: 1 (user 1)" in lines
+    assert lines[lines.index("Top conversations:") - 1] == "  undated: 1 (assistant 1)"
+    assert lines[-2] == "  4  Long chat (conv: conv3; 2024-01-31 to 2024-03-01)"
+    assert len(lines) == lines.index("Top conversations:") + 3
+
+
+def test_filters_select_whole_days(stats_db, indexed):
+    result = stats.conversation_stats(
+        roles=["assistant", "user"], start_date="2024-01-31T23:59", end_date="2024-02-01T00:00"
+    )
+    assert result.splitlines()[:2] == ["Messages: 2 in 1 conversation", "By role: assistant 1, user 1"]
+    assert "undated" not in result
+
+
+def test_query_counts_matches(stats_db, indexed):
+    result = stats.conversation_stats(query="deploy", roles=["assistant"])
+    assert result.splitlines()[:2] == ["Messages: 2 in 1 conversation", "By role: assistant 2"]
+    assert "  undated: 1 (assistant 1)" in result
+    assert stats.conversation_stats(query="nothing-matches") == "No matching messages."
+
+
+def test_aggregates_read_without_messages(stats_db):
+    index.build_sidecar(stats_db)
+    from origin_conversation_mcp import pool
+
+    with pool.connection(stats_db) as conn:
+        stats._attach_index(conn, stats_db)
+        day_sql, conv_sql, params = stats._aggregate_sql(
+            stats.search_key(None, ["user"], "2024-01-01", None, 0), (19723, None)
+        )
+        plans = [conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall() for sql in (day_sql, conv_sql)]
+    assert not any("messages" in row[-1] for plan in plans for row in plan)
+
+
+def test_federated_sums_shards(stats_db, tmp_path, monkeypatch):
+    import shutil
+
+    other = tmp_path / "other.db"
+    shutil.copy(stats_db, other)
+    with sqlite3.connect(other) as conn:
+        conn.execute("UPDATE conversations SET id = 'conv9', title = 'Copy' WHERE id = 'conv3'")
+        conn.execute("UPDATE messages SET conversation_id = 'conv9' WHERE conversation_id = 'conv3'")
+        conn.execute("DELETE FROM messages WHERE id = 'l4'")
+    monkeypatch.setenv("CONVERSATION_DB", os.pathsep.join([stats_db, str(other)]))
+    lines = stats.conversation_stats(top=2).splitlines()
+    assert lines[0] == "Messages: 15 in 4 conversations"  # conv1 and conv2 are in both
+    assert lines[-2:] == [
+        "  4  Long chat (conv: conv3; 2024-01-31 to 2024-03-01)",
+        "  3  Copy (conv: conv9; 2024-01-31 to 2024-03-01)",
+    ]
+
+
+def test_federated_redump_counts_conversation_once(stats_db, tmp_path, monkeypatch):
+    import shutil
+
+    older = tmp_path / "older.db"
+    shutil.copy(stats_db, older)
+    with sqlite3.connect(older) as conn:
+        conn.execute("DELETE FROM messages WHERE id IN ('l3', 'l4')")
+        conn.execute("UPDATE messages SET create_time = 1704067200.0 WHERE id = 'l1'")  # 2024-01-01
+    monkeypatch.setenv("CONVERSATION_DB", os.pathsep.join([str(older), stats_db]))
+    lines = stats.conversation_stats(top=3).splitlines()
+    assert lines[0] == "Messages: 14 in 3 conversations"
+    top = lines[lines.index("Top conversations:") + 1 :]
+    assert top[0] == "  4  Long chat (conv: conv3; 2024-01-01 to 2024-03-01)"
+    assert len(top) == len({line.split("(conv: ")[1] for line in top}) == 3
@@ -0,0 +1,65 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+"""Tests for origin_conversation_mcp.warmup."""
+import logging
+import subprocess
+import sys
+
+import pytest
+
+from origin_conversation_mcp import index, metrics, pool, warmup
+
+
+@pytest.fixture(autouse=True)
+def _index_env(monkeypatch):
+    monkeypatch.delenv("CONVERSATION_INDEX", raising=False)
+    monkeypatch.delenv("CONVERSATION_INDEX_DIR", raising=False)
+    monkeypatch.delenv("CONVERSATION_IN_MEMORY", raising=False)
+
+
+def test_warms_index_and_connection(temp_db, monkeypatch):
+    monkeypatch.setenv("CONVERSATION_DB", temp_db)
+    assert warmup.status()["started"] is False
+    warmup.start()
+    assert warmup.wait(10)
+    state = warmup.status()
+    assert state["ready"] is True and state["error"] is None
+    assert set(state["stages"]) == {"resolve_db", "index", "connect", "prefetch", "warm_total"}
+    assert index.ensure_sidecar(temp_db) is not None
+    with pool.connection(temp_db) as conn:
+        assert conn.index_path == index.sidecar_path(temp_db)  # the warmed connection, reused
+    assert metrics.STARTUP_SECONDS.labels("warm_total").snapshot()[2] == 1
+
+
+def test_start_is_once_per_process(temp_db, monkeypatch):
+    monkeypatch.setenv("CONVERSATION_DB", temp_db)
+    assert warmup.start() is warmup.start()
+    warmup.wait(10)
+
+
+def test_missing_db_is_reported_not_ready(tmp_path, monkeypatch):
+    monkeypatch.setenv("CONVERSATION_DB", str(tmp_path / "missing.db"))
+    monkeypatch.setattr("origin_conversation_mcp.search._db_dir", lambda _: tmp_path / "db")
+    warmup.start()
+    assert warmup.wait(10)
+    state = warmup.status()
+    assert state["finished"] is True and state["ready"] is False
+    assert state["error"]
+
+
+def test_loads_snapshot_when_in_memory(temp_db, monkeypatch, caplog):
+    pytest.importorskip("numpy")
+    from origin_conversation_mcp import snapshot
+
+    monkeypatch.setenv("CONVERSATION_DB", temp_db)
+    monkeypatch.setenv("CONVERSATION_IN_MEMORY", "1")
+    caplog.set_level(logging.INFO, logger="origin_conversation_mcp.warmup")
+    warmup.start(in_memory=True)
+    assert warmup.wait(10) and warmup.is_ready()
+    assert snapshot.is_loaded(temp_db)
+    assert "in-memory snapshot" in caplog.text
+
+
+def test_server_imports_without_numpy():
+    code = "import sys, origin_conversation_mcp.server; print('numpy' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "False"
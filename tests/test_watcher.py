@@ -0,0 +1,124 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+"""Tests for origin_conversation_mcp.watcher."""
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+
+import pytest
+
+from origin_conversation_mcp import index, watcher
+
+
+@pytest.fixture
+def db_dir(tmp_path, temp_db, monkeypatch):
+    monkeypatch.setenv("CONVERSATION_DB_POLL_SECONDS", "0")
+    d = tmp_path / "db"
+    d.mkdir()
+    first = d / "export-2024.db"
+    shutil.copy(temp_db, first)
+    os.utime(first, (time.time() - 100, time.time() - 100))
+    return d
+
+
+def _add_export(db_dir: Path, temp_db: str, name: str) -> Path:
+    path = db_dir / name
+    shutil.copy(temp_db, path)
+    return path
+
+
+class TestResolve:
+    """Tests for resolve."""
+
+    def test_resolved_once(self, db_dir, monkeypatch):
+        assert watcher.resolve(db_dir) == str(db_dir / "export-2024.db")
+        calls = []
+        monkeypatch.setattr(watcher, "newest_db", lambda d: calls.append(d))
+        assert watcher.resolve(db_dir) == str(db_dir / "export-2024.db")
+        assert calls == []
+
+    def test_new_file_not_picked_up_without_watcher(self, db_dir, temp_db):
+        watcher.resolve(db_dir)
+        _add_export(db_dir, temp_db, "export-2025.db")
+        assert watcher.resolve(db_dir) == str(db_dir / "export-2024.db")
+
+    def test_errors_not_cached(self, tmp_path):
+        d = tmp_path / "db"
+        with pytest.raises(FileNotFoundError, match="db/ directory not found"):
+            watcher.resolve(d)
+        d.mkdir()
+        with pytest.raises(FileNotFoundError, match=r"No \*.db file"):
+            watcher.resolve(d)
+
+
+class TestCheckOnce:
+    """Tests for DbWatcher.check_once."""
+
+    def test_swaps_after_stable_and_warm(self, db_dir, temp_db, caplog):
+        watcher.resolve(db_dir)
+        w = watcher._watchers[db_dir]
+        new = _add_export(db_dir, temp_db, "export-2025.db")
+        assert w.check_once() is False  # first sighting: wait for a stable size/mtime
+        assert w.current == str(db_dir / "export-2024.db")
+        caplog.set_level(logging.WARNING, logger=watcher.logger.name)
+        assert w.check_once() is True
+        assert watcher.resolve(db_dir) == str(new)
+        assert os.path.isfile(index.sidecar_path(str(new)))
+        assert any("Switched conversation DB" in r.message for r in caplog.records)
+
+    def test_file_still_growing_not_adopted(self, db_dir, temp_db):
+        watcher.resolve(db_dir)
+        w = watcher._watchers[db_dir]
+        new = _add_export(db_dir, temp_db, "export-2025.db")
+        assert w.check_once() is False
+        with open(new, "ab") as f:
+            f.write(b"\0" * 16)
+        assert w.check_once() is False
+        assert w.current == str(db_dir / "export-2024.db")
+
+    def test_warm_runs_before_swap(self, db_dir, temp_db, monkeypatch):
+        watcher.resolve(db_dir)
+        w = watcher._watchers[db_dir]
+        seen = []
+        monkeypatch.setattr(watcher, "warm", lambda path: seen.append((path, w.current)))
+        new = _add_export(db_dir, temp_db, "export-2025.db")
+        w.check_once()
+        w.check_once()
+        assert seen == [(str(new), str(db_dir / "export-2024.db"))]
+        assert w.current == str(new)
+
+
+def test_background_watcher_picks_up_new_export(db_dir, temp_db, monkeypatch):
+    monkeypatch.setenv("CONVERSATION_DB_POLL_SECONDS", "0.01")
+    watcher.resolve(db_dir)
+    new = _add_export(db_dir, temp_db, "export-2025.db")
+    deadline = time.monotonic() + 5
+    while watcher.resolve(db_dir) != str(new) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert watcher.resolve(db_dir) == str(new)
+
+
+class TestShards:
+    """resolve_all and shard tracking for federated search."""
+
+    def test_resolve_all_tracks_added_and_removed_exports(self, db_dir, temp_db):
+        assert watcher.resolve_all(db_dir) == [str(db_dir / "export-2024.db")]
+        w = watcher._watchers[db_dir]
+        new = _add_export(db_dir, temp_db, "export-2025.db")
+        w.check_once()
+        assert watcher.resolve_all(db_dir) == [str(db_dir / "export-2024.db")]  # not yet stable
+        w.check_once()
+        assert watcher.resolve_all(db_dir) == [str(new), str(db_dir / "export-2024.db")]
+        assert os.path.isfile(index.sidecar_path(str(new)))
+        os.remove(db_dir / "export-2024.db")
+        w.check_once()
+        assert watcher.resolve_all(db_dir) == [str(new)]
+
+    def test_shards_not_tracked_without_resolve_all(self, db_dir, temp_db):
+        watcher.resolve(db_dir)
+        w = watcher._watchers[db_dir]
+        _add_export(db_dir, temp_db, "export-2025.db")
+        w.check_once()
+        w.check_once()
+        assert w.shards is None